@@ -1,9 +1,12 @@
-from db import get_db
+from db import get_async_db
 from models import User
 from typing import Optional
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.hashing import password_hasher, pwd_context
+from auth.principal_cache import Principal, principal_cache
+from services.user_search import user_index
 from datetime import datetime, timedelta
 from schemas import TokenResponse, UserCreate, UserResponse
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -16,8 +19,6 @@ SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
@@ -46,7 +47,21 @@ def decode_token(token: str):
         return None
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def load_principal(email: str, db: AsyncSession) -> Optional[Principal]:
+    """Token egasini keshdan, bo'lmasa bazadan olish"""
+    principal = principal_cache.get(email)
+    if principal is not None:
+        return principal
+    result = await db.execute(select(User).where(User.email == email))
+    user = result.scalars().first()
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    principal_cache.put(email, principal)
+    return principal
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid token or expired token",
@@ -60,14 +75,14 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == email).first()
+    user = await load_principal(email, db)
     if user is None:
         raise credentials_exception
     
     return user
 
 
-async def get_current_user_ws(token: str, db: Session):
+async def get_current_user_ws(token: str, db: AsyncSession):
     """WebSocket ulanishlari uchun foydalanuvchini autentifikatsiya qilish"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -80,22 +95,23 @@ async def get_current_user_ws(token: str, db: Session):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == email).first()
+    user = await load_principal(email, db)
     if user is None:
         raise credentials_exception
     return user
 
 
 @router.post("/register", response_model=UserResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.email == user_data.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     user = User(
         name=user_data.name,
         email=user_data.email,
@@ -103,18 +119,29 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    user_index.add(user.id, user.name, user.email)
 
     return user
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.email == form_data.username))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+
+    verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
+    if new_hash:
+        # bcrypt narxi o'zgargan, parolni yangi sozlama bilan saqlaymiz
+        user.hashed_password = new_hash
+        await db.commit()
+
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# bcrypt narxi o'zgarsa, eski xeshlar keyingi loginda qayta xeshlanadi
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# "thread" yoki "process" (ko'p yadroli xeshlash uchun)
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Navbatda kutishi mumkin bo'lgan eng ko'p so'rovlar, undan keyin 503 qaytariladi
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def _hash(password: str) -> Tuple[float, str]:
+    return time.monotonic(), pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[float, Tuple[bool, Optional[str]]]:
+    return time.monotonic(), pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """bcrypt ishlarini alohida, chegaralangan pulda bajaruvchi.
+
+    Starlette'ning umumiy threadpool'ini band qilmaydi; navbat to'lib
+    ketsa so'rov darhol 503 bilan rad etiladi. Navbatda kutish vaqti
+    hisoblagichlarda yig'iladi.
+    """
+
+    def __init__(
+        self,
+        kind: str = PASSWORD_HASH_EXECUTOR,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Noma'lum executor turi: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor: Optional[Executor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_time_total = 0.0
+        self.queue_time_max = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="password-hash"
+                )
+        return self.executor
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server band, birozdan keyin qayta urinib ko'ring",
+                headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        submitted_at = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            started_at, result = await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+        queue_time = max(0.0, started_at - submitted_at)
+        self.completed += 1
+        self.queue_time_total += queue_time
+        self.queue_time_max = max(self.queue_time_max, queue_time)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Parolni tekshirish; xesh eskirgan bo'lsa yangi xeshni ham qaytaradi"""
+        return await self._run(_verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_time_avg": self.queue_time_total / self.completed if self.completed else 0.0,
+            "queue_time_max": self.queue_time_max,
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+password_hasher = PasswordHasher()
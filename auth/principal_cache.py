@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+# Boshqa workerlardagi o'zgarishlar ham ko'pi bilan TTL ichida ko'rinadi
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
+
+class Principal:
+    """Autentifikatsiyadan o'tgan foydalanuvchining yengil nusxasi"""
+
+    __slots__ = ("id", "name", "email")
+
+    def __init__(self, id: int, name: str, email: str):
+        self.id = id
+        self.name = name
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, name=user.name, email=user.email)
+
+
+class PrincipalCache:
+    """Token subyekti (email) bo'yicha chegaralangan TTL/LRU kesh"""
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, Principal]]" = OrderedDict()
+        self.subjects: Dict[int, str] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(subject)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._remove(subject)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(subject)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, subject: str, principal: Principal):
+        with self.lock:
+            self.entries[subject] = (time.monotonic() + self.ttl, principal)
+            self.entries.move_to_end(subject)
+            self.subjects[principal.id] = subject
+            while len(self.entries) > self.maxsize:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+
+    def invalidate(self, subject: str):
+        with self.lock:
+            self._remove(subject)
+
+    def invalidate_user(self, user_id: int):
+        """Foydalanuvchi o'zgarganda yoki o'chirilganda chaqiriladi"""
+        with self.lock:
+            subject = self.subjects.get(user_id)
+            if subject is not None:
+                self._remove(subject)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.subjects.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, subject: str):
+        entry = self.entries.pop(subject, None)
+        if entry is not None and self.subjects.get(entry[1].id) == subject:
+            del self.subjects[entry[1].id]
+
+
+principal_cache = PrincipalCache()
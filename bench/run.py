@@ -0,0 +1,459 @@
+"""Chat serveri uchun yuklama va kechikish benchmarki.
+
+Repo ildizidan ishga tushiriladi:
+
+    python -m bench.run --users 200 --conversations 100 --group-sizes 2,5,20 \\
+        --rate 200 --duration 30 --output bench.json
+
+`--url` berilmasa `main:app` vaqtinchalik SQLite bazasi bilan alohida
+uvicorn jarayonida ko'tariladi (Postgres uchun `--database-url`);
+`--workers` 1 dan ko'p bo'lsa va CHAT_BACKPLANE berilmagan bo'lsa,
+workerlar vaqtinchalik katalogdagi unix backplane orqali bog'lanadi. Skript
+foydalanuvchilarni /auth/register orqali ro'yxatdan o'tkazadi, berilgan
+o'lchamdagi suhbatlar yaratadi, har bir ishtirokchi uchun
+/ws/chat/{id} ulanishini ochadi va belgilangan tezlikda xabar yuboradi
+(open-loop: jo'natish jadvali server javobini kutmaydi). So'ng tarix,
+inbox va qidiruv endpointlari o'lchanadi. Natija - taqqoslash uchun
+JSON (p50/p95/p99 millisekundlarda).
+
+Minglab ulanish uchun `ulimit -n` yetarli bo'lishi kerak. Kerakli
+paketlar: httpx va websockets.
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Yuklangan serverda benchmark cheklovchini emas, serverni o'lchashi uchun
+SERVER_ENV = {
+    "BCRYPT_ROUNDS": "4",
+    "RATE_LIMIT_MESSAGES_PER_SECOND": "1000000",
+    "RATE_LIMIT_MESSAGES_BURST": "1000000",
+    "RATE_LIMIT_FRAMES_PER_SECOND": "1000000",
+    "RATE_LIMIT_FRAMES_BURST": "1000000",
+}
+
+CONTENT_PREFIX = "bench:"
+
+
+def summarize(samples: List[float]) -> dict:
+    """Namunalar bo'yicha p50/p95/p99 (nearest-rank), o'rtacha va maksimum"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return round(ordered[index], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def boot_server(args) -> subprocess.Popen:
+    """main:app ni vaqtinchalik baza bilan alohida jarayonda ishga tushirish"""
+    workdir = tempfile.mkdtemp(prefix="chat-bench-")
+    env = {
+        **os.environ,
+        **SERVER_ENV,
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir}/bench.db",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+    }
+    if args.workers > 1 and env.get("CHAT_BACKPLANE", "local") == "local":
+        # "local" backplane bilan xabar faqat o'z workeridagi ulanishlarga yetadi
+        env["CHAT_BACKPLANE"] = f"unix://{workdir}/backplane"
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1",
+            "--port", str(args.port),
+            "--workers", str(args.workers),
+            "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env
+    )
+    deadline = time.monotonic() + args.boot_timeout
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server ishga tushmadi (kod {process.returncode})")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return process
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Server belgilangan vaqtda javob bermadi")
+
+
+class Recorder:
+    """Kechikish namunalari va xatolar hisoblagichi"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+
+    def sample(self, name: str, milliseconds: float):
+        self.samples.setdefault(name, []).append(milliseconds)
+
+    def error(self, name: str):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+async def _timed(recorder: Recorder, name: str, request) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError:
+        recorder.error(name)
+        return None
+    recorder.sample(name, (time.perf_counter() - started) * 1000)
+    if response.status_code >= 400:
+        recorder.error(f"{name}_{response.status_code}")
+    return response
+
+
+async def register_users(client: httpx.AsyncClient, recorder: Recorder, count: int, concurrency: int) -> List[dict]:
+    """Sintetik foydalanuvchilarni ro'yxatdan o'tkazish va tokenlarini olish"""
+    run_id = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def register(index: int) -> Optional[dict]:
+        email = f"bench{run_id}_{index}@example.com"
+        async with semaphore:
+            response = await _timed(recorder, "register", client.post(
+                "/auth/register",
+                json={"name": f"bench{index}", "email": email, "password": "bench"}
+            ))
+            if response is None or response.status_code != 200:
+                return None
+            user = response.json()
+            response = await _timed(recorder, "login", client.post(
+                "/auth/login",
+                data={"username": email, "password": "bench"}
+            ))
+            if response is None or response.status_code != 200:
+                return None
+            user["token"] = response.json()["access_token"]
+            return user
+
+    users = await asyncio.gather(*(register(index) for index in range(count)))
+    return [user for user in users if user is not None]
+
+
+async def create_conversations(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    users: List[dict],
+    count: int,
+    sizes: List[int],
+    rng: random.Random,
+    concurrency: int
+) -> List[dict]:
+    """O'lchamlari `sizes` bo'yicha navbatlanadigan suhbatlar yaratish"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(index: int) -> Optional[dict]:
+        members = rng.sample(users, min(sizes[index % len(sizes)], len(users)))
+        async with semaphore:
+            response = await _timed(recorder, "create_conversation", client.post(
+                "/api/chat/conversations",
+                json={
+                    "name": f"bench {index}",
+                    "is_group": len(members) > 2,
+                    "participant_ids": [member["id"] for member in members[1:]],
+                },
+                headers={"Authorization": f"Bearer {members[0]['token']}"}
+            ))
+        if response is None or response.status_code != 201:
+            return None
+        return {"id": response.json()["id"], "members": members}
+
+    conversations = await asyncio.gather(*(create(index) for index in range(count)))
+    return [conversation for conversation in conversations if conversation is not None]
+
+
+class BenchSocket:
+    """Bitta /ws/chat/{id} ulanishi: kelgan xabarlardan kechikishni o'lchaydi"""
+
+    def __init__(self, conversation_id: int, user: dict, recorder: Recorder):
+        self.conversation_id = conversation_id
+        self.user = user
+        self.recorder = recorder
+        self.connection = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def open(self, ws_url: str):
+        started = time.perf_counter()
+        self.connection = await websockets.connect(
+            f"{ws_url}/ws/chat/{self.conversation_id}?token={self.user['token']}",
+            max_size=None
+        )
+        self.recorder.sample("connect", (time.perf_counter() - started) * 1000)
+        self.task = asyncio.get_running_loop().create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for data in self.connection:
+                frame = json.loads(data)
+                frame_type = frame.get("type")
+                self.recorder.count(f"frames_{frame_type}")
+                content = frame.get("content")
+                if not isinstance(content, str) or not content.startswith(CONTENT_PREFIX):
+                    continue
+                latency = (time.perf_counter() - float(content[len(CONTENT_PREFIX):])) * 1000
+                if frame_type == "message":
+                    self.recorder.sample("fanout", latency)
+                elif frame_type == "message_sent":
+                    self.recorder.sample("ack", latency)
+        except websockets.ConnectionClosed:
+            self.recorder.count("closed")
+
+    async def send(self):
+        await self.connection.send(json.dumps({"content": f"{CONTENT_PREFIX}{time.perf_counter()}"}))
+
+    async def close(self):
+        if self.connection is not None:
+            await self.connection.close()
+        if self.task is not None:
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+async def open_sockets(
+    ws_url: str,
+    recorder: Recorder,
+    conversations: List[dict],
+    limit: Optional[int],
+    concurrency: int
+) -> List[BenchSocket]:
+    sockets = [
+        BenchSocket(conversation["id"], member, recorder)
+        for conversation in conversations
+        for member in conversation["members"]
+    ][:limit]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def open_one(bench_socket: BenchSocket) -> Optional[BenchSocket]:
+        async with semaphore:
+            try:
+                await bench_socket.open(ws_url)
+            except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+                recorder.error("connect")
+                return None
+        return bench_socket
+
+    opened = await asyncio.gather(*(open_one(bench_socket) for bench_socket in sockets))
+    return [bench_socket for bench_socket in opened if bench_socket is not None]
+
+
+async def drive_traffic(
+    sockets: List[BenchSocket],
+    recorder: Recorder,
+    rate: float,
+    duration: float,
+    rng: random.Random
+) -> dict:
+    """Tasodifiy ulanishlardan `rate` xabar/sekund tezlikda yuborish.
+
+    Jadval oldindan belgilangan (open-loop): server sekinlashsa yuborish
+    to'xtab qolmaydi, orqada qolish `schedule_lag` da ko'rinadi.
+    """
+    # Har bir xabar yuboruvchidan boshqa ishtirokchilarning ulanishlariga yetib borishi kerak
+    audience: Dict[int, int] = {}
+    for bench_socket in sockets:
+        audience[bench_socket.conversation_id] = audience.get(bench_socket.conversation_id, 0) + 1
+
+    interval = 1 / rate
+    started = time.perf_counter()
+    next_at = started
+    sent = 0
+    expected = 0
+    while True:
+        now = time.perf_counter()
+        if now - started >= duration:
+            break
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+        else:
+            recorder.sample("schedule_lag", (now - next_at) * 1000)
+        next_at += interval
+        bench_socket = rng.choice(sockets)
+        try:
+            await bench_socket.send()
+        except websockets.ConnectionClosed:
+            recorder.error("send")
+            continue
+        sent += 1
+        expected += audience[bench_socket.conversation_id] - 1
+    return {"sent": sent, "expected_deliveries": expected, "elapsed": time.perf_counter() - started}
+
+
+async def measure_rest(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    conversations: List[dict],
+    samples: int,
+    concurrency: int,
+    rng: random.Random
+):
+    """Tarix, inbox va qidiruv endpointlari kechikishi"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(name: str, path: str, params: dict, token: str):
+        async with semaphore:
+            await _timed(recorder, name, client.get(
+                path,
+                params=params,
+                headers={"Authorization": f"Bearer {token}"}
+            ))
+
+    requests = []
+    for _ in range(samples):
+        conversation = rng.choice(conversations)
+        token = rng.choice(conversation["members"])["token"]
+        requests.append(one("history", f"/api/chat/conversations/{conversation['id']}/messages", {}, token))
+        requests.append(one("inbox", "/api/chat/inbox", {}, token))
+        requests.append(one("search", "/api/chat/search", {"q": "bench"}, token))
+    rng.shuffle(requests)
+    await asyncio.gather(*requests)
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    sizes = [int(size) for size in args.group_sizes.split(",")]
+    server = None
+    if args.url is None:
+        args.url = f"http://127.0.0.1:{args.port or _free_port()}"
+        args.port = int(args.url.rsplit(":", 1)[1])
+        server = await boot_server(args)
+    ws_url = "ws" + args.url[len("http"):]
+
+    sockets: List[BenchSocket] = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            setup_started = time.perf_counter()
+            users = await register_users(client, recorder, args.users, args.concurrency)
+            if not users:
+                raise RuntimeError("Birorta ham foydalanuvchi ro'yxatdan o'tmadi")
+            conversations = await create_conversations(
+                client, recorder, users, args.conversations, sizes, rng, args.concurrency
+            )
+            if not conversations:
+                raise RuntimeError("Birorta ham suhbat yaratilmadi")
+            sockets = await open_sockets(ws_url, recorder, conversations, args.max_sockets, args.concurrency)
+            if not sockets:
+                raise RuntimeError("Birorta ham WebSocket ulanishi ochilmadi")
+            setup_seconds = time.perf_counter() - setup_started
+
+            # Ulanishdagi presence freymlari o'lchovga aralashmasin
+            await asyncio.sleep(args.warmup)
+            traffic = await drive_traffic(sockets, recorder, args.rate, args.duration, rng)
+            await asyncio.sleep(args.drain)
+            delivered = len(recorder.samples.get("fanout", []))
+            acked = len(recorder.samples.get("ack", []))
+
+            await measure_rest(client, recorder, conversations, args.rest_samples, args.concurrency, rng)
+    finally:
+        await asyncio.gather(*(bench_socket.close() for bench_socket in sockets), return_exceptions=True)
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    elapsed = traffic["elapsed"]
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {
+            key: value for key, value in vars(args).items()
+            if key not in ("output",)
+        },
+        "setup": {
+            "users": len(users),
+            "conversations": len(conversations),
+            "sockets": len(sockets),
+            "seconds": round(setup_seconds, 3),
+        },
+        "throughput": {
+            "sent": traffic["sent"],
+            "acked": acked,
+            "delivered": delivered,
+            "expected_deliveries": traffic["expected_deliveries"],
+            "delivery_ratio": round(delivered / traffic["expected_deliveries"], 4) if traffic["expected_deliveries"] else None,
+            "messages_per_second": round(traffic["sent"] / elapsed, 2),
+            "deliveries_per_second": round(delivered / elapsed, 2),
+        },
+        "latency_ms": {name: summarize(samples) for name, samples in sorted(recorder.samples.items())},
+        "frames": dict(sorted(recorder.counters.items())),
+        "errors": dict(sorted(recorder.errors.items())),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Chat serveri benchmarki")
+    parser.add_argument("--url", help="Ishlab turgan server manzili; berilmasa main:app ishga tushiriladi")
+    parser.add_argument("--database-url", help="Ishga tushiriladigan server bazasi (standart: vaqtinchalik SQLite)")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--boot-timeout", type=float, default=30)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--group-sizes", default="2,5,20", help="Suhbat o'lchamlari, vergul bilan; navbatma-navbat ishlatiladi")
+    parser.add_argument("--max-sockets", type=int, help="Ochiladigan WebSocket ulanishlari chegarasi")
+    parser.add_argument("--rate", type=float, default=100, help="Sekundiga yuboriladigan xabarlar")
+    parser.add_argument("--duration", type=float, default=20, help="Xabar yuborish davomiyligi, sekund")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--drain", type=float, default=3, help="Yuborish tugagach yetkazilishni kutish, sekund")
+    parser.add_argument("--rest-samples", type=int, default=200, help="Har bir REST endpoint uchun so'rovlar soni")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Natijani JSON faylga yozish")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    data = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(data + "\n")
+    print(data)
+
+
+if __name__ == "__main__":
+    main()
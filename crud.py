@@ -1,6 +1,8 @@
 from sqlalchemy.orm import Session
 from schemas import UserCreate, RoleCreate
 from models import User, Role, UserRole, Message
+from auth.principal_cache import principal_cache
+from services.user_search import user_index
 
 
 def create_user(db: Session, user:UserCreate):
@@ -29,6 +31,8 @@ def update_user(db: Session, user_id: int, user_update: UserCreate):
         
         db.commit()
         db.refresh(user) 
+        principal_cache.invalidate_user(user_id)
+        user_index.add(user.id, user.name, user.email)
         return user
     return None
 
@@ -38,6 +42,8 @@ def delete_user(db: Session, user_id: int):
     if user:
         db.delete(user)
         db.commit()
+        principal_cache.invalidate_user(user_id)
+        user_index.remove(user_id)
         return True
     return False
 
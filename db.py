@@ -1,15 +1,87 @@
+import os
+import time
 from typing import Text
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, String,create_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from services import query_profiler
+from services.metrics import DB_POOL_WAIT, instrument_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-DATABASE_URL = "postgresql+psycopg2://postgres:0@localhost:5432/chat"
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://postgres:0@localhost:5432/chat")
 
-engine = create_engine(DATABASE_URL)
+
+def _async_url(url: str) -> str:
+    """Sinxron drayver manzilini asinxron drayverga o'girish"""
+    if url.startswith("postgresql"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+# Ulanishlar puli sozlamalari (har bir worker uchun)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+class _TimedCheckout:
+    """Puldan ulanish olishni (bo'sh ulanish kutishni ham) o'lchaydi"""
+
+    metrics_label = ("sync",)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started, self.metrics_label)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    metrics_label = ("async",)
+
+
+def _engine_options(url: str, poolclass=QueuePool) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite (testlar va lokal ishga tushirish) uchun pul sozlamalari kerak emas
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL, TimedQueuePool))
+instrument_engine(engine, "sync")
+query_profiler.instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool))
+instrument_engine(async_engine.sync_engine, "async")
+query_profiler.instrument_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -17,9 +89,13 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 Base = declarative_base()
 
 
 def create_tables():
     Base.metadata.create_all(bind=engine)
-
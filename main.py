@@ -1,11 +1,21 @@
 from db import create_tables
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from auth.auth import router as auth
 from default_router import api_router
 from routers.chat import router as chat
 from routers.files import router as files
 from routers.websocket import router as websocket
+from services.message_writer import message_writer
+from auth.hashing import password_hasher
+from services.media import media_pipeline
+from routers.websocket import manager, presence
+from auth.principal_cache import principal_cache
+from services import metrics
+from services.membership import membership_cache
+from services.message_cache import message_cache
+from services.rate_limit import frame_limiter, message_limiter, upload_limiter
+from services.query_profiler import QUERY_PROFILE, QueryProfilerMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -22,14 +32,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Before-Cursor", "X-After-Cursor", "X-Has-More", "X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
+# Marshrut bo'yicha so'rovlar soni va davomiyligi (/metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Debug: har bir so'rovdagi SQL soni, vaqti va takrorlari X-Query-* sarlavhalarida
+if QUERY_PROFILE:
+    app.add_middleware(QueryProfilerMiddleware)
+
+# Mavjud stats() hisoblagichlari /metrics so'ralganda o'qiladi
+metrics.register_stats("chat_websocket", "WebSocket ulanishlari va chiquvchi navbatlar", manager.stats)
+metrics.register_stats("chat_presence", "Presence holati", lambda: {
+    "online_users": len(presence.online),
+    "local_users": len(presence.local_connections),
+})
+metrics.register_stats("chat_message_cache", "Xabarlar keshi", message_cache.stats)
+metrics.register_stats("chat_membership_cache", "A'zolik keshi", membership_cache.stats)
+metrics.register_stats("chat_principal_cache", "Foydalanuvchi keshi", principal_cache.stats)
+metrics.register_stats("chat_password_hasher", "Parol xeshlash puli", password_hasher.stats)
+metrics.register_stats("chat_media_pipeline", "Media fon ishlari", media_pipeline.stats)
+metrics.register_stats("chat_rate_limit_messages", "Xabarlar cheklovchisi", message_limiter.stats)
+metrics.register_stats("chat_rate_limit_frames", "WebSocket freymlari cheklovchisi", frame_limiter.stats)
+metrics.register_stats("chat_rate_limit_uploads", "Yuklashlar cheklovchisi", upload_limiter.stats)
+
 create_tables()
 
+@app.on_event("startup")
+async def startup():
+    # Kesh bekor qilish xabarlari birinchi WebSocket ulanishidan oldin ham kelishi kerak
+    await manager.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Navbatda qolgan xabarlarni bazaga yozib qo'yish
+    await message_writer.close()
+    password_hasher.shutdown()
+    media_pipeline.shutdown()
+    await presence.close()
+
 @app.get("/", tags=["Root"])
 async def root():
     return {"message": "Chat API ishga tushdi. /docs manziliga o'ting"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus matn formatidagi metrikalar (shu worker jarayoni uchun)"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 app.include_router(auth, prefix="/auth", tags=["Auth"])
 app.include_router(websocket)
 app.include_router(chat, prefix="/api", tags=["Chat"])
@@ -1,7 +1,7 @@
 from db import Base
 from datetime import datetime
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Boolean, Index, JSON, DDL, event, text
 
 
 class BaseModel(Base):
@@ -19,6 +19,22 @@ class User(BaseModel):
     
  
     roles = relationship("UserRole", back_populates="user")
+    
+    __table_args__ = (
+        # Foydalanuvchi qidiruvi uchun trigram indekslar (faqat Postgres); emaildan faqat mahalliy qism
+        Index("ix_users_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}).ddl_if(dialect="postgresql"),
+        Index("ix_users_email_local_trgm", text("split_part(email, '@', 1) gin_trgm_ops"), postgresql_using="gin").ddl_if(dialect="postgresql"),
+        # Trigram ishlamaydigan qisqa prefikslar (lower(...) LIKE 'q%') uchun
+        Index("ix_users_name_lower_prefix", text("lower(name) text_pattern_ops")).ddl_if(dialect="postgresql"),
+        Index("ix_users_email_lower_prefix", text("lower(email) text_pattern_ops")).ddl_if(dialect="postgresql"),
+    )
+
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
 
 
 class Role(BaseModel):
@@ -60,19 +76,36 @@ class Conversation(BaseModel):
     name = Column(String, nullable=True)
     is_group = Column(Boolean, default=False)
     created_by = Column(Integer, ForeignKey('users.id'))
+    # Inbox uchun denormalizatsiya: xabar yozuvchi bosqichda yangilanadi
+    last_message_id = Column(Integer, nullable=True)
+    last_activity_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Suhbatdagi oxirgi xabarning tartib raqami (Message.seq)
+    last_seq = Column(Integer, default=0, nullable=False)
     
     creator = relationship("User", foreign_keys=[created_by])
     messages = relationship("Message", back_populates="conversation")
     participants = relationship("ConversationParticipant", back_populates="conversation")
+    
+    __table_args__ = (
+        Index("ix_conversations_activity", "last_activity_at", "id"),
+    )
 
 class ConversationParticipant(BaseModel):
     __tablename__ = "conversation_participants"
     
     conversation_id = Column(Integer, ForeignKey('conversations.id'))
     user_id = Column(Integer, ForeignKey('users.id'))
+    # Ishtirokchi o'qigan oxirgi xabar va undan keyingi boshqalar xabarlari soni
+    last_read_message_id = Column(Integer, default=0, nullable=False)
+    unread_count = Column(Integer, default=0, nullable=False)
     
     conversation = relationship("Conversation", back_populates="participants")
     user = relationship("User")
+    
+    __table_args__ = (
+        Index("ix_conversation_participants_conversation_user", "conversation_id", "user_id"),
+        Index("ix_conversation_participants_user", "user_id"),
+    )
 
 class Message(BaseModel):
     __tablename__ = "messages"
@@ -85,9 +118,57 @@ class Message(BaseModel):
     file_url = Column(String, nullable=True)
     file_name = Column(String, nullable=True)
     file_type = Column(String, nullable=True)
+    # Suhbat ichidagi oraliqsiz tartib raqami: 1, 2, 3, ... (xabar yozuvchi bosqich beradi)
+    seq = Column(Integer, nullable=True)
+    # Bazada saqlanmaydi: javob berishdan oldin attach_media() to'ldiradi
+    media = None
     
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("User")
     
+    __table_args__ = (
+        # Xabarlar tarixini kursor bilan sahifalash uchun
+        Index("ix_messages_conversation_timestamp_id", "conversation_id", "timestamp", "id"),
+        # O'qilmaganlarni kursordan keyin sanash uchun
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+        # Sinxronlash va qayta ulanishda seq bo'yicha o'qish uchun
+        Index("ux_messages_conversation_seq", "conversation_id", "seq", unique=True),
+        # To'liq matnli qidiruv uchun (Postgres); SQLite'da quyidagi FTS5 jadvali ishlatiladi
+        Index("ix_messages_content_fts", text("to_tsvector('simple'::regconfig, content)"), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+
+
+# SQLite: messages jadvaliga bog'langan FTS5 indeksi, triggerlar orqali yangilanib boradi
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+):
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+event.listen(
+    Message.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS messages_fts").execute_if(dialect="sqlite")
+)
+    
+
+class StoredFile(BaseModel):
+    __tablename__ = "stored_files"
+    
+    # Fayl tarkibining SHA-256 xeshi; bir xil fayl diskda bir marta saqlanadi.
+    # Fayllar o'chirilmaydi, shuning uchun havolalar soni yuritilmaydi
+    sha256 = Column(String(64), unique=True, nullable=False, index=True)
+    filename = Column(String, unique=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String, nullable=True)
+    # Fon ishlari natijasi: o'lchamlar, davomiylik, thumbnail'lar va joy egallovchi
+    media_info = Column(JSON, nullable=True)
+    
 
 print("xamma modellar yaratildi")
\ No newline at end of file
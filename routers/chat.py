@@ -1,23 +1,52 @@
-from db import get_db
-from typing import List
-from sqlalchemy.orm import Session
+from db import get_async_db
+from typing import List, Literal, Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth.auth import get_current_user
-from fastapi import APIRouter, Depends, HTTPException, status
+from services.message_writer import message_writer
+from services import user_search
+from services import message_search
+from services.inbox import get_inbox
+from services.media import attach_media
+from services.read_state import mark_read
+from services.rate_limit import message_limiter
+from services.sync import SYNC_MESSAGE_LIMIT, decode_sync_cursor, get_sync
+from services.membership import membership_cache
+from services.message_cache import CachedMessage, message_cache
+from routers.websocket import manager, presence
+from services.pagination import decode_message_cursor, decode_offset_cursor, encode_cursor
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from models import User, Conversation, ConversationParticipant, Message
-from schemas import ConversationCreate, ConversationResponse, MessageCreate, MessageResponse, UserResponse
+from schemas import ConversationCreate, ConversationResponse, InboxEntry, MarkRead, MessageCreate, MessageResponse, MessageSearchResult, PresenceState, ReadState, SyncResponse, UserResponse
 
 router = APIRouter(
     prefix="/chat",
     tags=["Chat"]
 )
 
+# Xabarlar tarixi sahifasi hajmi
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_MAX = 200
+
+USER_SEARCH_PAGE_SIZE = 20
+USER_SEARCH_PAGE_MAX = 50
+
+MESSAGE_SEARCH_PAGE_SIZE = 20
+MESSAGE_SEARCH_PAGE_MAX = 100
+
+INBOX_PAGE_SIZE = 30
+INBOX_PAGE_MAX = 100
+
+# Bitta so'rovda holati so'raladigan foydalanuvchilar soni
+PRESENCE_QUERY_MAX = 200
+
 
 # Suhbatlar uchun endpointlar
 @router.post("/conversations", response_model=ConversationResponse, status_code=status.HTTP_201_CREATED)
-def create_conversation(
+async def create_conversation(
     conversation_data: ConversationCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Yangi suhbat yaratish"""
    
@@ -27,7 +56,7 @@ def create_conversation(
         created_by=current_user.id
     )
     db.add(new_conversation)
-    db.flush()
+    await db.flush()
     
     
     creator_participant = ConversationParticipant(
@@ -45,75 +74,120 @@ def create_conversation(
             )
             db.add(participant)
     
-    db.commit()
-    db.refresh(new_conversation)
+    await db.commit()
+    await membership_cache.add_participants(
+        new_conversation.id,
+        {current_user.id, *conversation_data.participant_ids}
+    )
+    await db.refresh(new_conversation)
     
     return new_conversation
 
 
 @router.get("/conversations", response_model=List[ConversationResponse])
-def get_conversations(
+async def get_conversations(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Foydalanuvchining barcha suhbatlarini olish"""
     
-    user_conversations = db.query(Conversation)\
-        .join(ConversationParticipant)\
-        .filter(ConversationParticipant.user_id == current_user.id)\
-        .all()
+    result = await db.execute(
+        select(
+            Conversation,
+            ConversationParticipant.last_read_message_id,
+            ConversationParticipant.unread_count
+        )
+        .join(ConversationParticipant)
+        .where(ConversationParticipant.user_id == current_user.id)
+    )
+    user_conversations = []
+    for conversation, last_read_message_id, unread_count in result.all():
+        # Hisoblagichlar ishtirokchi qatorida saqlanadi, xabarlar sanalmaydi
+        conversation.last_read_message_id = last_read_message_id
+        conversation.unread_count = unread_count
+        user_conversations.append(conversation)
     
     return user_conversations
 
 
+@router.get("/inbox", response_model=List[InboxEntry])
+async def get_user_inbox(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(INBOX_PAGE_SIZE, ge=1, le=INBOX_PAGE_MAX),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Suhbatlar ro'yxati: oxirgi xabar, o'qilmaganlar soni va ishtirokchilar bilan.
+
+    Suhbatlar oxirgi faollik bo'yicha saralanadi; keyingi sahifa kursori
+    X-Next-Cursor sarlavhasida qaytadi.
+    """
+    after = decode_message_cursor(cursor) if cursor else None
+    inbox = await get_inbox(db, current_user.id, after, limit + 1)
+    if len(inbox) > limit:
+        last = inbox[limit - 1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["last_activity_at"], last["id"])
+    response.headers["X-Has-More"] = "true" if len(inbox) > limit else "false"
+    
+    return inbox[:limit]
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync_changes(
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_MESSAGE_LIMIT, ge=1, le=SYNC_MESSAGE_LIMIT),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Oxirgi sinxronlashdan beri barcha suhbatlardagi o'zgarishlar.
+
+    `since` - oldingi javobdagi `cursor` (birinchi marta berilmaydi).
+    Javobda yangi yoki o'zgargan suhbatlar, ularning yangi xabarlari (seq
+    bo'yicha), foydalanuvchi chiqarilgan suhbatlar va keyingi kursor
+    qaytadi; `has_more` true bo'lsa so'rov shu kursor bilan takrorlanadi.
+    """
+    changes = await get_sync(db, current_user.id, decode_sync_cursor(since), limit)
+    await attach_media(db, changes["messages"])
+    
+    return changes
+
+
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
-def get_conversation(
+async def get_conversation(
     conversation_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Ma'lum bir suhbat ma'lumotlarini olish"""
    
-    conversation = db.query(Conversation)\
-        .join(ConversationParticipant)\
-        .filter(
-            Conversation.id == conversation_id,
-            ConversationParticipant.user_id == current_user.id
-        ).first()
-    
-    if not conversation:
+    if not await membership_cache.is_member(db, conversation_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Suhbat topilmadi yoki siz unga kirishga ruxsat yo'q"
         )
     
-    return conversation
+    return await db.get(Conversation, conversation_id)
 
 
 
 @router.post("/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
-def create_message(
+async def create_message(
     message_data: MessageCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Yangi xabar yuborish"""
+    await message_limiter.limit(current_user.id)
    
-    conversation = db.query(Conversation)\
-        .join(ConversationParticipant)\
-        .filter(
-            Conversation.id == message_data.conversation_id,
-            ConversationParticipant.user_id == current_user.id
-        ).first()
-    
-    if not conversation:
+    if not await membership_cache.is_member(db, message_data.conversation_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Suhbat topilmadi yoki siz unga kirishga ruxsat yo'q"
         )
     
 
-    new_message = Message(
+    new_message = await message_writer.submit(
         conversation_id=message_data.conversation_id,
         sender_id=current_user.id,
         content=message_data.content,
@@ -122,59 +196,202 @@ def create_message(
         file_name=message_data.file_name,
         file_type=message_data.file_type
     )
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
+    await attach_media(db, [new_message])
     
     return new_message
 
 
+@router.post("/conversations/{conversation_id}/read", response_model=ReadState)
+async def mark_conversation_read(
+    conversation_id: int,
+    read_data: MarkRead,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Suhbatni berilgan xabargacha (shu xabar ham) o'qilgan deb belgilash"""
+    state = await mark_read(db, conversation_id, current_user.id, read_data.message_id)
+    
+    if state is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Suhbat topilmadi yoki siz unga kirishga ruxsat yo'q"
+        )
+    
+    await manager.broadcast(
+        {
+            "type": "read",
+            "conversation_id": conversation_id,
+            "user_id": current_user.id,
+            "last_read_message_id": state["last_read_message_id"]
+        },
+        conversation_id,
+        coalesce_key=f"read:{conversation_id}:{current_user.id}"
+    )
+    
+    return state
+
+
 @router.get("/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
-def get_conversation_messages(
+async def get_conversation_messages(
     conversation_id: int,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_MAX),
+    direction: Literal["backward", "forward"] = "backward",
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Ma'lum bir suhbatdagi xabarlarni olish"""
+    """Ma'lum bir suhbatdagi xabarlarni sahifalab olish.
+
+    `before` kursoridan eskiroq yoki `after` kursoridan yangiroq xabarlar
+    qaytariladi; kursor berilmasa `direction` bo'yicha eng yangi (backward)
+    yoki eng eski (forward) sahifa olinadi. Xabarlar doim vaqt bo'yicha
+    o'sish tartibida qaytadi, keyingi sahifalar kursorlari sarlavhalarda.
+    """
     # Suhbatni tekshirish
-    conversation = db.query(Conversation)\
-        .join(ConversationParticipant)\
-        .filter(
-            Conversation.id == conversation_id,
-            ConversationParticipant.user_id == current_user.id
-        ).first()
-    
-    if not conversation:
+    if not await membership_cache.is_member(db, conversation_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Suhbat topilmadi yoki siz unga kirishga ruxsat yo'q"
         )
     
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="before va after birga berilmaydi"
+        )
+    
+    backward = before is not None or (after is None and direction == "backward")
+    before_key = decode_message_cursor(before) if before else None
+    after_key = decode_message_cursor(after) if after else None
+    
+    # Eng yangi sahifalar xotiradagi oynadan, oldindan serializatsiya qilingan holda beriladi
+    cached = message_cache.page(conversation_id, before_key, after_key, limit, backward)
+    if cached is None and backward and before is None and limit < message_cache.capacity:
+        await _fill_message_cache(db, conversation_id)
+        cached = message_cache.page(conversation_id, before_key, after_key, limit, backward)
+    if cached is not None:
+        return await _cached_messages_response(db, conversation_id, *cached)
+    
+    key = tuple_(Message.timestamp, Message.id)
+    query = select(Message).where(Message.conversation_id == conversation_id)
+    if before_key:
+        query = query.where(key < tuple_(*before_key))
+    if after_key:
+        query = query.where(key > tuple_(*after_key))
+    if backward:
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.timestamp.asc(), Message.id.asc())
+    
+    # Keyingi sahifa borligini bilish uchun bitta ortiqcha qator olinadi
+    result = await db.execute(query.limit(limit + 1))
+    messages = result.scalars().all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if backward:
+        messages.reverse()
+    
+    if messages:
+        response.headers["X-Before-Cursor"] = encode_cursor(messages[0].timestamp, messages[0].id)
+        response.headers["X-After-Cursor"] = encode_cursor(messages[-1].timestamp, messages[-1].id)
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    
+    return await attach_media(db, messages)
+
+
+async def _fill_message_cache(db: AsyncSession, conversation_id: int):
+    message_cache.begin_fill(conversation_id)
+    result = await db.execute(
+        select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(message_cache.capacity + 1)
+    )
+    rows = result.scalars().all()
+    await attach_media(db, rows[:message_cache.capacity])
+    message_cache.fill(conversation_id, rows[:message_cache.capacity], len(rows) > message_cache.capacity)
+
 
-    messages = db.query(Message)\
-        .filter(Message.conversation_id == conversation_id)\
-        .order_by(Message.timestamp.asc())\
-        .all()
+async def _cached_messages_response(
+    db: AsyncSession,
+    conversation_id: int,
+    entries: List[CachedMessage],
+    has_more: bool
+) -> Response:
+    # Fon ishi tugagach media ma'lumoti paydo bo'lgan fayllar oynada yangilanadi
+    stale = [dict(entry.message) for entry in entries if entry.needs_media]
+    if stale:
+        await attach_media(db, stale)
+        refreshed = {message["id"]: CachedMessage(message) for message in stale if message["media"] is not None}
+        if refreshed:
+            message_cache.replace(conversation_id, list(refreshed.values()))
+            entries = [refreshed.get(entry.key[1], entry) for entry in entries]
     
-    return messages
+    headers = {"X-Has-More": "true" if has_more else "false"}
+    if entries:
+        headers["X-Before-Cursor"] = encode_cursor(*entries[0].key)
+        headers["X-After-Cursor"] = encode_cursor(*entries[-1].key)
+    return Response(
+        content=b"[" + b",".join(entry.data for entry in entries) + b"]",
+        media_type="application/json",
+        headers=headers
+    )
 
 
 @router.get("/users/search", response_model=List[UserResponse])
-def search_users(
+async def search_users(
     query: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(USER_SEARCH_PAGE_SIZE, ge=1, le=USER_SEARCH_PAGE_MAX),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Foydalanuvchilarni izlash"""
     if not query or len(query) < 2:
         return []
     
-    users = db.query(User)\
-        .filter(
-            User.id != current_user.id,
-            User.name.ilike(f"%{query}%") | User.email.ilike(f"%{query}%")
-        )\
-        .limit(20)\
-        .all()
+    after = user_search.decode_search_cursor(cursor)
+    users = await user_search.search_users(db, query, current_user.id, after, limit + 1)
+    if len(users) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(*user_search.sort_key(users[limit - 1]))
+    
+    return users[:limit]
+
+
+@router.get("/presence", response_model=List[PresenceState])
+async def get_presence(
+    user_ids: List[int] = Query(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Berilgan foydalanuvchilarning online holati"""
+    if len(user_ids) > PRESENCE_QUERY_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Bir so'rovda {PRESENCE_QUERY_MAX} tadan ko'p foydalanuvchi so'ralmaydi"
+        )
+    
+    return presence.snapshot(dict.fromkeys(user_ids))
+
+
+@router.get("/search", response_model=List[MessageSearchResult])
+async def search_messages(
+    q: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(MESSAGE_SEARCH_PAGE_SIZE, ge=1, le=MESSAGE_SEARCH_PAGE_MAX),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Foydalanuvchi suhbatlaridagi xabarlarni matn bo'yicha izlash"""
+    if len(q.strip()) < 2:
+        return []
+    
+    offset = decode_offset_cursor(cursor)
+    results = await message_search.search_messages(db, current_user.id, q, offset, limit + 1)
+    if len(results) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(offset + limit)
     
-    return users
+    return results[:limit]
@@ -1,14 +1,27 @@
 import os
-import uuid
-import shutil
-from db import get_db
+from db import get_async_db
 from models import User
 from typing import List
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth.auth import get_current_user
-from fastapi.responses import FileResponse
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+from services.file_response import conditional_file_response
+from schemas import UploadSessionCreate
+from services import upload_sessions
+from services.media import MEDIA_DIR, media_pipeline
+from services.rate_limit import upload_limiter
+from starlette.concurrency import run_in_threadpool
+from services.storage import (
+    MAX_UPLOAD_SIZE,
+    MULTIPART_OVERHEAD,
+    UPLOAD_DIR,
+    UploadError,
+    UploadTooLarge,
+    receive_multipart_upload,
+    sha256_file,
+    store_file,
+)
+from fastapi import APIRouter, Depends, Request, HTTPException, status
 
 router = APIRouter(
     prefix="/files",
@@ -16,58 +29,237 @@ router = APIRouter(
 )
 
 
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-
+# Tana FastAPI tomonidan emas, oqim sifatida o'qiladi; hujjatlar uchun sxema qo'lda beriladi
+_UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
+@router.post("/upload", status_code=status.HTTP_201_CREATED, openapi_extra=_UPLOAD_REQUEST_BODY)
 async def upload_file(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Fayl yuklash"""
+    """Fayl yuklash (multipart/form-data, `file` maydoni)"""
+    await upload_limiter.limit(current_user.id)
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Fayl hajmi juda katta"
+        )
     try:
-   
-        file_ext = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-     
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Fayl tana kelishi bilan bo'laklab yoziladi, xeshlanadi va hajmi tekshiriladi
+        received = await receive_multipart_upload(request)
+        file_ext = os.path.splitext(received.filename or "")[1]
+        stored_filename = await store_file(
+            db,
+            received.path,
+            received.sha256,
+            received.size,
+            file_ext,
+            received.content_type
+        )
+        # Thumbnail va metama'lumotlar fonda tayyorlanadi, javob kutmaydi
+        media_pipeline.enqueue(stored_filename, received.content_type)
         
        
-        file_url = f"/api/files/download/{unique_filename}"
+        file_url = f"/api/files/download/{stored_filename}"
         
         return {
             "file_url": file_url,
-            "file_name": file.filename,
-            "file_type": file.content_type,
+            "file_name": received.filename,
+            "file_type": received.content_type,
+            "file_size": received.size,
             "uploaded_at": datetime.utcnow()
         }
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Fayl hajmi juda katta"
+        )
+    except UploadError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Fayl yuklashda xatolik: {str(e)}"
         )
-    finally:
-        file.file.close()
+
+
+def _session_status(meta: dict, ranges) -> dict:
+    return {
+        "upload_id": meta["upload_id"],
+        "file_name": meta["file_name"],
+        "file_size": meta["file_size"],
+        "received": [[start, end] for start, end in ranges],
+        "received_bytes": sum(end - start for start, end in ranges),
+        "complete": upload_sessions.is_complete(meta, ranges),
+        "expires_at": datetime.utcfromtimestamp(meta["expires_at"]),
+    }
+
+
+async def _get_upload_session(upload_id: str, user_id: int) -> dict:
+    meta = await upload_sessions.get_session(upload_id, user_id)
+    if meta is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Yuklash sessiyasi topilmadi yoki muddati o'tgan"
+        )
+    return meta
+
+
+@router.post("/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_data: UploadSessionCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Davom ettiriladigan (bo'laklab) yuklash sessiyasini ochish"""
+    await upload_limiter.limit(current_user.id)
+    if session_data.file_size < 0 or session_data.file_size > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Fayl hajmi juda katta"
+        )
+    meta = await upload_sessions.create_session(
+        current_user.id,
+        session_data.file_name,
+        session_data.file_size,
+        session_data.file_type
+    )
+    return {
+        **_session_status(meta, []),
+        "chunk_size_max": upload_sessions.UPLOAD_SESSION_CHUNK_MAX,
+    }
+
+
+@router.put("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Bo'lakni `offset` joyiga yozish; bo'laklar istalgan tartibda va parallel yuborilishi mumkin"""
+    meta = await _get_upload_session(upload_id, current_user.id)
+    try:
+        await upload_sessions.write_chunk(meta, offset, request.stream())
+    except upload_sessions.UploadSessionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    ranges = await upload_sessions.received_ranges(upload_id)
+    return _session_status(meta, ranges)
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Sessiya holati va qabul qilingan oraliqlar"""
+    meta = await _get_upload_session(upload_id, current_user.id)
+    ranges = await upload_sessions.received_ranges(upload_id)
+    return _session_status(meta, ranges)
+
+
+@router.post("/uploads/{upload_id}/complete", status_code=status.HTTP_201_CREATED)
+async def complete_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Barcha bo'laklar kelgach faylni saqlash; javob /upload bilan bir xil"""
+    meta = await _get_upload_session(upload_id, current_user.id)
+    ranges = await upload_sessions.received_ranges(upload_id)
+    if not upload_sessions.is_complete(meta, ranges):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Fayl hali to'liq yuklanmagan"
+        )
+    
+    # Data fayli joyida yig'ilgan, saqlashda u nusxalanmasdan ko'chiriladi
+    path = upload_sessions.data_path(upload_id)
+    sha256 = await run_in_threadpool(sha256_file, path)
+    stored_filename = await store_file(
+        db,
+        path,
+        sha256,
+        meta["file_size"],
+        os.path.splitext(meta["file_name"])[1],
+        meta["file_type"]
+    )
+    await upload_sessions.delete_session(upload_id)
+    media_pipeline.enqueue(stored_filename, meta["file_type"])
+    
+    return {
+        "file_url": f"/api/files/download/{stored_filename}",
+        "file_name": meta["file_name"],
+        "file_type": meta["file_type"],
+        "file_size": meta["file_size"],
+        "uploaded_at": datetime.utcnow()
+    }
+
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Yuklash sessiyasini bekor qilish"""
+    await _get_upload_session(upload_id, current_user.id)
+    await upload_sessions.delete_session(upload_id)
+
 
 @router.get("/download/{filename}")
 async def download_file(
     filename: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: User = Depends(get_current_user)
 ):
-    """Faylni yuklab olish"""
+    """Faylni yuklab olish (Range, ETag va shartli so'rovlar bilan)"""
     file_path = os.path.join(UPLOAD_DIR, filename)
     
-    if not os.path.exists(file_path):
+    if filename.startswith(".") or not os.path.isfile(file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Fayl topilmadi"
+        )
+    
+    return await conditional_file_response(request, file_path, filename)
+
+
+@router.get("/thumbnails/{name}")
+async def download_thumbnail(
+    name: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Fonda tayyorlangan thumbnail'ni olish"""
+    file_path = os.path.join(MEDIA_DIR, name)
+    
+    if name.startswith(".") or not name.endswith(".jpg") or not os.path.isfile(file_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Fayl topilmadi"
         )
     
-    return FileResponse(file_path)
+    return await conditional_file_response(request, file_path, name)
@@ -1,9 +1,24 @@
-import json
-from db import get_db
-from datetime import datetime
-from sqlalchemy.orm import Session
-from typing import Dict, List, Optional
+import time
+import asyncio
+from db import get_async_db
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterable, Optional, Set
 from auth.auth import get_current_user_ws
+from auth.principal_cache import Principal
+from services.backplane import Backplane, create_backplane
+from services.send_queue import QueuedConnection, SendQueueStats
+from services.wire import Frame, negotiate, receive_frame
+from services.message_writer import message_writer
+from services.read_state import mark_read
+from services.presence import PRESENCE_CHANNEL, PresenceService
+from services.membership import MEMBERSHIP_CHANNEL, membership_cache
+from services.message_cache import MESSAGE_CACHE_CHANNEL, message_cache
+from services.sync import decode_sync_cursor
+from services.rate_limit import RateLimiter, frame_limiter, message_limiter
+from services.metrics import BROADCAST_DURATION, BROADCAST_FANOUT
+from services.query_profiler import QUERY_PROFILE, profile_queries
+from schemas import MessageResponse
 from models import User, Conversation, ConversationParticipant, Message
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
 
@@ -14,35 +29,397 @@ router = APIRouter(
 
 
 class ConnectionManager:
-    def __init__(self):
-       
-        self.active_connections: Dict[int, Dict[int, WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, conversation_id: int, user_id: int):
-        await websocket.accept()
-        if conversation_id not in self.active_connections:
-            self.active_connections[conversation_id] = {}
-        self.active_connections[conversation_id][user_id] = websocket
-    
-    def disconnect(self, conversation_id: int, user_id: int):
-        if conversation_id in self.active_connections:
-            if user_id in self.active_connections[conversation_id]:
-                del self.active_connections[conversation_id][user_id]
-            if not self.active_connections[conversation_id]:
+    """Ulanishlarni foydalanuvchi va suhbat bo'yicha indekslab boshqaradi.
+
+    Bitta ulanish bir nechta suhbatga obuna bo'lishi mumkin (`/ws`); eski
+    `/ws/chat/{conversation_id}` ulanishi bitta suhbatga obuna bo'lgan
+    ulanishning xususiy holi.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None):
+        # user_id -> shu foydalanuvchining ulanishlari
+        self.user_connections: Dict[int, Set[QueuedConnection]] = {}
+        # conversation_id -> shu suhbatga obuna bo'lgan ulanishlar
+        self.active_connections: Dict[int, Set[QueuedConnection]] = {}
+        # ulanish -> obuna bo'lgan suhbatlar va ulanish egasi
+        self.subscriptions: Dict[QueuedConnection, Set[int]] = {}
+        self.owners: Dict[QueuedConnection, int] = {}
+        self.send_stats = SendQueueStats()
+        # Boshqa workerlardagi ulanishlarga xabar yetkazish uchun
+        self.backplane = backplane or create_backplane()
+        self._backplane_started = False
+
+    @staticmethod
+    def _channel(conversation_id: int) -> str:
+        return f"conversation:{conversation_id}"
+
+    async def start(self):
+        """Backplane'ni ishga tushirish (ilova ishga tushganda yoki birinchi ulanishda)"""
+        if not self._backplane_started:
+            self._backplane_started = True
+            await self.backplane.start(self._on_backplane_message)
+            await self.backplane.subscribe(PRESENCE_CHANNEL)
+            await self.backplane.subscribe(MEMBERSHIP_CHANNEL)
+            await self.backplane.subscribe(MESSAGE_CACHE_CHANNEL)
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> QueuedConnection:
+        wire = negotiate(websocket)
+        await websocket.accept(subprotocol=wire.subprotocol)
+        await self.start()
+        connection = QueuedConnection(websocket, stats=self.send_stats, wire=wire)
+        self.user_connections.setdefault(user_id, set()).add(connection)
+        self.subscriptions[connection] = set()
+        self.owners[connection] = user_id
+        return connection
+
+    async def subscribe(self, connection: QueuedConnection, conversation_ids: Iterable[int]):
+        for conversation_id in conversation_ids:
+            if conversation_id in self.subscriptions[connection]:
+                continue
+            self.subscriptions[connection].add(conversation_id)
+            if conversation_id not in self.active_connections:
+                self.active_connections[conversation_id] = set()
+                await self.backplane.subscribe(self._channel(conversation_id))
+            self.active_connections[conversation_id].add(connection)
+
+    async def unsubscribe(self, connection: QueuedConnection, conversation_ids: Iterable[int]):
+        for conversation_id in list(conversation_ids):
+            self.subscriptions[connection].discard(conversation_id)
+            connections = self.active_connections.get(conversation_id)
+            if connections is None:
+                continue
+            connections.discard(connection)
+            if not connections:
                 del self.active_connections[conversation_id]
-    
+                await self.backplane.unsubscribe(self._channel(conversation_id))
+
+    async def disconnect(self, connection: QueuedConnection):
+        if connection not in self.subscriptions:
+            return
+        await self.unsubscribe(connection, self.subscriptions[connection])
+        del self.subscriptions[connection]
+        user_id = self.owners.pop(connection)
+        self.user_connections[user_id].discard(connection)
+        if not self.user_connections[user_id]:
+            del self.user_connections[user_id]
+        await connection.close()
+
     async def send_personal_message(self, message: dict, conversation_id: int, user_id: int):
-        if conversation_id in self.active_connections and user_id in self.active_connections[conversation_id]:
-            await self.active_connections[conversation_id][user_id].send_json(message)
-    
-    async def broadcast(self, message: dict, conversation_id: int, sender_id: Optional[int] = None):
-        if conversation_id in self.active_connections:
-            for user_id, connection in self.active_connections[conversation_id].items():
-                if sender_id is None or user_id != sender_id: 
-                    await connection.send_json(message)
+        message = Frame(message)
+        for connection in self.user_connections.get(user_id, ()):
+            if conversation_id in self.subscriptions[connection]:
+                connection.send(message)
+
+    async def send_to_user(self, message: dict, user_id: int):
+        """Foydalanuvchining shu workerdagi barcha ulanishlariga yuborish"""
+        message = Frame(message)
+        for connection in self.user_connections.get(user_id, ()):
+            connection.send(message)
+
+    async def broadcast(
+        self,
+        message: dict,
+        conversation_id: int,
+        sender_id: Optional[int] = None,
+        coalesce_key: Optional[str] = None
+    ):
+        started = time.perf_counter()
+        await self._deliver(message, conversation_id, sender_id, coalesce_key)
+        await self.backplane.publish(
+            self._channel(conversation_id),
+            {"message": message, "sender_id": sender_id, "coalesce_key": coalesce_key}
+        )
+        BROADCAST_DURATION.observe(time.perf_counter() - started)
+
+    async def _deliver(
+        self,
+        message: dict,
+        conversation_id: int,
+        sender_id: Optional[int] = None,
+        coalesce_key: Optional[str] = None
+    ):
+        """Xabarni faqat shu workerdagi ulanishlar navbatiga qo'yish.
+
+        Kadr bir marta yaratiladi va har bir format uchun bir marta kodlanadi.
+        """
+        frame = Frame(message)
+        delivered = 0
+        for connection in list(self.active_connections.get(conversation_id, ())):
+            if sender_id is None or self.owners.get(connection) != sender_id:
+                connection.send(frame, coalesce_key)
+                delivered += 1
+        BROADCAST_FANOUT.observe(delivered)
+
+    async def _on_backplane_message(self, channel: str, payload: dict):
+        if channel == PRESENCE_CHANNEL:
+            await presence.on_remote(payload)
+        elif channel == MEMBERSHIP_CHANNEL:
+            await membership_cache.on_remote(payload)
+        elif channel == MESSAGE_CACHE_CHANNEL:
+            await message_cache.on_remote(payload)
+        elif channel.startswith("conversation:"):
+            conversation_id = int(channel.split(":", 1)[1])
+            await self._deliver(
+                payload["message"],
+                conversation_id,
+                payload.get("sender_id"),
+                payload.get("coalesce_key")
+            )
+
+    def stats(self) -> dict:
+        """Ulanishlar va chiquvchi navbatlar holati"""
+        return {
+            "connections": len(self.subscriptions),
+            "users": len(self.user_connections),
+            "subscriptions": sum(len(conversations) for conversations in self.subscriptions.values()),
+            "queue_depth": sum(connection.depth for connection in self.subscriptions),
+            **self.send_stats.as_dict()
+        }
+
+
+async def _send_to_watcher(frame: dict, connection: QueuedConnection):
+    connection.send(frame)
 
 
 manager = ConnectionManager()
+presence = PresenceService(manager.backplane, _send_to_watcher)
+membership_cache.backplane = manager.backplane
+message_cache.backplane = manager.backplane
+
+# Qayta ulanganda yuboriladigan eng ko'p o'tkazib yuborilgan xabarlar soni
+REPLAY_MAX = 500
+
+
+async def _participant_ids(db: AsyncSession, conversation_ids: Iterable[int]) -> Set[int]:
+    """Suhbatlar ishtirokchilari (presence kuzatuvi uchun)"""
+    members = await membership_cache.members_many(db, conversation_ids)
+    return set().union(*members.values())
+
+
+async def _replay(db: AsyncSession, connection: QueuedConnection, positions: Dict[int, int]):
+    """Qayta ulangan mijozga har bir suhbatda ko'rgan oxirgi seq dan keyingi xabarlarni yuborish.
+
+    Xabarlar avval xotiradagi oynadan olinadi, oynasi yo'q (yoki oraliqni
+    qamramaydigan) suhbatlar uchun bitta so'rov bilan bazadan o'qiladi.
+    O'tkazib yuborilganlar juda ko'p bo'lsa {"type": "resync_required"}
+    yuboriladi - mijoz /api/chat/sync orqali sinxronlanadi.
+    """
+    messages = []
+    missing = {}
+    for conversation_id, seq in positions.items():
+        cached = message_cache.after_seq(conversation_id, seq)
+        if cached is None:
+            missing[conversation_id] = seq
+        else:
+            messages.extend(cached)
+    if missing and len(messages) <= REPLAY_MAX:
+        result = await db.execute(
+            select(Message)
+            .where(or_(*(
+                and_(Message.conversation_id == conversation_id, Message.seq > seq)
+                for conversation_id, seq in missing.items()
+            )))
+            .order_by(Message.conversation_id, Message.seq)
+            .limit(REPLAY_MAX + 1)
+        )
+        messages.extend(
+            MessageResponse.model_validate(row, from_attributes=True).model_dump(mode="json")
+            for row in result.scalars().all()
+        )
+    if len(messages) > REPLAY_MAX:
+        connection.send({"type": "resync_required"})
+        return
+    for message in sorted(messages, key=lambda message: (message["conversation_id"], message["seq"])):
+        connection.send({"type": "message", **message})
+
+
+async def _throttle(connection: QueuedConnection, limiter: RateLimiter, key) -> bool:
+    """Cheklovdan o'tsa True (kerak bo'lsa kutib); rad etilsa mijozga xato freymi yuboriladi.
+
+    Kutish vaqtida ulanishdan o'qilmaydi, shuning uchun tez yuboruvchi
+    mijoz TCP darajasida ham sekinlashadi.
+    """
+    allowed, wait = limiter.check(key)
+    if not allowed:
+        connection.send(
+            {
+                "type": "error",
+                "detail": "So'rovlar juda ko'p, birozdan keyin qayta urinib ko'ring",
+                "retry_after": round(wait, 3)
+            },
+            coalesce_key="rate_limited"
+        )
+        return False
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return True
+
+
+async def _handle_frame(
+    db: AsyncSession,
+    connection: QueuedConnection,
+    current_user: Principal,
+    conversation_id: int,
+    message_data: dict
+):
+    """Suhbatga tegishli kiruvchi freymni (xabar yoki o'qildi belgisi) bajarish"""
+    if message_data.get("type") == "read":
+        # {"type": "read", "message_id": X}: X gacha o'qildi; message_id bo'lmasa oxirgi xabargacha
+        message_id = message_data.get("message_id")
+        if message_id is not None and (not isinstance(message_id, int) or isinstance(message_id, bool)):
+            connection.send({
+                "type": "error",
+                "conversation_id": conversation_id,
+                "detail": "message_id butun son bo'lishi kerak"
+            })
+            return
+        state = await mark_read(db, conversation_id, current_user.id, message_id)
+        if state is not None:
+            await manager.broadcast(
+                {
+                    "type": "read",
+                    "conversation_id": conversation_id,
+                    "user_id": current_user.id,
+                    "last_read_message_id": state["last_read_message_id"]
+                },
+                conversation_id,
+                coalesce_key=f"read:{conversation_id}:{current_user.id}"
+            )
+        return
+
+    # Xabarlar chegarasi foydalanuvchining barcha ulanishlari va REST uchun umumiy
+    if not await _throttle(connection, message_limiter, current_user.id):
+        return
+
+    # Xabar boshqa ulanishlardagi xabarlar bilan birga guruhlab yoziladi
+    new_message = await message_writer.submit(
+        conversation_id=conversation_id,
+        sender_id=current_user.id,
+        content=message_data.get("content", "")
+    )
+
+    await manager.broadcast(
+        {
+            "type": "message",
+            "conversation_id": conversation_id,
+            "id": new_message["id"],
+            "seq": new_message["seq"],
+            "content": new_message["content"],
+            "sender_id": current_user.id,
+            "sender_name": current_user.name,
+            "timestamp": str(new_message["timestamp"])
+        },
+        conversation_id,
+        current_user.id
+    )
+
+    connection.send(
+        {
+            "type": "message_sent",
+            "conversation_id": conversation_id,
+            "id": new_message["id"],
+            "seq": new_message["seq"],
+            "content": new_message["content"],
+            "timestamp": str(new_message["timestamp"])
+        }
+    )
+
+
+@router.websocket("")
+async def user_websocket_endpoint(
+    websocket: WebSocket,
+    token: str,
+    since: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Foydalanuvchining barcha suhbatlari uchun bitta ulanish.
+
+    Ulanishda foydalanuvchi barcha suhbatlariga obuna qilinadi, kiruvchi
+    freymlar `conversation_id` bo'yicha yo'naltiriladi:
+    {"type": "message", "conversation_id", "content"},
+    {"type": "read", "conversation_id", "message_id" (ixtiyoriy)},
+    {"type": "subscribe" | "unsubscribe", "conversation_id"} va {"type": "ping"}.
+    Qayta ulanishda `since` (/api/chat/sync kursori) berilsa, kursordagi
+    suhbatlar bo'yicha o'tkazib yuborilgan xabarlar darhol yuboriladi;
+    subscribe freymida `since_seq` ham shunday ishlaydi.
+    """
+    try:
+        current_user = await get_current_user_ws(token, db)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    conversation_ids = await membership_cache.conversations_of(db, current_user.id)
+
+    connection = await manager.connect(websocket, current_user.id)
+    # Ulanishdan keyingi har qanday xato (mijoz uzilishi, baza) finally'dagi tozalashdan o'tadi
+    present = False
+    try:
+        await manager.subscribe(connection, conversation_ids)
+        participant_ids = await _participant_ids(db, conversation_ids)
+        connection.send(presence.connect(current_user.id, connection, participant_ids))
+        present = True
+        if since is not None:
+            try:
+                positions = decode_sync_cursor(since)
+            except HTTPException:
+                connection.send({"type": "resync_required"})
+            else:
+                await _replay(db, connection, {
+                    conversation_id: seq
+                    for conversation_id, (seq, _) in positions.items()
+                    if conversation_id in conversation_ids
+                })
+
+        while True:
+            # Keyingi freymni kutish paytida puldagi ulanish band qilib turilmaydi
+            await db.close()
+            message_data = await receive_frame(websocket, connection.wire)
+            presence.heartbeat(current_user.id)
+            if not await _throttle(connection, frame_limiter, id(connection)):
+                continue
+            frame_type = message_data.get("type", "message")
+
+            if frame_type == "ping":
+                connection.send({"type": "pong"})
+                continue
+
+            # Har bir freymdagi SQL so'rovlar alohida profil (QUERY_PROFILE=1)
+            with profile_queries(f"ws:{frame_type}", QUERY_PROFILE):
+                conversation_id = message_data.get("conversation_id")
+                if not isinstance(conversation_id, int):
+                    connection.send({"type": "error", "detail": "conversation_id ko'rsatilmagan"})
+                    continue
+
+                # A'zolik har bir freymda keshdan tekshiriladi
+                if not await membership_cache.is_member(db, conversation_id, current_user.id):
+                    connection.send({
+                        "type": "error",
+                        "conversation_id": conversation_id,
+                        "detail": "Suhbat topilmadi yoki siz unga kirishga ruxsat yo'q"
+                    })
+                    continue
+
+                if frame_type == "subscribe":
+                    await manager.subscribe(connection, [conversation_id])
+                    presence.watch(connection, await _participant_ids(db, [conversation_id]))
+                    connection.send({"type": "subscribed", "conversation_id": conversation_id})
+                    if isinstance(message_data.get("since_seq"), int):
+                        await _replay(db, connection, {conversation_id: message_data["since_seq"]})
+                elif frame_type == "unsubscribe":
+                    await manager.unsubscribe(connection, [conversation_id])
+                    connection.send({"type": "unsubscribed", "conversation_id": conversation_id})
+                else:
+                    await _handle_frame(db, connection, current_user, conversation_id, message_data)
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # presence.connect bo'lmagan ulanish foydalanuvchining boshqa ulanishlari hisobini kamaytirmasin
+        if present:
+            presence.disconnect(current_user.id, connection)
+        frame_limiter.forget(id(connection))
+        await manager.disconnect(connection)
 
 
 @router.websocket("/chat/{conversation_id}")
@@ -50,93 +427,60 @@ async def websocket_endpoint(
     websocket: WebSocket,
     conversation_id: int,
     token: str,
-    db: Session = Depends(get_db)
+    since_seq: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-   
+
     try:
         current_user = await get_current_user_ws(token, db)
     except HTTPException:
-        await websocket.close(code=1008) 
+        await websocket.close(code=1008)
         return
-    
-  
-    conversation = db.query(Conversation)\
-        .join(ConversationParticipant)\
-        .filter(
-            Conversation.id == conversation_id,
-            ConversationParticipant.user_id == current_user.id
-        ).first()
-    
-    if not conversation:
-        await websocket.close(code=1003)  
+
+
+    if not await membership_cache.is_member(db, conversation_id, current_user.id):
+        await websocket.close(code=1003)
         return
-    
-   
-    await manager.connect(websocket, conversation_id, current_user.id)
-    
+
+
+    connection = await manager.connect(websocket, current_user.id)
+    present = False
     try:
-      
-        await manager.broadcast(
-            {
-                "type": "system",
-                "content": f"{current_user.name} suhbatga qo'shildi",
-                "sender_id": None,
-                "timestamp": str(datetime.utcnow())
-            },
-            conversation_id
-        )
-        
+        await manager.subscribe(connection, [conversation_id])
+
+        # Qo'shildi/tark etdi xabarlari o'rniga suhbat ishtirokchilarining
+        # presence o'zgarishlari yig'ilib yuboriladi
+        participant_ids = await _participant_ids(db, [conversation_id])
+        connection.send(presence.connect(current_user.id, connection, participant_ids))
+        present = True
+        if since_seq is not None:
+            await _replay(db, connection, {conversation_id: since_seq})
+
         while True:
-          
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-           
-            new_message = Message(
-                conversation_id=conversation_id,
-                sender_id=current_user.id,
-                content=message_data.get("content", ""),
-                is_read=False
-            )
-            db.add(new_message)
-            db.commit()
-            db.refresh(new_message)
-            
-           
-            await manager.broadcast(
-                {
-                    "type": "message",
-                    "id": new_message.id,
-                    "content": new_message.content,
-                    "sender_id": current_user.id,
-                    "sender_name": current_user.name,
-                    "timestamp": str(new_message.timestamp)
-                },
-                conversation_id,
-                current_user.id
-            )
-            
-           
-            await manager.send_personal_message(
-                {
-                    "type": "message_sent",
-                    "id": new_message.id,
-                    "content": new_message.content,
-                    "timestamp": str(new_message.timestamp)
-                },
-                conversation_id,
-                current_user.id
-            )
-            
+            # Keyingi freymni kutish paytida puldagi ulanish band qilib turilmaydi
+            await db.close()
+            message_data = await receive_frame(websocket, connection.wire)
+            presence.heartbeat(current_user.id)
+            if not await _throttle(connection, frame_limiter, id(connection)):
+                continue
+
+            if message_data.get("type") == "ping":
+                connection.send({"type": "pong"})
+                continue
+
+            with profile_queries(f"ws:{message_data.get('type', 'message')}", QUERY_PROFILE):
+                if not await membership_cache.is_member(db, conversation_id, current_user.id):
+                    # Suhbatdan chiqarilgan
+                    await websocket.close(code=1003)
+                    break
+
+                await _handle_frame(db, connection, current_user, conversation_id, message_data)
+
     except WebSocketDisconnect:
-        
-        manager.disconnect(conversation_id, current_user.id)
-        await manager.broadcast(
-            {
-                "type": "system",
-                "content": f"{current_user.name} suhbatni tark etdi",
-                "sender_id": None,
-                "timestamp": str(datetime.utcnow())
-            },
-            conversation_id
-        )
+        pass
+    finally:
+        # presence.connect bo'lmagan ulanish foydalanuvchining boshqa ulanishlari hisobini kamaytirmasin
+        if present:
+            presence.disconnect(current_user.id, connection)
+        frame_limiter.forget(id(connection))
+        await manager.disconnect(connection)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from pydantic import BaseModel, EmailStr
 
@@ -62,11 +62,63 @@ class ConversationResponse(BaseModel):
     is_group: bool
     created_by: int
     created_at: datetime
+    last_seq: int = 0
+    last_read_message_id: int = 0
+    unread_count: int = 0
 
     class Config:
         orm_mode = True
 
 
+class InboxMessage(BaseModel):
+    id: int
+    content: str
+    sender_id: int
+    sender_name: Optional[str] = None
+    timestamp: datetime
+    file_type: Optional[str] = None
+
+
+class ParticipantPreview(BaseModel):
+    id: int
+    name: str
+
+
+class ParticipantSummary(BaseModel):
+    count: int
+    users: List[ParticipantPreview] = []
+
+
+class InboxEntry(BaseModel):
+    id: int
+    name: Optional[str]
+    is_group: bool
+    created_by: int
+    created_at: datetime
+    last_activity_at: datetime
+    last_read_message_id: int
+    unread_count: int
+    last_message: Optional[InboxMessage] = None
+    participants: ParticipantSummary
+
+
+class PresenceState(BaseModel):
+    user_id: int
+    online: bool
+    last_seen: Optional[datetime] = None
+
+
+class MarkRead(BaseModel):
+    message_id: int
+
+
+class ReadState(BaseModel):
+    conversation_id: int
+    user_id: int
+    last_read_message_id: int
+    unread_count: int
+
+
 
 class MessageCreate(BaseModel):
     conversation_id: int
@@ -76,6 +128,14 @@ class MessageCreate(BaseModel):
     file_type: Optional[str] = None
 
 
+class MediaInfo(BaseModel):
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[float] = None
+    placeholder: Optional[str] = None
+    thumbnails: Dict[str, str] = {}
+
+
 class MessageResponse(BaseModel):
     id: int
     conversation_id: int
@@ -86,6 +146,43 @@ class MessageResponse(BaseModel):
     file_url: Optional[str] = None
     file_name: Optional[str] = None
     file_type: Optional[str] = None
+    seq: Optional[int] = None
+    media: Optional[MediaInfo] = None
 
     class Config:
         orm_mode = True
+
+
+class SyncConversation(BaseModel):
+    id: int
+    name: Optional[str]
+    is_group: bool
+    created_by: int
+    created_at: datetime
+    last_activity_at: datetime
+    last_seq: int
+    last_read_message_id: int
+    unread_count: int
+
+
+class SyncResponse(BaseModel):
+    conversations: List[SyncConversation] = []
+    messages: List[MessageResponse] = []
+    removed: List[int] = []
+    truncated: List[int] = []
+    cursor: str
+    has_more: bool = False
+
+
+class MessageSearchResult(BaseModel):
+    id: int
+    conversation_id: int
+    sender_id: int
+    timestamp: datetime
+    snippet: str
+
+
+class UploadSessionCreate(BaseModel):
+    file_name: str
+    file_size: int
+    file_type: Optional[str] = None
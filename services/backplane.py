@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import uuid
+import errno
+import socket
+import struct
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+
+logger = logging.getLogger(__name__)
+
+# "local" - bitta jarayon ichida, "unix:///tmp/chat-backplane" - bitta xostdagi workerlar uchun
+BACKPLANE_URL = os.getenv("CHAT_BACKPLANE", "local")
+# Unix backplane: boshqa workerlar soketlari ro'yxatini qayta o'qish oralig'i (sekund)
+BACKPLANE_PEER_REFRESH = float(os.getenv("CHAT_BACKPLANE_PEER_REFRESH", "5"))
+# Unix backplane: bundan katta xabarlar bo'laklab yuboriladi
+BACKPLANE_MAX_DATAGRAM = int(os.getenv("CHAT_BACKPLANE_MAX_DATAGRAM", "65536"))
+
+Handler = Callable[[str, dict], Awaitable[None]]
+
+
+class Backplane:
+    """Workerlar o'rtasida xabar tarqatish uchun drayver interfeysi.
+
+    Tashqi broker (Redis, NATS va h.k.) uchun drayver shu klassdan meros olib,
+    publish/subscribe/unsubscribe/close metodlarini amalga oshiradi va
+    `register_driver` orqali ro'yxatdan o'tkaziladi. Drayver o'zi yuborgan
+    xabarlarni handlerga qaytarmasligi kerak.
+    """
+
+    def __init__(self):
+        self.node_id = uuid.uuid4().hex
+        self.handler: Optional[Handler] = None
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+
+    async def publish(self, channel: str, message: dict):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def unsubscribe(self, channel: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def _dispatch(self, channel: str, message: dict):
+        if self.handler is None:
+            return
+        try:
+            await self.handler(channel, message)
+        except Exception:
+            logger.exception("Backplane xabarini qayta ishlashda xatolik: %s", channel)
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, default=str, separators=(",", ":")).encode()
+
+
+# Bo'lak datagrammasi: 0x00 + xabar id (16 bayt) + tartib raqami + bo'laklar soni.
+# Butun xabarlar JSON bo'lgani uchun "{" bilan boshlanadi va adashmaydi
+_FRAGMENT = b"\x00"
+_FRAGMENT_HEADER = struct.Struct("!16sHH")
+_FRAGMENT_TTL = 10
+_MIN_DATAGRAM = 1024
+_SEND_RETRIES = 5
+
+
+class LoopbackHub:
+    """Bir jarayondagi InProcessBackplane nusxalarini bog'laydigan markaz"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set["InProcessBackplane"]] = {}
+
+
+default_hub = LoopbackHub()
+
+
+class InProcessBackplane(Backplane):
+    """Jarayon ichidagi (loopback) backplane.
+
+    Bitta worker uchun standart tanlov; testlarda bir nechta ConnectionManager
+    bitta hub orqali alohida workerlarni taqlid qiladi.
+    """
+
+    def __init__(self, hub: Optional[LoopbackHub] = None):
+        super().__init__()
+        self.hub = hub or default_hub
+
+    async def publish(self, channel: str, message: dict):
+        subscribers = self.hub.subscribers.get(channel)
+        if not subscribers:
+            return
+        # Sim orqali yuborilgandek nusxa olinadi
+        data = _encode(message)
+        for backplane in list(subscribers):
+            if backplane is not self:
+                await backplane._dispatch(channel, json.loads(data))
+
+    async def subscribe(self, channel: str):
+        self.hub.subscribers.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, channel: str):
+        subscribers = self.hub.subscribers.get(channel)
+        if subscribers is not None:
+            subscribers.discard(self)
+            if not subscribers:
+                del self.hub.subscribers[channel]
+
+    async def close(self):
+        for channel in list(self.hub.subscribers):
+            await self.unsubscribe(channel)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, backplane: "UnixSocketBackplane"):
+        self.backplane = backplane
+
+    def datagram_received(self, data, addr):
+        self.backplane._received(data)
+
+    def error_received(self, exc):
+        logger.debug("Backplane datagram xatoligi: %s", exc)
+        self.backplane.peers_refreshed = 0.0
+
+
+class _PartialMessage:
+    __slots__ = ("started", "remaining", "parts")
+
+    def __init__(self, started: float, total: int):
+        self.started = started
+        self.remaining = total
+        self.parts: List[Optional[bytes]] = [None] * total
+
+
+class UnixSocketBackplane(Backplane):
+    """Bitta xostdagi workerlar uchun Unix datagram soketlari orqali backplane.
+
+    Har bir worker umumiy katalogda o'z soketini ochadi; publish ma'lum
+    bo'lgan barcha boshqa soketlarga yuboradi, qabul qiluvchi esa faqat o'zi
+    obuna bo'lgan kanallarni qayta ishlaydi. Soketlar ro'yxati keshlanadi:
+    katalog BACKPLANE_PEER_REFRESH sekundda bir marta (yoki soket xatosidan
+    keyin) qayta o'qiladi, yangi worker esa ishga tushganda o'zini boshqalarga
+    e'lon qiladi. Yuborish alohida bloklanmaydigan soketdan sinxron bajariladi,
+    shuning uchun to'xtagan workerning soketi xatoning o'zidan aniqlanib
+    o'chiriladi. Datagrammaga sig'maydigan xabarlar bo'laklab yuboriladi.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{self.node_id}.sock")
+        self.channels: Set[str] = set()
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.sender: Optional[socket.socket] = None
+        self.inbox: Optional[asyncio.Queue] = None
+        self.reader_task: Optional[asyncio.Task] = None
+        self.peers: Set[str] = set()
+        self.peers_refreshed = 0.0
+        self.max_datagram = BACKPLANE_MAX_DATAGRAM
+        self.partial: Dict[bytes, _PartialMessage] = {}
+        self.dropped = 0
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        os.makedirs(self.directory, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        # Xabarlar kelgan tartibda bitta task orqali qayta ishlanadi
+        self.inbox = asyncio.Queue()
+        self.reader_task = loop.create_task(self._read_inbox())
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self),
+            local_addr=self.path,
+            family=socket.AF_UNIX
+        )
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+        self._refresh_peers()
+        # Boshqa workerlar yangi soketni katalogni qayta o'qishni kutmasdan bilib oladi
+        await self._send_all(_encode({"o": self.node_id, "h": self.path}))
+
+    async def publish(self, channel: str, message: dict):
+        if self.sender is None:
+            return
+        if time.monotonic() - self.peers_refreshed >= BACKPLANE_PEER_REFRESH:
+            self._refresh_peers()
+        await self._send_all(_encode({"o": self.node_id, "c": channel, "m": message}))
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if self.sender is not None:
+            self.sender.close()
+            self.sender = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _refresh_peers(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        self.peers = {
+            os.path.join(self.directory, name)
+            for name in names
+            if name.endswith(".sock") and os.path.join(self.directory, name) != self.path
+        }
+        self.peers_refreshed = time.monotonic()
+
+    async def _send_all(self, data: bytes):
+        for path in list(self.peers):
+            try:
+                await self._send(path, data)
+            except ConnectionRefusedError:
+                # Worker to'xtagan, eski soket faylini tozalaymiz
+                self.peers.discard(path)
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except FileNotFoundError:
+                self.peers.discard(path)
+            except OSError as error:
+                self.dropped += 1
+                logger.warning("Backplane xabari %s ga yuborilmadi: %s", path, error)
+
+    async def _send(self, path: str, data: bytes):
+        while True:
+            try:
+                for datagram in self._split(data):
+                    await self._sendto(datagram, path)
+                return
+            except OSError as error:
+                if error.errno != errno.EMSGSIZE or self.max_datagram <= _MIN_DATAGRAM:
+                    raise
+                # Platformaning datagramma chegarasi kichikroq (masalan macOS): bo'laklar kichraytiriladi
+                self.max_datagram = max(self.max_datagram // 2, _MIN_DATAGRAM)
+
+    async def _sendto(self, datagram: bytes, path: str):
+        for attempt in range(_SEND_RETRIES):
+            try:
+                self.sender.sendto(datagram, path)
+                return
+            except BlockingIOError:
+                # Qabul qiluvchining navbati to'la, u bo'shashini qisqa kutamiz
+                await asyncio.sleep(0.001 * (attempt + 1))
+        raise BlockingIOError(errno.EAGAIN, "Qabul qiluvchi navbati to'la")
+
+    def _split(self, data: bytes) -> List[bytes]:
+        if len(data) <= self.max_datagram:
+            return [data]
+        size = self.max_datagram - 1 - _FRAGMENT_HEADER.size
+        chunks = [data[offset:offset + size] for offset in range(0, len(data), size)]
+        message_id = uuid.uuid4().bytes
+        return [
+            _FRAGMENT + _FRAGMENT_HEADER.pack(message_id, index, len(chunks)) + chunk
+            for index, chunk in enumerate(chunks)
+        ]
+
+    def _reassemble(self, datagram: bytes) -> Optional[bytes]:
+        if len(datagram) < 1 + _FRAGMENT_HEADER.size:
+            return None
+        message_id, index, total = _FRAGMENT_HEADER.unpack_from(datagram, 1)
+        partial = self.partial.get(message_id)
+        if partial is None:
+            now = time.monotonic()
+            # Yuboruvchisi to'xtab qolgan chala xabarlar tashlanadi
+            for key in [key for key, item in self.partial.items() if now - item.started > _FRAGMENT_TTL]:
+                del self.partial[key]
+            partial = self.partial[message_id] = _PartialMessage(now, total)
+        if index >= len(partial.parts) or partial.parts[index] is not None:
+            return None
+        partial.parts[index] = datagram[1 + _FRAGMENT_HEADER.size:]
+        partial.remaining -= 1
+        if partial.remaining:
+            return None
+        del self.partial[message_id]
+        return b"".join(partial.parts)
+
+    def _received(self, data: bytes):
+        if data[:1] == _FRAGMENT:
+            data = self._reassemble(data)
+            if data is None:
+                return
+        try:
+            envelope = json.loads(data)
+        except ValueError:
+            return
+        if envelope.get("o") == self.node_id:
+            return
+        if "h" in envelope:
+            if os.path.dirname(envelope["h"]) == self.directory:
+                self.peers.add(envelope["h"])
+            return
+        if envelope.get("c") not in self.channels:
+            return
+        self.inbox.put_nowait((envelope["c"], envelope["m"]))
+
+    async def _read_inbox(self):
+        while True:
+            channel, message = await self.inbox.get()
+            await self._dispatch(channel, message)
+
+
+BACKPLANE_DRIVERS: Dict[str, Callable[[str], Backplane]] = {
+    "local": lambda url: InProcessBackplane(),
+    "unix": lambda url: UnixSocketBackplane(url.split("://", 1)[1]),
+}
+
+
+def register_driver(scheme: str, factory: Callable[[str], Backplane]):
+    """Tashqi broker drayverini ro'yxatdan o'tkazish"""
+    BACKPLANE_DRIVERS[scheme] = factory
+
+
+def create_backplane(url: Optional[str] = None) -> Backplane:
+    url = url or BACKPLANE_URL
+    scheme = url.split("://", 1)[0]
+    if scheme not in BACKPLANE_DRIVERS:
+        raise ValueError(f"Noma'lum backplane drayveri: {scheme}")
+    return BACKPLANE_DRIVERS[scheme](url)
@@ -0,0 +1,77 @@
+import os
+import re
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Tuple
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from services.storage import sha256_file
+
+
+# Xesh bo'yicha nomlangan fayllar hech qachon o'zgarmaydi
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+# "<sha256>.ext" fayllar va ulardan olingan "<sha256>_<o'lcham>.jpg" thumbnail'lar
+_CONTENT_ADDRESSED = re.compile(r"^([0-9a-f]{64})(_\d+)?(\.[A-Za-z0-9]+)?$")
+
+# Eski (UUID nomli) fayllar uchun hisoblangan xeshlar: path -> (mtime, size, sha256)
+_etag_cache: Dict[str, Tuple[float, int, str]] = {}
+
+
+async def content_etag(path: str, filename: str, stat: os.stat_result) -> Tuple[str, bool]:
+    """Fayl tarkibidan kuchli ETag hosil qilish; ikkinchi qiymat fayl o'zgarmasligini bildiradi"""
+    match = _CONTENT_ADDRESSED.match(filename)
+    if match:
+        return f'"{match.group(1)}{match.group(2) or ""}"', True
+    cached = _etag_cache.get(path)
+    if cached is None or cached[0] != stat.st_mtime or cached[1] != stat.st_size:
+        digest = await run_in_threadpool(sha256_file, path)
+        cached = (stat.st_mtime, stat.st_size, digest)
+        _etag_cache[path] = cached
+    return f'"{cached[2]}"', False
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    # If-None-Match uchun zaif taqqoslash ham yetarli
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def conditional_file_response(request: Request, path: str, filename: str) -> Response:
+    """ETag va shartli GET (304) bilan fayl javobi.
+
+    Range, If-Range va multipart/byteranges'ni Starlette'ning FileResponse'i
+    bajaradi; If-Range u bilan ishlashi uchun kontent ETag'i sarlavhaga
+    oldindan qo'yiladi.
+    """
+    stat = await run_in_threadpool(os.stat, path)
+    etag, immutable = await content_etag(path, filename, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if _not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
@@ -0,0 +1,137 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import bindparam, func, or_, select, tuple_, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Conversation, ConversationParticipant, Message, User
+
+
+# Har bir suhbat uchun ko'rsatiladigan ishtirokchilar soni
+INBOX_PARTICIPANT_PREVIEW = 3
+
+_conversations = Conversation.__table__
+
+
+async def touch_conversations(db: AsyncSession, messages: Iterable[Tuple[int, int, datetime]]):
+    """Yangi yozilgan (conversation_id, message_id, timestamp) xabarlar bo'yicha suhbatning oxirgi xabari va faollik vaqtini yangilash"""
+    latest: Dict[int, Tuple[int, datetime]] = {}
+    for conversation_id, message_id, timestamp in messages:
+        if conversation_id not in latest or latest[conversation_id][0] < message_id:
+            latest[conversation_id] = (message_id, timestamp)
+    if not latest:
+        return
+
+    await db.execute(
+        update(_conversations)
+        .where(
+            _conversations.c.id == bindparam("b_conversation_id"),
+            or_(
+                _conversations.c.last_message_id.is_(None),
+                _conversations.c.last_message_id < bindparam("b_message_id")
+            )
+        )
+        .values(last_message_id=bindparam("b_message_id"), last_activity_at=bindparam("b_timestamp")),
+        [
+            {"b_conversation_id": conversation_id, "b_message_id": message_id, "b_timestamp": timestamp}
+            for conversation_id, (message_id, timestamp) in latest.items()
+        ]
+    )
+
+
+async def get_inbox(
+    db: AsyncSession,
+    user_id: int,
+    after: Optional[Tuple[datetime, int]],
+    limit: int
+) -> List[dict]:
+    """Foydalanuvchi suhbatlarini oxirgi xabar, o'qilmaganlar soni va ishtirokchilar bilan olish.
+
+    Suhbatlar faollik bo'yicha (yangisi oldin) saralanadi; `after` oldingi
+    sahifaning oxirgi (last_activity_at, id) juftligi. Oxirgi xabar
+    suhbatdagi last_message_id orqali bog'lanadi, shuning uchun xabarlar
+    jadvali skanerlanmaydi.
+    """
+    sender = aliased(User)
+    member_count = (
+        select(func.count(ConversationParticipant.id))
+        .where(ConversationParticipant.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Conversation,
+            ConversationParticipant.last_read_message_id,
+            ConversationParticipant.unread_count,
+            Message,
+            sender.name.label("sender_name"),
+            member_count.label("participant_count")
+        )
+        .join(ConversationParticipant, ConversationParticipant.conversation_id == Conversation.id)
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
+        .outerjoin(sender, sender.id == Message.sender_id)
+        .where(ConversationParticipant.user_id == user_id)
+    )
+    if after is not None:
+        query = query.where(tuple_(Conversation.last_activity_at, Conversation.id) < tuple_(*after))
+    query = query.order_by(Conversation.last_activity_at.desc(), Conversation.id.desc()).limit(limit)
+
+    rows = (await db.execute(query)).all()
+    previews = await _participant_previews(db, [row.Conversation.id for row in rows])
+
+    inbox = []
+    for row in rows:
+        conversation, message = row.Conversation, row.Message
+        inbox.append({
+            "id": conversation.id,
+            "name": conversation.name,
+            "is_group": conversation.is_group,
+            "created_by": conversation.created_by,
+            "created_at": conversation.created_at,
+            "last_activity_at": conversation.last_activity_at,
+            "last_read_message_id": row.last_read_message_id,
+            "unread_count": row.unread_count,
+            "last_message": None if message is None else {
+                "id": message.id,
+                "content": message.content,
+                "sender_id": message.sender_id,
+                "sender_name": row.sender_name,
+                "timestamp": message.timestamp,
+                "file_type": message.file_type,
+            },
+            "participants": {
+                "count": row.participant_count,
+                "users": previews.get(conversation.id, []),
+            },
+        })
+    return inbox
+
+
+async def _participant_previews(db: AsyncSession, conversation_ids: List[int]) -> Dict[int, List[dict]]:
+    """Sahifadagi barcha suhbatlar uchun bir nechta ishtirokchini bitta so'rovda olish"""
+    if not conversation_ids:
+        return {}
+    position = func.row_number().over(
+        partition_by=ConversationParticipant.conversation_id,
+        order_by=ConversationParticipant.id
+    ).label("position")
+    ranked = (
+        select(
+            ConversationParticipant.conversation_id,
+            User.id.label("user_id"),
+            User.name,
+            position
+        )
+        .join(User, User.id == ConversationParticipant.user_id)
+        .where(ConversationParticipant.conversation_id.in_(conversation_ids))
+        .subquery()
+    )
+    result = await db.execute(
+        select(ranked.c.conversation_id, ranked.c.user_id, ranked.c.name)
+        .where(ranked.c.position <= INBOX_PARTICIPANT_PREVIEW)
+        .order_by(ranked.c.conversation_id, ranked.c.position)
+    )
+    previews: Dict[int, List[dict]] = {}
+    for conversation_id, participant_id, name in result.all():
+        previews.setdefault(conversation_id, []).append({"id": participant_id, "name": name})
+    return previews
@@ -0,0 +1,340 @@
+import os
+import json
+import math
+import shutil
+import asyncio
+import logging
+import warnings
+import subprocess
+import multiprocessing
+from typing import Callable, Dict, Iterable, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import AsyncSessionLocal
+from models import StoredFile
+from services.storage import UPLOAD_DIR
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = os.path.join(UPLOAD_DIR, ".media")
+THUMBNAIL_SIZES = (64, 320, 640)
+THUMBNAIL_URL = "/api/files/thumbnails/{name}"
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+# Navbat to'lsa yangi ishlar tashlab ketiladi; keyingi yuklashda qayta qo'yiladi
+MEDIA_MAX_PENDING = int(os.getenv("MEDIA_MAX_PENDING", "100"))
+# Bundan ko'p pikselli rasmlar ochilmaydi (dekompressiya bombasi ishchini OOM bilan o'ldirmasin)
+MEDIA_MAX_IMAGE_PIXELS = int(os.getenv("MEDIA_MAX_IMAGE_PIXELS", str(64 * 1024 * 1024)))
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".webm", ".mkv", ".avi"}
+
+os.makedirs(MEDIA_DIR, exist_ok=True)
+
+if Image is not None:
+    # Ishchi jarayonlar ham shu modulni import qiladi, chegara ularda ham amal qiladi
+    Image.MAX_IMAGE_PIXELS = MEDIA_MAX_IMAGE_PIXELS
+
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _encode83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value: int) -> float:
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, components_x: int = 4, components_y: int = 3) -> str:
+    """Rasm uchun BlurHash joy egallovchi satrini hisoblash"""
+    small = image.convert("RGB")
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in small.getdata()]
+
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                cos_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * cos_y
+                    pr, pg, pb = pixels[y * width + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += _encode83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _encode83(0, 1)
+    result += _encode83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    def quantise(value: float) -> int:
+        signed = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, int(signed * 9 + 9.5)))
+
+    for r, g, b in ac:
+        result += _encode83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return result
+
+
+def _probe_video(path: str) -> dict:
+    if shutil.which("ffprobe") is None:
+        return {}
+    output = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=width,height:format=duration",
+            "-of", "json", path
+        ],
+        capture_output=True, timeout=30, check=True
+    ).stdout
+    probe = json.loads(output or b"{}")
+    stream = (probe.get("streams") or [{}])[0]
+    duration = probe.get("format", {}).get("duration")
+    return {
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "duration": float(duration) if duration else None,
+    }
+
+
+def _video_frame(path: str, output: str) -> bool:
+    if shutil.which("ffmpeg") is None:
+        return False
+    result = subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-ss", "1", "-i", path, "-frames:v", "1", output],
+        capture_output=True, timeout=60
+    )
+    if result.returncode != 0 or not os.path.exists(output):
+        # Video 1 soniyadan qisqa bo'lishi mumkin
+        result = subprocess.run(
+            ["ffmpeg", "-v", "error", "-y", "-i", path, "-frames:v", "1", output],
+            capture_output=True, timeout=60
+        )
+    return result.returncode == 0 and os.path.exists(output)
+
+
+def process_media(path: str, sha256: str, kind: str) -> dict:
+    """Thumbnail, joy egallovchi va metama'lumotlarni hosil qilish (alohida jarayonda ishlaydi).
+
+    Natija sidecar JSON faylga yoziladi; u mavjud bo'lsa ish qayta
+    bajarilmaydi.
+    """
+    sidecar = os.path.join(MEDIA_DIR, f"{sha256}.json")
+    if os.path.exists(sidecar):
+        with open(sidecar) as file:
+            return json.load(file)
+
+    info = {"width": None, "height": None, "duration": None, "placeholder": None, "thumbnails": {}}
+    source = path
+    if kind == "video":
+        info.update(_probe_video(path))
+        frame = os.path.join(MEDIA_DIR, f"{sha256}_frame.jpg")
+        source = frame if _video_frame(path, frame) else None
+
+    if source is not None and Image is not None:
+        with warnings.catch_warnings():
+            # Pillow chegaradan 2 baravargacha oshganda faqat ogohlantiradi; bu ham xato bo'lsin
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            image = Image.open(source)
+        with image:
+            if kind == "image":
+                info["width"], info["height"] = image.size
+            info["placeholder"] = blurhash(image)
+            for size in THUMBNAIL_SIZES:
+                name = f"{sha256}_{size}.jpg"
+                thumbnail = image.convert("RGB")
+                thumbnail.thumbnail((size, size))
+                thumbnail.save(os.path.join(MEDIA_DIR, name), "JPEG", quality=80)
+                info["thumbnails"][str(size)] = THUMBNAIL_URL.format(name=name)
+        if source != path:
+            os.unlink(source)
+
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    with open(tmp, "w") as file:
+        json.dump(info, file)
+    os.replace(tmp, sidecar)
+    return info
+
+
+def media_kind(filename: str, content_type: Optional[str]) -> Optional[str]:
+    extension = os.path.splitext(filename)[1].lower()
+    if (content_type or "").startswith("image/") or extension in IMAGE_EXTENSIONS:
+        return "image"
+    if (content_type or "").startswith("video/") or extension in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+class MediaPipeline:
+    """Yuklangan media uchun fon ishlarini cheklangan jarayonlar pulida bajaruvchi.
+
+    Ishchilardan biri o'lsa (OOM, Pillow'dagi segfault) ProcessPoolExecutor
+    butunlay ishdan chiqadi va undagi barcha ishlar BrokenProcessPool bilan
+    tugaydi. Bunda pul qayta yaratiladi, zarar ko'rgan har bir ish esa
+    bir martalik alohida jarayonda qayta bajariladi: aybdor ish faqat
+    o'zini yiqitadi, qolganlari natija oladi.
+    """
+
+    def __init__(
+        self,
+        workers: int = MEDIA_WORKERS,
+        max_pending: int = MEDIA_MAX_PENDING,
+        job: Callable[[str, str, str], dict] = process_media,
+        session_factory=AsyncSessionLocal
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job = job
+        self.session_factory = session_factory
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.crashed = 0
+        self.pool_restarts = 0
+
+    def enqueue(self, filename: str, content_type: Optional[str]) -> bool:
+        """Ishni navbatga qo'yish; hech qachon kutmaydi"""
+        kind = media_kind(filename, content_type)
+        sha256 = filename[:64]
+        if kind is None or sha256 in self.in_flight:
+            return False
+        if len(self.in_flight) >= self.max_pending:
+            self.skipped += 1
+            return False
+        task = asyncio.get_running_loop().create_task(self._run(filename, sha256, kind))
+        self.in_flight[sha256] = task
+        return True
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        # Bir vaqtda bir nechta ish xato oladi, pul faqat bir marta almashtiriladi
+        if self.executor is executor:
+            self.executor = None
+            self.pool_restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_isolated(self, *args) -> dict:
+        executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, self.job, *args)
+        finally:
+            executor.shutdown(wait=False)
+
+    async def _run(self, filename: str, sha256: str, kind: str):
+        args = (os.path.join(UPLOAD_DIR, filename), sha256, kind)
+        try:
+            executor = self._executor()
+            try:
+                info = await asyncio.get_running_loop().run_in_executor(executor, self.job, *args)
+            except BrokenProcessPool:
+                logger.warning("Media jarayonlar puli ishdan chiqdi, qayta yaratiladi: %s", filename)
+                self._discard(executor)
+                info = await self._run_isolated(*args)
+            async with self.session_factory() as db:
+                await db.execute(
+                    update(StoredFile)
+                    .where(StoredFile.sha256 == sha256)
+                    .values(media_info=info)
+                )
+                await db.commit()
+            self.completed += 1
+        except BrokenProcessPool:
+            self.failed += 1
+            self.crashed += 1
+            logger.error("Media fayl qayta ishlovchi jarayonni yiqitdi: %s", filename)
+        except Exception:
+            self.failed += 1
+            logger.exception("Media faylni qayta ishlashda xatolik: %s", filename)
+        finally:
+            self.in_flight.pop(sha256, None)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.in_flight),
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "crashed": self.crashed,
+            "pool_restarts": self.pool_restarts,
+        }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+media_pipeline = MediaPipeline()
+
+
+def _stored_filename(file_url: Optional[str]) -> Optional[str]:
+    if not file_url or not file_url.startswith("/api/files/download/"):
+        return None
+    return file_url.rsplit("/", 1)[1]
+
+
+async def attach_media(db: AsyncSession, messages: Iterable) -> List:
+    """Xabarlarga fayllarining media ma'lumotlarini bitta so'rov bilan biriktirish"""
+    messages = list(messages)
+    names = set()
+    for message in messages:
+        file_url = message["file_url"] if isinstance(message, dict) else message.file_url
+        name = _stored_filename(file_url)
+        if name:
+            names.add(name)
+    if not names:
+        return messages
+
+    result = await db.execute(
+        select(StoredFile.filename, StoredFile.media_info)
+        .where(StoredFile.filename.in_(names), StoredFile.media_info.isnot(None))
+    )
+    media = dict(result.all())
+    for message in messages:
+        file_url = message["file_url"] if isinstance(message, dict) else message.file_url
+        info = media.get(_stored_filename(file_url))
+        if isinstance(message, dict):
+            message["media"] = info
+        else:
+            message.media = info
+    return messages
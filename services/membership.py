@@ -0,0 +1,149 @@
+import os
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import ConversationParticipant
+from services.backplane import Backplane
+
+
+# Xotirada saqlanadigan suhbatlar va foydalanuvchilar soni (LRU)
+MEMBERSHIP_CACHE_CONVERSATIONS = int(os.getenv("MEMBERSHIP_CACHE_CONVERSATIONS", "50000"))
+MEMBERSHIP_CACHE_USERS = int(os.getenv("MEMBERSHIP_CACHE_USERS", "50000"))
+
+MEMBERSHIP_CHANNEL = "membership"
+
+
+class MembershipCache:
+    """Suhbat a'zoligi indeksi: suhbat -> ishtirokchilar, foydalanuvchi -> suhbatlar.
+
+    Ruxsat tekshiruvlari lug'atdan o'qiladi, yo'q yozuvlar bazadan bitta
+    so'rov bilan yuklanadi. A'zolik o'zgarganda shu workerdagi yozuvlar
+    darhol yangilanadi (write-through), boshqa workerlarga esa backplane
+    orqali bekor qilish xabari yuboriladi.
+    """
+
+    def __init__(
+        self,
+        max_conversations: int = MEMBERSHIP_CACHE_CONVERSATIONS,
+        max_users: int = MEMBERSHIP_CACHE_USERS
+    ):
+        self.max_conversations = max_conversations
+        self.max_users = max_users
+        self.conversations: "OrderedDict[int, FrozenSet[int]]" = OrderedDict()
+        self.users: "OrderedDict[int, FrozenSet[int]]" = OrderedDict()
+        self.backplane: Optional[Backplane] = None
+        # Yuklash davomida bekor qilish bo'lsa, eskirgan natija saqlanmaydi
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _put(cache: OrderedDict, key: int, value: FrozenSet[int], limit: int):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _get(self, cache: OrderedDict, key: int) -> Optional[FrozenSet[int]]:
+        value = cache.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def members_many(self, db: AsyncSession, conversation_ids: Iterable[int]) -> Dict[int, FrozenSet[int]]:
+        """Bir nechta suhbat ishtirokchilari; keshda yo'qlari bitta so'rovda yuklanadi"""
+        found: Dict[int, FrozenSet[int]] = {}
+        missing = []
+        for conversation_id in conversation_ids:
+            members = self._get(self.conversations, conversation_id)
+            if members is None:
+                missing.append(conversation_id)
+            else:
+                found[conversation_id] = members
+        if not missing:
+            return found
+
+        generation = self.generation
+        result = await db.execute(
+            select(ConversationParticipant.conversation_id, ConversationParticipant.user_id)
+            .where(ConversationParticipant.conversation_id.in_(missing))
+        )
+        loaded: Dict[int, set] = {conversation_id: set() for conversation_id in missing}
+        for conversation_id, user_id in result.all():
+            loaded[conversation_id].add(user_id)
+        for conversation_id, members in loaded.items():
+            found[conversation_id] = frozenset(members)
+            if generation == self.generation:
+                self._put(self.conversations, conversation_id, found[conversation_id], self.max_conversations)
+        return found
+
+    async def members(self, db: AsyncSession, conversation_id: int) -> FrozenSet[int]:
+        return (await self.members_many(db, [conversation_id]))[conversation_id]
+
+    async def is_member(self, db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+        return user_id in await self.members(db, conversation_id)
+
+    async def conversations_of(self, db: AsyncSession, user_id: int) -> FrozenSet[int]:
+        conversations = self._get(self.users, user_id)
+        if conversations is not None:
+            return conversations
+        generation = self.generation
+        result = await db.execute(
+            select(ConversationParticipant.conversation_id)
+            .where(ConversationParticipant.user_id == user_id)
+        )
+        conversations = frozenset(result.scalars().all())
+        if generation == self.generation:
+            self._put(self.users, user_id, conversations, self.max_users)
+        return conversations
+
+    async def add_participants(self, conversation_id: int, user_ids: Iterable[int]):
+        """Yangi ishtirokchilar qo'shilgandan (commit'dan) keyin chaqiriladi"""
+        user_ids = frozenset(user_ids)
+        self.generation += 1
+        members = self.conversations.get(conversation_id)
+        if members is not None:
+            self.conversations[conversation_id] = members | user_ids
+        for user_id in user_ids:
+            conversations = self.users.get(user_id)
+            if conversations is not None:
+                self.users[user_id] = conversations | {conversation_id}
+        await self._publish(conversation_id, user_ids)
+
+    async def _publish(self, conversation_id: int, user_ids: FrozenSet[int]):
+        if self.backplane is not None:
+            await self.backplane.publish(
+                MEMBERSHIP_CHANNEL,
+                {"conversation_id": conversation_id, "user_ids": list(user_ids)}
+            )
+
+    def invalidate(self, conversation_id: Optional[int] = None, user_ids: Iterable[int] = ()):
+        self.generation += 1
+        if conversation_id is not None:
+            self.conversations.pop(conversation_id, None)
+        for user_id in user_ids:
+            self.users.pop(user_id, None)
+
+    async def on_remote(self, payload: dict):
+        """Boshqa workerda a'zolik o'zgardi: tegishli yozuvlar keyingi so'rovda qayta yuklanadi"""
+        self.invalidate(payload.get("conversation_id"), payload.get("user_ids", ()))
+
+    def clear(self):
+        self.generation += 1
+        self.conversations.clear()
+        self.users.clear()
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self.conversations),
+            "users": len(self.users),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+membership_cache = MembershipCache()
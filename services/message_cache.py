@@ -0,0 +1,226 @@
+import os
+import json
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from services.backplane import Backplane
+from schemas import MessageResponse
+
+
+# Har bir suhbat uchun xotirada saqlanadigan eng yangi xabarlar soni
+MESSAGE_CACHE_TAIL = int(os.getenv("MESSAGE_CACHE_TAIL", "100"))
+# Barcha suhbatlar uchun umumiy xotira chegarasi (taxminiy, baytlarda)
+MESSAGE_CACHE_MAX_BYTES = int(os.getenv("MESSAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+MESSAGE_CACHE_CHANNEL = "messages"
+
+# Har bir yozuvning JSON'dan tashqari taxminiy qo'shimcha xotirasi
+_ENTRY_OVERHEAD = 256
+
+Key = Tuple[datetime, int]
+
+
+class CachedMessage:
+    """JSON ko'rinishida oldindan serializatsiya qilingan xabar"""
+
+    __slots__ = ("key", "message", "data")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.key: Key = (datetime.fromisoformat(message["timestamp"]), message["id"])
+        self.data = json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode()
+
+    @classmethod
+    def from_row(cls, row) -> "CachedMessage":
+        return cls(MessageResponse.model_validate(row, from_attributes=True).model_dump(mode="json"))
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + _ENTRY_OVERHEAD
+
+    @property
+    def needs_media(self) -> bool:
+        return self.message.get("file_url") is not None and self.message.get("media") is None
+
+
+class ConversationTail:
+    """Suhbatning eng yangi xabarlari, (timestamp, id) bo'yicha tartiblangan.
+
+    Oyna doim suhbatning eng yangi xabarlaridan uzluksiz iborat; `has_older`
+    oynadan eskiroq xabarlar bazada qolganini bildiradi.
+    """
+
+    __slots__ = ("entries", "keys", "has_older", "size")
+
+    def __init__(self, entries: List[CachedMessage], has_older: bool):
+        self.entries = sorted(entries, key=lambda entry: entry.key)
+        self.keys = [entry.key for entry in self.entries]
+        self.has_older = has_older
+        self.size = sum(entry.size for entry in self.entries)
+
+    def add(self, entry: CachedMessage, capacity: int) -> int:
+        """Xabarni qo'shish; xotira o'zgarishini qaytaradi"""
+        if entry.key in self.keys[-capacity:]:
+            return 0
+        index = bisect_right(self.keys, entry.key)
+        self.keys.insert(index, entry.key)
+        self.entries.insert(index, entry)
+        delta = entry.size
+        while len(self.entries) > capacity:
+            self.keys.pop(0)
+            delta -= self.entries.pop(0).size
+            self.has_older = True
+        self.size += delta
+        return delta
+
+
+class RecentMessageCache:
+    """Faol suhbatlarning oxirgi xabarlari uchun xotiradagi halqa bufer.
+
+    Xabar yozilganda (WebSocket va REST, xabar yozuvchi bosqich orqali)
+    faqat oynasi allaqachon yuklangan suhbatlarga qo'shiladi va boshqa
+    workerlarga backplane orqali tarqatiladi. Oyna bazadan birinchi
+    o'qishda to'ldiriladi; umumiy xotira chegarasidan oshsa eng uzoq
+    ishlatilmagan suhbatlar chiqarib yuboriladi. Oynadan tashqaridagi
+    sahifalar uchun None qaytariladi - ular bazadan o'qiladi.
+    """
+
+    def __init__(self, capacity: int = MESSAGE_CACHE_TAIL, max_bytes: int = MESSAGE_CACHE_MAX_BYTES):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.tails: "OrderedDict[int, ConversationTail]" = OrderedDict()
+        self.size = 0
+        self.backplane: Optional[Backplane] = None
+        # Bazadan to'ldirilayotgan suhbatlar: shu vaqtda yangi xabar kelsa natija saqlanmaydi
+        self.filling: Dict[int, bool] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _touch(self, conversation_id: int) -> Optional[ConversationTail]:
+        tail = self.tails.get(conversation_id)
+        if tail is not None:
+            self.tails.move_to_end(conversation_id)
+        return tail
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.tails:
+            _, tail = self.tails.popitem(last=False)
+            self.size -= tail.size
+
+    def begin_fill(self, conversation_id: int):
+        self.filling.setdefault(conversation_id, False)
+
+    def fill(self, conversation_id: int, rows: Iterable, has_older: bool):
+        """Bazadan o'qilgan eng yangi xabarlar bilan oynani yaratish"""
+        if self.filling.pop(conversation_id, True):
+            # To'ldirish davomida yangi xabar yozildi, o'qilgan natija eskirgan bo'lishi mumkin
+            return
+        tail = ConversationTail([CachedMessage.from_row(row) for row in rows], has_older)
+        previous = self.tails.pop(conversation_id, None)
+        if previous is not None:
+            self.size -= previous.size
+        self.tails[conversation_id] = tail
+        self.size += tail.size
+        self._evict()
+
+    def _add(self, messages: Iterable[dict]):
+        for message in messages:
+            conversation_id = message["conversation_id"]
+            if conversation_id in self.filling:
+                self.filling[conversation_id] = True
+            tail = self._touch(conversation_id)
+            if tail is not None:
+                self.size += tail.add(CachedMessage(message), self.capacity)
+        self._evict()
+
+    async def add(self, rows: Iterable):
+        """Yangi yozilgan xabarlarni qo'shish va boshqa workerlarga tarqatish"""
+        messages = [
+            MessageResponse.model_validate(row, from_attributes=True).model_dump(mode="json")
+            for row in rows
+        ]
+        self._add(messages)
+        if self.backplane is not None and messages:
+            await self.backplane.publish(MESSAGE_CACHE_CHANNEL, {"messages": messages})
+
+    async def on_remote(self, payload: dict):
+        self._add(payload["messages"])
+
+    def page(
+        self,
+        conversation_id: int,
+        before: Optional[Key],
+        after: Optional[Key],
+        limit: int,
+        backward: bool
+    ) -> Optional[Tuple[List[CachedMessage], bool]]:
+        """Keshdan sahifa: (xabarlar, yana bormi) yoki oynadan tashqarida bo'lsa None"""
+        tail = self._touch(conversation_id)
+        if tail is None:
+            self.misses += 1
+            return None
+
+        if backward:
+            end = bisect_left(tail.keys, before) if before is not None else len(tail.entries)
+            if end > limit:
+                page, has_more = tail.entries[end - limit:end], True
+            elif not tail.has_older:
+                page, has_more = tail.entries[:end], False
+            else:
+                self.misses += 1
+                return None
+        else:
+            if tail.has_older and (after is None or not tail.keys or after < tail.keys[0]):
+                self.misses += 1
+                return None
+            start = bisect_right(tail.keys, after) if after is not None else 0
+            page, has_more = tail.entries[start:start + limit], len(tail.entries) - start > limit
+
+        self.hits += 1
+        return page, has_more
+
+    def after_seq(self, conversation_id: int, seq: int) -> Optional[List[dict]]:
+        """`seq` dan keyingi xabarlar; oyna ularning hammasini qamramasa None.
+
+        Tartib raqamlari oraliqsiz bo'lgani uchun to'liqlik soni bo'yicha
+        tekshiriladi: oynadagi seq > `seq` xabarlar soni eng katta seq
+        bilan farqqa teng bo'lishi kerak.
+        """
+        tail = self._touch(conversation_id)
+        if tail is None:
+            return None
+        numbered = [entry.message for entry in tail.entries if entry.message.get("seq") is not None]
+        if not numbered:
+            return None if tail.has_older or tail.entries else []
+        newer = [message for message in numbered if message["seq"] > seq]
+        if not newer:
+            return []
+        newer.sort(key=lambda message: message["seq"])
+        if newer[-1]["seq"] - seq != len(newer):
+            return None
+        return newer
+
+    def replace(self, conversation_id: int, entries: List[CachedMessage]):
+        """Media ma'lumoti qo'shilgan xabarlarni oynada yangilash"""
+        tail = self.tails.get(conversation_id)
+        if tail is None:
+            return
+        for entry in entries:
+            index = bisect_left(tail.keys, entry.key)
+            if index < len(tail.keys) and tail.keys[index] == entry.key:
+                delta = entry.size - tail.entries[index].size
+                tail.entries[index] = entry
+                tail.size += delta
+                self.size += delta
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self.tails),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+message_cache = RecentMessageCache()
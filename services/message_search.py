@@ -0,0 +1,93 @@
+import html
+from typing import List
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import ConversationParticipant, Message
+
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+# Baza snippet'ni shu belgilar bilan ajratadi; matn HTML uchun ekranlangach ular
+# <mark> teglariga almashtiriladi, shuning uchun xabar ichidagi teglar ishlamaydi
+_SENTINEL_START = "\x02"
+_SENTINEL_END = "\x03"
+
+# Indeks ifodasi bilan bir xil bo'lishi kerak, aks holda Postgres GIN indeksdan foydalanmaydi
+_TS_CONFIG = literal_column("'simple'::regconfig")
+
+_SQLITE_SEARCH = text(
+    "SELECT m.id, m.conversation_id, m.sender_id, m.timestamp, "
+    "snippet(messages_fts, 0, :start, :end, '...', 16) AS snippet "
+    "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+    "WHERE messages_fts MATCH :query "
+    "AND m.conversation_id IN ("
+    "SELECT conversation_id FROM conversation_participants WHERE user_id = :user_id) "
+    "ORDER BY bm25(messages_fts), m.id DESC "
+    "LIMIT :limit OFFSET :offset"
+)
+
+
+def _highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(_SENTINEL_START, HIGHLIGHT_START)
+        .replace(_SENTINEL_END, HIGHLIGHT_END)
+    )
+
+
+def _results(result) -> List[dict]:
+    return [{**row._mapping, "snippet": _highlight(row.snippet)} for row in result]
+
+
+def _fts5_query(query: str) -> str:
+    """Foydalanuvchi matnini FTS5 sintaksisiga xavfsiz o'girish"""
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    # Oxirgi so'z yozilayotgan bo'lishi mumkin, shuning uchun prefiks sifatida qidiriladi
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+async def search_messages(db: AsyncSession, user_id: int, query: str, offset: int, limit: int) -> List[dict]:
+    """Foydalanuvchi a'zo bo'lgan suhbatlardagi xabarlarni matn bo'yicha qidirish"""
+    if not query.split():
+        return []
+
+    if db.get_bind().dialect.name == "sqlite":
+        result = await db.execute(_SQLITE_SEARCH, {
+            "start": _SENTINEL_START,
+            "end": _SENTINEL_END,
+            "query": _fts5_query(query),
+            "user_id": user_id,
+            "limit": limit,
+            "offset": offset,
+        })
+        return _results(result)
+
+    tsquery = func.websearch_to_tsquery(_TS_CONFIG, query)
+    vector = func.to_tsvector(_TS_CONFIG, Message.content)
+    snippet = func.ts_headline(
+        _TS_CONFIG,
+        Message.content,
+        tsquery,
+        f'StartSel="{_SENTINEL_START}", StopSel="{_SENTINEL_END}", MaxWords=24, MinWords=8'
+    )
+    user_conversations = select(ConversationParticipant.conversation_id)\
+        .where(ConversationParticipant.user_id == user_id)
+    result = await db.execute(
+        select(
+            Message.id,
+            Message.conversation_id,
+            Message.sender_id,
+            Message.timestamp,
+            snippet.label("snippet")
+        )
+        .where(
+            vector.op("@@")(tsquery),
+            Message.conversation_id.in_(user_conversations)
+        )
+        .order_by(func.ts_rank(vector, tsquery).desc(), Message.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+    return _results(result)
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import insert
+from db import AsyncSessionLocal
+from models import Message
+from services.read_state import record_sent
+from services.inbox import touch_conversations
+from services.message_cache import message_cache
+from services.sync import allocate_seqs
+from services.metrics import MESSAGES_PERSISTED, WRITE_BATCH_DURATION, WRITE_BATCH_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+# Bitta tranzaksiyada yoziladigan eng ko'p xabarlar soni va yig'ish oynasi
+MESSAGE_BATCH_SIZE = int(os.getenv("MESSAGE_BATCH_SIZE", "200"))
+MESSAGE_BATCH_DELAY_MS = float(os.getenv("MESSAGE_BATCH_DELAY_MS", "5"))
+
+Pending = Tuple[dict, asyncio.Future]
+
+
+class MessageWriter:
+    """Xabarlarni guruhlab (group commit) yozuvchi bosqich.
+
+    Barcha ulanishlardan kelgan xabarlar bir necha millisekund yoki
+    `max_batch` tagacha yig'iladi, bitta ko'p qatorli INSERT ... RETURNING
+    va bitta commit bilan yoziladi, so'ng har bir yuboruvchiga id va vaqt
+    qaytariladi.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_batch: int = MESSAGE_BATCH_SIZE,
+        max_delay_ms: float = MESSAGE_BATCH_DELAY_MS
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue()
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, **values) -> dict:
+        """Xabarni navbatga qo'yish va yozilgach uning qatorini qaytarish"""
+        self._ensure_started()
+        values.setdefault("is_read", False)
+        values.setdefault("timestamp", datetime.utcnow())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((values, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            if self.queue.qsize() + 1 < self.max_batch:
+                await asyncio.sleep(self.max_delay)
+            stopping = False
+            while len(batch) < self.max_batch and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Pending]):
+        started = time.perf_counter()
+        try:
+            rows = await self._insert([values for values, _ in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                self._fail(batch, error)
+                return
+            # Bitta noto'g'ri xabar butun guruhni yiqitmasligi uchun alohida yozamiz
+            logger.warning("Guruhli yozish muvaffaqiyatsiz, xabarlar alohida yoziladi: %s", error)
+            for item in batch:
+                await self._flush([item])
+            return
+        WRITE_BATCH_DURATION.observe(time.perf_counter() - started)
+        WRITE_BATCH_SIZE.observe(len(batch))
+        MESSAGES_PERSISTED.inc(len(batch))
+
+        written = [{**values, "id": row.id, "timestamp": row.timestamp, "seq": row.seq} for (values, _), row in zip(batch, rows)]
+        for (_, future), message in zip(batch, written):
+            if not future.done():
+                future.set_result(message)
+        try:
+            await message_cache.add(written)
+        except Exception:
+            logger.exception("Xabarlar keshini yangilashda xatolik")
+
+    async def _insert(self, rows: List[dict]):
+        async with self.session_factory() as db:
+            # SQLite qaytarilgan qatorlar tartibini kafolatlay olmaydi va
+            # sort_by_parameter_order bilan har bir qatorni alohida yozadi;
+            # u yerda bitta INSERT ichidagi id lar VALUES tartibida beriladi
+            sqlite = db.get_bind().dialect.name == "sqlite"
+            seqs = await allocate_seqs(db, [values["conversation_id"] for values in rows])
+            result = await db.execute(
+                insert(Message).returning(
+                    Message.id,
+                    Message.timestamp,
+                    Message.seq,
+                    sort_by_parameter_order=not sqlite
+                ),
+                [{**values, "seq": seq} for values, seq in zip(rows, seqs)]
+            )
+            inserted = result.all()
+            if sqlite:
+                inserted.sort(key=lambda row: row.id)
+            # O'qilmaganlar hisoblagichlari xabarlar bilan bitta tranzaksiyada
+            await record_sent(db, [
+                (values["conversation_id"], values["sender_id"], row.id)
+                for values, row in zip(rows, inserted)
+            ])
+            await touch_conversations(db, [
+                (values["conversation_id"], row.id, row.timestamp)
+                for values, row in zip(rows, inserted)
+            ])
+            await db.commit()
+        return inserted
+
+    @staticmethod
+    def _fail(batch: List[Pending], error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self):
+        """Navbatdagi xabarlarni yozib, fon taskini to'xtatish"""
+        if self.task is None or self.task.done():
+            return
+        self.queue.put_nowait(None)
+        await self.task
+        self.task = None
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,255 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Prometheus matn formati versiyasi
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Standart bucketlar (sekundlarda)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Faqat o'suvchi hisoblagich"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in list(self.values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Oldindan belgilangan bucketli gistogramma.
+
+    Kuzatishda faqat bitta bisect va ikkita qo'shish bajariladi; bucketlar
+    kumulyativ ko'rinishga faqat /metrics so'ralganda keltiriladi.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket1, ..., bucketN, +Inf, yig'indi]
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, counts in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class StatsCollector(Metric):
+    """Mavjud `stats()` lug'atlarini so'ralgan paytda metrikaga aylantiruvchi.
+
+    Har bir sonli kalit `<prefix>_<kalit>` nomli alohida metrika bo'ladi;
+    issiq yo'lda hech qanday qo'shimcha ish qilinmaydi.
+    """
+
+    def __init__(self, prefix: str, documentation: str, stats: Callable[[], dict]):
+        super().__init__(prefix, documentation)
+        self.stats = stats
+
+    def header(self) -> List[str]:
+        return []
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, value in self.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{self.name}_{key}"
+            lines.append(f"# HELP {name} {self.documentation}: {key}")
+            lines.append(f"# TYPE {name} {self.type}")
+            lines.append(f"{name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            samples = metric.samples()
+            if samples or metric.type != "untyped":
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Sequence[str] = (),
+    buckets: Sequence[float] = LATENCY_BUCKETS
+) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def register_stats(prefix: str, documentation: str, stats: Callable[[], dict]):
+    registry.register(StatsCollector(prefix, documentation, stats))
+
+
+def render() -> str:
+    return registry.render()
+
+
+# Qiymatlar har bir worker jarayoni uchun alohida. Hisoblagichlar qulfsiz:
+# event loop bitta oqimda ishlaydi, sinxron sessiyalar oqimlarida esa
+# kamdan-kam yo'qolgan qo'shish o'lchov uchun ahamiyatsiz.
+HTTP_REQUESTS = counter("chat_http_requests_total", "HTTP so'rovlar soni", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = histogram("chat_http_request_duration_seconds", "HTTP so'rovlar davomiyligi", ("method", "route"))
+BROADCAST_DURATION = histogram("chat_broadcast_duration_seconds", "Suhbatga tarqatish (mahalliy navbatlar va backplane) davomiyligi")
+BROADCAST_FANOUT = histogram("chat_broadcast_fanout", "Bitta tarqatishda shu workerdagi qabul qiluvchi ulanishlar", buckets=SIZE_BUCKETS)
+MESSAGES_PERSISTED = counter("chat_messages_persisted_total", "Bazaga yozilgan xabarlar")
+WRITE_BATCH_SIZE = histogram("chat_message_batch_size", "Bitta tranzaksiyada yozilgan xabarlar", buckets=SIZE_BUCKETS)
+WRITE_BATCH_DURATION = histogram("chat_message_batch_duration_seconds", "Xabarlar guruhini yozish davomiyligi")
+DB_POOL_WAIT = histogram("chat_db_pool_checkout_seconds", "Puldan ulanish olishni kutish vaqti", ("engine",), QUERY_BUCKETS)
+DB_QUERY_DURATION = histogram("chat_db_query_duration_seconds", "SQL so'rovlar davomiyligi", ("engine", "operation"), QUERY_BUCKETS)
+
+
+class MetricsMiddleware:
+    """HTTP so'rovlarini marshrut shabloni bo'yicha o'lchovchi ASGI middleware.
+
+    Yorliq sifatida `/api/chat/conversations/{conversation_id}` kabi shablon
+    olinadi, shuning uchun yorliqlar soni marshrutlar soni bilan chegaralangan.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = _route_template(scope)
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, (method, path))
+            HTTP_REQUESTS.inc(1, (method, path, str(status_code)))
+
+
+def _route_template(scope) -> str:
+    # Yangi FastAPI'da scope["route"] ulangan router prefiksisiz bo'ladi,
+    # to'liq shablon effective_route_context da saqlanadi
+    route = scope.get("fastapi", {}).get("effective_route_context") or scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+def instrument_engine(engine, name: str):
+    """SQLAlchemy (sinxron) engine'iga so'rov davomiyligi hodisalarini ulash"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts: Optional[list] = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH"):
+            operation = "OTHER"
+        DB_QUERY_DURATION.observe(time.perf_counter() - starts.pop(), (name, operation))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # Xatoli so'rov uchun after_cursor_execute chaqirilmaydi
+        if context.connection is not None:
+            starts = context.connection.info.get("metrics_query_start")
+            if starts:
+                starts.pop()
@@ -0,0 +1,52 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, List, Optional
+from fastapi import HTTPException, status
+
+
+def encode_cursor(*values: Any) -> str:
+    """Kursor qiymatlarini URL uchun xavfsiz satrga o'girish"""
+    data = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list):
+            raise ValueError(cursor)
+        return values
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Noto'g'ri kursor"
+        )
+
+
+def decode_message_cursor(cursor: str):
+    """(timestamp, id) juftligidan iborat xabar kursorini o'qish"""
+    values = decode_cursor(cursor)
+    try:
+        timestamp, message_id = values
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Noto'g'ri kursor"
+        )
+
+
+def decode_offset_cursor(cursor: Optional[str]) -> int:
+    """Reyting bo'yicha saralangan natijalar uchun siljish (offset) kursorini o'qish"""
+    if not cursor:
+        return 0
+    values = decode_cursor(cursor)
+    if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Noto'g'ri kursor"
+        )
+    return values[0]
@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+from services.backplane import Backplane
+
+
+logger = logging.getLogger(__name__)
+
+# Worker o'z foydalanuvchilarini shu muddatda qayta e'lon qilmasa ular offline hisoblanadi
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "60"))
+# Oxirgi ulanish uzilgach offline deb e'lon qilishdan oldin kutiladigan vaqt
+PRESENCE_GRACE = float(os.getenv("PRESENCE_GRACE", "10"))
+# O'zgarishlar shu oraliqda yig'ilib, bitta freymda yuboriladi
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "1"))
+
+PRESENCE_CHANNEL = "presence"
+
+# Presence o'zgarishlarini oluvchi ulanish
+Watcher = Hashable
+Send = Callable[[dict, Watcher], Awaitable[None]]
+
+
+class PresenceService:
+    """Workerlar bo'ylab foydalanuvchilarning online holati.
+
+    Har bir worker o'ziga ulangan foydalanuvchilarni TTL bilan backplane
+    orqali e'lon qilib turadi (heartbeat); worker o'chib qolsa uning
+    yozuvlari TTL tugagach o'z-o'zidan eskiradi. Holat o'zgarishlari
+    darhol emas, har `interval` da hisoblanadi: qisqa uzilib-ulanishlar
+    (grace oralig'ida) hech qanday freym hosil qilmaydi, qolganlari esa
+    har bir kuzatuvchiga bitta {"type": "presence", "online", "offline"}
+    freymi bo'lib boradi.
+    """
+
+    def __init__(
+        self,
+        backplane: Backplane,
+        send: Send,
+        ttl: float = PRESENCE_TTL,
+        grace: float = PRESENCE_GRACE,
+        interval: float = PRESENCE_FLUSH_INTERVAL
+    ):
+        self.backplane = backplane
+        self.send = send
+        self.ttl = ttl
+        self.grace = grace
+        self.interval = interval
+        # Shu workerdagi ochiq ulanishlar soni
+        self.local_connections: Dict[int, int] = {}
+        # user_id -> {node_id: amal qilish muddati}
+        self.expires: Dict[int, Dict[str, float]] = {}
+        # Kuzatuvchilarga oxirgi marta e'lon qilingan online foydalanuvchilar
+        self.online: Set[int] = set()
+        self.last_seen: Dict[int, float] = {}
+        self.watchers: Dict[int, Set[Watcher]] = {}
+        self.interests: Dict[Watcher, Set[int]] = {}
+        # Backplane'ga hali e'lon qilinmagan mahalliy yozuvlar
+        self.dirty: Dict[int, float] = {}
+        self.last_refresh = 0.0
+        self.task: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def _set_local(self, user_id: int, expires_at: float):
+        self.expires.setdefault(user_id, {})[self.backplane.node_id] = expires_at
+        self.dirty[user_id] = expires_at
+
+    def is_online(self, user_id: int, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return any(expires_at > now for expires_at in self.expires.get(user_id, {}).values())
+
+    def connect(self, user_id: int, watcher: Watcher, watched: Iterable[int]) -> dict:
+        """Yangi ulanishni ro'yxatga olish; kuzatilayotganlarning hozirgi holatini qaytaradi"""
+        self._ensure_started()
+        self.local_connections[user_id] = self.local_connections.get(user_id, 0) + 1
+        self._set_local(user_id, time.time() + self.ttl)
+        self.watch(watcher, watched)
+        # Hali e'lon qilinmagan o'zgarishlar keyingi freymda keladi
+        return {
+            "type": "presence",
+            "online": [uid for uid in self.interests[watcher] if uid in self.online],
+            "offline": [],
+        }
+
+    def heartbeat(self, user_id: int):
+        if user_id in self.local_connections:
+            self._set_local(user_id, time.time() + self.ttl)
+
+    def disconnect(self, user_id: int, watcher: Watcher):
+        self.unwatch(watcher)
+        count = self.local_connections.get(user_id, 0) - 1
+        if count > 0:
+            self.local_connections[user_id] = count
+            return
+        self.local_connections.pop(user_id, None)
+        # Darhol offline qilinmaydi: grace ichida qayta ulansa o'zgarish bo'lmaydi
+        self._set_local(user_id, time.time() + self.grace)
+
+    def watch(self, watcher: Watcher, user_ids: Iterable[int]):
+        interest = self.interests.setdefault(watcher, set())
+        for user_id in user_ids:
+            interest.add(user_id)
+            self.watchers.setdefault(user_id, set()).add(watcher)
+
+    def unwatch(self, watcher: Watcher):
+        for user_id in self.interests.pop(watcher, ()):
+            watchers = self.watchers.get(user_id)
+            if watchers is not None:
+                watchers.discard(watcher)
+                if not watchers:
+                    del self.watchers[user_id]
+
+    def snapshot(self, user_ids: Iterable[int]) -> List[dict]:
+        now = time.time()
+        states = []
+        for user_id in user_ids:
+            online = self.is_online(user_id, now)
+            last_seen = self.last_seen.get(user_id)
+            states.append({
+                "user_id": user_id,
+                "online": online,
+                "last_seen": None if online or last_seen is None else datetime.utcfromtimestamp(last_seen),
+            })
+        return states
+
+    async def on_remote(self, payload: dict):
+        node_id = payload["node_id"]
+        for user_id, expires_at in payload["expires"].items():
+            self.expires.setdefault(int(user_id), {})[node_id] = expires_at
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._tick()
+            except Exception:
+                logger.exception("Presence holatini yangilashda xatolik")
+
+    async def _tick(self):
+        now = time.time()
+        # Ochiq ulanishlar tirik: uvicorn ping/pong bilan o'lik ulanishlarni yopadi
+        if now - self.last_refresh >= self.ttl / 3:
+            self.last_refresh = now
+            for user_id in self.local_connections:
+                self._set_local(user_id, now + self.ttl)
+
+        if self.dirty:
+            dirty, self.dirty = self.dirty, {}
+            await self.backplane.publish(
+                PRESENCE_CHANNEL,
+                {"node_id": self.backplane.node_id, "expires": dirty}
+            )
+
+        went_online, went_offline = [], []
+        for user_id in list(self.expires):
+            nodes = self.expires[user_id]
+            for node_id in [node for node, expires_at in nodes.items() if expires_at <= now]:
+                del nodes[node_id]
+            if nodes and user_id not in self.online:
+                self.online.add(user_id)
+                went_online.append(user_id)
+            elif not nodes:
+                del self.expires[user_id]
+                if user_id in self.online:
+                    self.online.discard(user_id)
+                    self.last_seen[user_id] = now
+                    went_offline.append(user_id)
+
+        frames: Dict[Watcher, dict] = {}
+        for key, user_ids in (("online", went_online), ("offline", went_offline)):
+            for user_id in user_ids:
+                for watcher in self.watchers.get(user_id, ()):
+                    frame = frames.setdefault(watcher, {"type": "presence", "online": [], "offline": []})
+                    frame[key].append(user_id)
+        for watcher, frame in frames.items():
+            await self.send(frame, watcher)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -0,0 +1,223 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Har bir HTTP so'rov va WebSocket freymi uchun SQL so'rovlarni yozib borish (debug rejimi)
+QUERY_PROFILE = os.getenv("QUERY_PROFILE", "0") == "1"
+# Shundan sekin SELECT lar uchun EXPLAIN natijasi olinadi (0 - o'chirilgan)
+QUERY_PROFILE_EXPLAIN_MS = float(os.getenv("QUERY_PROFILE_EXPLAIN_MS", "0"))
+# Bitta so'rov ichida shuncha marta takrorlangan SQL N+1 deb belgilanadi
+QUERY_PROFILE_REPEAT_THRESHOLD = int(os.getenv("QUERY_PROFILE_REPEAT_THRESHOLD", "5"))
+
+_START_KEY = "query_profiler_start"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Marshrut yoki kod bloki ruxsat etilganidan ko'p SQL so'rov bajardi"""
+
+
+class QueryProfile:
+    """Bitta so'rov (yoki freym) davomida bajarilgan SQL so'rovlar.
+
+    Bir xil matn va parametrlar bilan qayta bajarilgan so'rovlar
+    "duplicate", faqat matni bir xil bo'lib `repeat_threshold` martadan
+    ko'p bajarilganlari esa N+1 ehtimoli sifatida ko'rsatiladi.
+    """
+
+    def __init__(self, name: str, repeat_threshold: int = QUERY_PROFILE_REPEAT_THRESHOLD):
+        self.name = name
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.total = 0.0
+        self.statements: Dict[str, int] = {}
+        self.executions: Dict[Tuple[str, str], int] = {}
+        self.slow: List[dict] = []
+
+    def record(self, statement: str, parameters, duration: float, plan: Optional[List[str]] = None):
+        self.count += 1
+        self.total += duration
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        key = (statement, repr(parameters))
+        self.executions[key] = self.executions.get(key, 0) + 1
+        if plan is not None:
+            self.slow.append({"statement": statement, "ms": round(duration * 1000, 3), "plan": plan})
+
+    @property
+    def duplicates(self) -> int:
+        """Aynan bir xil (matn va parametrlar) qayta bajarilgan so'rovlar soni"""
+        return sum(count - 1 for count in self.executions.values() if count > 1)
+
+    @property
+    def repeated(self) -> List[Tuple[str, int]]:
+        return sorted(
+            ((statement, count) for statement, count in self.statements.items() if count >= self.repeat_threshold),
+            key=lambda item: -item[1]
+        )
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "queries": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "duplicates": self.duplicates,
+            "n_plus_one": [
+                {"statement": _shorten(statement), "count": count}
+                for statement, count in self.repeated
+            ],
+            "slow": self.slow,
+        }
+
+    def headers(self) -> List[Tuple[bytes, bytes]]:
+        return [
+            (b"x-query-count", str(self.count).encode()),
+            (b"x-query-time-ms", f"{self.total * 1000:.3f}".encode()),
+            (b"x-query-duplicates", str(self.duplicates).encode()),
+            (b"x-query-repeated", str(len(self.repeated)).encode()),
+        ]
+
+    def log(self):
+        summary = self.summary()
+        if summary["n_plus_one"] or summary["duplicates"]:
+            logger.warning("SQL profil: %s", summary)
+        else:
+            logger.info("SQL profil: %s", summary)
+
+
+def _shorten(statement: str, limit: int = 200) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+# Faol profillar: ichma-ich bloklarda har bir so'rov hammasiga yoziladi
+_active: ContextVar[Tuple[QueryProfile, ...]] = ContextVar("query_profiles", default=())
+
+
+@contextmanager
+def profile_queries(name: str, enabled: bool = True) -> Iterator[Optional[QueryProfile]]:
+    """Blok ichidagi SQL so'rovlarni yozib borish; chiqishda xulosa log qilinadi"""
+    if not enabled:
+        yield None
+        return
+    profile = QueryProfile(name)
+    token = _active.set(_active.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+        profile.log()
+
+
+@contextmanager
+def query_budget(max_queries: int, name: str = "query_budget") -> Iterator[QueryProfile]:
+    """Blok `max_queries` dan ko'p so'rov bajarsa QueryBudgetExceeded (testlar uchun).
+
+        with query_budget(3):
+            await get_inbox(db, user_id, None, 30)
+
+    Ilova shu event loop ichida chaqirilganda ishlaydi (masalan httpx
+    ASGITransport); TestClient javoblari uchun assert_query_budget ishlatiladi.
+    """
+    profile = QueryProfile(name)
+    token = _active.set(_active.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active.reset(token)
+    if profile.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"{name}: {profile.count} ta so'rov (ruxsat {max_queries}); {profile.summary()}"
+        )
+
+
+def assert_query_budget(response, max_queries: int):
+    """QUERY_PROFILE=1 bilan ishlayotgan ilova javobidagi X-Query-Count ni tekshirish"""
+    count = response.headers.get("x-query-count")
+    if count is None:
+        raise AssertionError("Javobda X-Query-Count yo'q: QUERY_PROFILE=1 bilan ishga tushiring")
+    if int(count) > max_queries:
+        raise QueryBudgetExceeded(f"{count} ta so'rov (ruxsat {max_queries})")
+
+
+def _explain(conn, statement: str, parameters) -> Optional[List[str]]:
+    dialect = conn.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    try:
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as error:
+        return [f"EXPLAIN bajarilmadi: {error}"]
+
+
+def instrument_engine(engine):
+    """SQLAlchemy (sinxron) engine'iga profil hodisalarini ulash.
+
+    Faol profil bo'lmasa har bir so'rovga faqat bitta ContextVar o'qish qo'shiladi.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _active.get():
+            conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profiles = _active.get()
+        starts = conn.info.get(_START_KEY)
+        if not profiles or not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        plan = None
+        if (
+            QUERY_PROFILE_EXPLAIN_MS
+            and duration * 1000 >= QUERY_PROFILE_EXPLAIN_MS
+            and not executemany
+            and statement.lstrip()[:6].upper() in ("SELECT", "WITH")
+        ):
+            plan = _explain(conn, statement, parameters)
+        for profile in profiles:
+            profile.record(statement, parameters, duration, plan)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            starts = context.connection.info.get(_START_KEY)
+            if starts:
+                starts.pop()
+
+
+class QueryProfilerMiddleware:
+    """QUERY_PROFILE yoqilganda har bir HTTP so'rov uchun SQL xulosasini
+    X-Query-Count, X-Query-Time-Ms, X-Query-Duplicates va X-Query-Repeated
+    sarlavhalarida qaytaradi va log qiladi.
+
+    Sarlavhalar javob boshlanishida yoziladi; javob yuborilgandan keyingi
+    so'rovlar (masalan, sessiyani yopish) faqat logda ko'rinadi.
+    """
+
+    def __init__(self, app, enabled: bool = QUERY_PROFILE):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries(f"{scope['method']} {scope['path']}") as profile:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": list(message.get("headers", [])) + profile.headers()}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,116 @@
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Hashable, Tuple
+from fastapi import HTTPException, status
+
+
+# Har bir foydalanuvchi uchun xabarlar (WebSocket va REST birga): sekundiga va zaxira
+RATE_LIMIT_MESSAGES_PER_SECOND = float(os.getenv("RATE_LIMIT_MESSAGES_PER_SECOND", "5"))
+RATE_LIMIT_MESSAGES_BURST = float(os.getenv("RATE_LIMIT_MESSAGES_BURST", "20"))
+# Har bir WebSocket ulanishi uchun barcha kiruvchi freymlar (ping, read, subscribe ham)
+RATE_LIMIT_FRAMES_PER_SECOND = float(os.getenv("RATE_LIMIT_FRAMES_PER_SECOND", "20"))
+RATE_LIMIT_FRAMES_BURST = float(os.getenv("RATE_LIMIT_FRAMES_BURST", "60"))
+# Har bir foydalanuvchi uchun fayl yuklashlar (oddiy yuklash va sessiya ochish)
+RATE_LIMIT_UPLOADS_PER_SECOND = float(os.getenv("RATE_LIMIT_UPLOADS_PER_SECOND", "0.5"))
+RATE_LIMIT_UPLOADS_BURST = float(os.getenv("RATE_LIMIT_UPLOADS_BURST", "10"))
+# Chegaradan oshganda rad etishdan oldin so'rov ko'pi bilan shuncha sekund kutiladi
+RATE_LIMIT_MAX_DELAY = float(os.getenv("RATE_LIMIT_MAX_DELAY", "1"))
+# Xotiradagi chelaklar soni; eng uzoq ishlatilmaganlari chiqarib yuboriladi
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Kalit (foydalanuvchi yoki ulanish) bo'yicha token chelak cheklovchisi.
+
+    Chelak faqat murojaat qilinganda to'ldiriladi (lazy refill), fon
+    taymerlari yo'q. Tokenlar tugagach so'rov darhol rad etilmaydi: chelak
+    `max_delay` sekundlik qarzga kira oladi va so'rov shuncha kutib
+    o'tkaziladi (soft throttling); undan ortig'i rad etiladi. To'la
+    chelak yangi chelakdan farq qilmaydi, shuning uchun chelaklar LRU
+    tartibida saqlanadi va chegara oshganda eng eskisi o'chiriladi.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_delay: float = RATE_LIMIT_MAX_DELAY,
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS
+    ):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate va burst musbat bo'lishi kerak")
+        self.rate = rate
+        self.burst = burst
+        self.max_delay = max_delay
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self.allowed = 0
+        self.delayed = 0
+        self.rejected = 0
+
+    def check(self, key: Hashable, cost: float = 1) -> Tuple[bool, float]:
+        """(ruxsat, kutish): ruxsat bo'lsa necha sekund kutib bajarish, aks holda necha sekunddan keyin qayta urinish"""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        remaining = bucket.tokens - cost
+        if remaining >= 0:
+            bucket.tokens = remaining
+            self.allowed += 1
+            return True, 0.0
+        if -remaining <= self.max_delay * self.rate:
+            # Qarz keyingi to'ldirishlardan uziladi
+            bucket.tokens = remaining
+            self.delayed += 1
+            return True, -remaining / self.rate
+        self.rejected += 1
+        return False, (cost - bucket.tokens) / self.rate
+
+    async def limit(self, key: Hashable, cost: float = 1):
+        """REST so'rovlari uchun: kerak bo'lsa kutish yoki 429 bilan rad etish"""
+        allowed, wait = self.check(key, cost)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="So'rovlar juda ko'p, birozdan keyin qayta urinib ko'ring",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def forget(self, key: Hashable):
+        """Kalit endi ishlatilmaydi (masalan, ulanish yopildi): chelakni o'chirish"""
+        self.buckets.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self.buckets),
+            "allowed": self.allowed,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+        }
+
+
+message_limiter = RateLimiter(RATE_LIMIT_MESSAGES_PER_SECOND, RATE_LIMIT_MESSAGES_BURST)
+frame_limiter = RateLimiter(RATE_LIMIT_FRAMES_PER_SECOND, RATE_LIMIT_FRAMES_BURST)
+upload_limiter = RateLimiter(RATE_LIMIT_UPLOADS_PER_SECOND, RATE_LIMIT_UPLOADS_BURST)
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import ConversationParticipant, Message
+
+
+_participants = ConversationParticipant.__table__
+
+
+async def record_sent(db: AsyncSession, messages: Iterable[Tuple[int, int, int]]):
+    """Yangi yozilgan (conversation_id, sender_id, message_id) xabarlar uchun hisoblagichlarni yangilash.
+
+    Xabarlar yozilgan tranzaksiya ichida chaqiriladi: suhbatning har bir
+    ishtirokchisi uchun o'qilmaganlar soni oshiriladi, yuboruvchi esa o'z
+    xabarigacha hammasini o'qigan hisoblanadi.
+    """
+    by_conversation: Dict[int, list] = defaultdict(list)
+    for conversation_id, sender_id, message_id in messages:
+        by_conversation[conversation_id].append((message_id, sender_id))
+    if not by_conversation:
+        return
+
+    increments = []
+    senders = []
+    for conversation_id, items in by_conversation.items():
+        items.sort()
+        increments.append({"b_conversation_id": conversation_id, "b_count": len(items)})
+        last_sent: Dict[int, int] = {}
+        for message_id, sender_id in items:
+            last_sent[sender_id] = message_id
+        for sender_id, last_id in last_sent.items():
+            unread = sum(1 for message_id, other in items if message_id > last_id and other != sender_id)
+            senders.append({
+                "b_conversation_id": conversation_id,
+                "b_user_id": sender_id,
+                "b_last_read": last_id,
+                "b_unread": unread,
+            })
+
+    await db.execute(
+        update(_participants)
+        .where(_participants.c.conversation_id == bindparam("b_conversation_id"))
+        .values(unread_count=_participants.c.unread_count + bindparam("b_count")),
+        increments
+    )
+    await db.execute(
+        update(_participants)
+        .where(
+            _participants.c.conversation_id == bindparam("b_conversation_id"),
+            _participants.c.user_id == bindparam("b_user_id")
+        )
+        .values(last_read_message_id=bindparam("b_last_read"), unread_count=bindparam("b_unread")),
+        senders
+    )
+
+
+async def mark_read(
+    db: AsyncSession,
+    conversation_id: int,
+    user_id: int,
+    message_id: Optional[int] = None
+) -> Optional[dict]:
+    """Foydalanuvchi suhbatni `message_id` gacha (None bo'lsa oxirgi xabargacha) o'qiganini belgilash.
+
+    Kursor faqat oldinga siljiydi va suhbatdagi mavjud xabarga tenglanadi.
+    O'qilmaganlar soni shu kursordan keyingi boshqalar xabarlari bo'yicha
+    qayta hisoblanadi, shuning uchun hisoblagich har safar tuzalib boradi.
+    Ishtirokchi topilmasa None qaytaradi.
+    """
+    latest = select(func.max(Message.id)).where(Message.conversation_id == conversation_id)
+    if message_id is not None:
+        latest = latest.where(Message.id <= message_id)
+    last_id = await db.scalar(latest)
+    if last_id is not None:
+        unread = (
+            select(func.count(Message.id))
+            .where(
+                Message.conversation_id == conversation_id,
+                Message.id > last_id,
+                Message.sender_id != user_id
+            )
+            .scalar_subquery()
+        )
+        await db.execute(
+            update(_participants)
+            .where(
+                _participants.c.conversation_id == conversation_id,
+                _participants.c.user_id == user_id,
+                _participants.c.last_read_message_id < last_id
+            )
+            .values(last_read_message_id=last_id, unread_count=unread)
+        )
+
+    result = await db.execute(
+        select(ConversationParticipant.last_read_message_id, ConversationParticipant.unread_count)
+        .where(
+            ConversationParticipant.conversation_id == conversation_id,
+            ConversationParticipant.user_id == user_id
+        )
+    )
+    row = result.first()
+    await db.commit()
+    if row is None:
+        return None
+    return {
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "last_read_message_id": row.last_read_message_id,
+        "unread_count": row.unread_count,
+    }
@@ -0,0 +1,135 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Hashable, Optional, Tuple
+from fastapi import WebSocket
+from services.wire import Frame, WireFormat, send_frame
+
+
+logger = logging.getLogger(__name__)
+
+# Navbat to'lganda: eng eskisini tashlash, bir xil kalitli kadrlarni birlashtirish yoki uzish
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+SEND_QUEUE_POLICY = os.getenv("WS_SEND_QUEUE_POLICY", DROP_OLDEST)
+
+# 1013 - "Try Again Later", sekin mijoz uzilganda yuboriladi
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class SendQueueStats:
+    """Barcha ulanishlar navbatlari bo'yicha umumiy hisoblagichlar"""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.overflow_disconnects = 0
+        self.max_depth = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "overflow_disconnects": self.overflow_disconnects,
+            "max_depth": self.max_depth,
+        }
+
+
+class QueuedConnection:
+    """Chegaralangan chiquvchi navbatga ega WebSocket ulanishi.
+
+    `send` hech qachon kutmaydi: kadr navbatga qo'yiladi va ulanishning
+    o'z writer taski uni kelishilgan formatda mijozga yuboradi, shuning
+    uchun sekin mijoz boshqalarga yetkazishni to'xtatib qo'ymaydi.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        maxsize: int = SEND_QUEUE_SIZE,
+        policy: str = SEND_QUEUE_POLICY,
+        stats: Optional[SendQueueStats] = None,
+        wire: Optional[WireFormat] = None
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Noma'lum navbat siyosati: {policy}")
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.policy = policy
+        self.stats = stats or SendQueueStats()
+        self.wire = wire or WireFormat()
+        self.queue: Deque[Tuple[Optional[Hashable], Frame]] = deque()
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def send(self, message: Any, coalesce_key: Optional[Hashable] = None) -> bool:
+        """Kadrni navbatga qo'yish; kadr qabul qilinmasa False qaytaradi"""
+        if self.closed:
+            return False
+        if not isinstance(message, Frame):
+            message = Frame(message)
+
+        if coalesce_key is not None and self.policy == COALESCE:
+            for index, (key, _) in enumerate(self.queue):
+                if key == coalesce_key:
+                    self.queue[index] = (coalesce_key, message)
+                    self.stats.coalesced += 1
+                    return True
+
+        if len(self.queue) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                self.stats.dropped += 1
+                self.stats.overflow_disconnects += 1
+                self.closed = True
+                asyncio.get_running_loop().create_task(self.close(SLOW_CONSUMER_CLOSE_CODE))
+                return False
+            self.queue.popleft()
+            self.stats.dropped += 1
+
+        self.queue.append((coalesce_key, message))
+        self.stats.enqueued += 1
+        if len(self.queue) > self.stats.max_depth:
+            self.stats.max_depth = len(self.queue)
+        self._ready.set()
+        return True
+
+    async def _write_loop(self):
+        while True:
+            if not self.queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            _, frame = self.queue.popleft()
+            try:
+                await send_frame(self.websocket, frame, self.wire)
+            except Exception:
+                # Soket yopilgan, qolgan kadrlarni yuborishning ma'nosi yo'q
+                self.closed = True
+                self.queue.clear()
+                return
+            self.stats.sent += 1
+
+    async def close(self, code: Optional[int] = None):
+        self.closed = True
+        self.queue.clear()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                logger.debug("WebSocket allaqachon yopilgan")
@@ -0,0 +1,250 @@
+import os
+import uuid
+import hashlib
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from models import StoredFile
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads"))
+# Yuklanayotgan fayllar tayyor bo'lguncha shu yerda turadi
+TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# multipart sarlavhalari, chegaralari va boshqa maydonlar uchun zaxira
+MULTIPART_OVERHEAD = 64 * 1024
+
+os.makedirs(TMP_DIR, exist_ok=True)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadError(Exception):
+    """So'rov tanasi noto'g'ri yoki unda fayl maydoni yo'q"""
+
+
+class HashingWriter:
+    """Faylga yozish bilan birga SHA-256 xeshini hisoblab boradi"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "wb")
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.hasher.update(chunk)
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        self.file.close()
+
+    @property
+    def sha256(self) -> str:
+        return self.hasher.hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def new_tmp_path() -> str:
+    return os.path.join(TMP_DIR, uuid.uuid4().hex)
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class MultipartFile:
+    """multipart oqimidan bitta fayl maydonini ajratib oluvchi parser callback'lari.
+
+    Maydon ma'lumotlari `pending` ga yig'iladi, ularni diskka yozish
+    chaqiruvchining ishi; boshqa maydonlar e'tiborsiz qoldiriladi.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.headers: Dict[bytes, bytes] = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.current = False
+        self.found = False
+        self.done = False
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        self.size = 0
+        self.path: Optional[str] = None
+        self.sha256: Optional[str] = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if self.found or name != self.field or filename is None:
+            return
+        self.current = self.found = True
+        self.filename = filename.decode("utf-8", "replace")
+        content_type = self.headers.get(b"content-type")
+        self.content_type = content_type.decode("latin-1") if content_type else None
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.current:
+            self.pending.append(data[start:end])
+            self.pending_size += end - start
+            self.size += end - start
+
+    def on_part_end(self):
+        if self.current:
+            self.current = False
+            self.done = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending.clear()
+        self.pending_size = 0
+        return data
+
+
+async def receive_multipart_upload(
+    request: Request,
+    field: str = "file",
+    max_size: int = MAX_UPLOAD_SIZE
+) -> MultipartFile:
+    """multipart/form-data so'rovidan faylni oqim sifatida vaqtinchalik faylga yozish.
+
+    Tana Starlette'ning vaqtinchalik fayliga to'planmaydi: har bir kelgan
+    bo'lak darhol parse qilinadi, xeshlanadi va sanaladi, chegara
+    oshishi bilan (Content-Length bo'lmasa ham) UploadTooLarge
+    ko'tariladi. Diskka yozish event loop'dan tashqarida bajariladi.
+    Natijaning `path`, `sha256` va `size` maydonlari to'ldiriladi.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("multipart/form-data so'rovi kutilgan")
+
+    upload = MultipartFile(field)
+    parser = MultipartParser(boundary, upload.callbacks())
+    writer = await run_in_threadpool(HashingWriter, new_tmp_path())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_size + MULTIPART_OVERHEAD:
+                raise UploadTooLarge()
+            try:
+                parser.write(chunk)
+            except ValueError as error:
+                raise UploadError(f"multipart tanasi noto'g'ri: {error}")
+            if upload.size > max_size:
+                raise UploadTooLarge()
+            if upload.pending_size >= UPLOAD_CHUNK_SIZE or (upload.done and upload.pending):
+                await run_in_threadpool(writer.write, upload.take())
+            if upload.done:
+                # Keyingi maydonlar kerak emas
+                break
+        if not upload.found:
+            raise UploadError(f"'{field}' fayl maydoni topilmadi")
+        if not upload.done:
+            raise UploadError("So'rov tanasi to'liq kelmadi")
+    except BaseException:
+        await run_in_threadpool(writer.close)
+        await run_in_threadpool(_remove, writer.path)
+        raise
+    await run_in_threadpool(writer.close)
+    upload.path = writer.path
+    upload.sha256 = writer.sha256
+    return upload
+
+
+async def store_file(
+    db: AsyncSession,
+    tmp_path: str,
+    sha256: str,
+    size: int,
+    extension: str,
+    content_type: Optional[str]
+) -> str:
+    """Vaqtinchalik faylni xesh bo'yicha nomlangan joyiga ko'chirish.
+
+    Bunday tarkib allaqachon saqlangan bo'lsa, yangi nusxa o'chiriladi va
+    mavjud fayl nomi qaytariladi. Saqlangan fayl nomini qaytaradi.
+    """
+    stored = await _find(db, sha256)
+    if stored is not None:
+        await run_in_threadpool(_remove, tmp_path)
+        return stored
+
+    filename = f"{sha256}{extension.lower()}"
+    await run_in_threadpool(os.replace, tmp_path, os.path.join(UPLOAD_DIR, filename))
+    db.add(StoredFile(
+        sha256=sha256,
+        filename=filename,
+        size=size,
+        content_type=content_type
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Xuddi shu fayl parallel so'rovda saqlab bo'lingan
+        await db.rollback()
+        stored = await _find(db, sha256)
+        if stored is None:
+            raise
+        if stored != filename:
+            await run_in_threadpool(_remove, os.path.join(UPLOAD_DIR, filename))
+        return stored
+    return filename
+
+
+async def _find(db: AsyncSession, sha256: str) -> Optional[str]:
+    result = await db.execute(select(StoredFile.filename).where(StoredFile.sha256 == sha256))
+    return result.scalar()
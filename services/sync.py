@@ -0,0 +1,209 @@
+import os
+import json
+import zlib
+import base64
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from models import Conversation, ConversationParticipant, Message
+
+
+# Bitta sinxronlash javobidagi eng ko'p xabarlar va suhbatlar soni
+SYNC_MESSAGE_LIMIT = int(os.getenv("SYNC_MESSAGE_LIMIT", "500"))
+SYNC_CONVERSATION_LIMIT = int(os.getenv("SYNC_CONVERSATION_LIMIT", "100"))
+# Bitta suhbatdan yuboriladigan eng ko'p yangi xabarlar; qolgani tarixdan olinadi
+SYNC_CONVERSATION_MESSAGES = int(os.getenv("SYNC_CONVERSATION_MESSAGES", "50"))
+# Kursorda saqlanadigan eng ko'p suhbatlar; sinxronlash eng faol shuncha suhbatni qamraydi
+SYNC_CURSOR_MAX_CONVERSATIONS = int(os.getenv("SYNC_CURSOR_MAX_CONVERSATIONS", "1000"))
+
+_conversations = Conversation.__table__
+
+# conversation_id -> (mijoz ko'rgan oxirgi seq, last_read_message_id)
+SyncState = Dict[int, Tuple[int, int]]
+
+_CURSOR_VERSION = 1
+# Ochilgan kursor JSON'ining chegarasi: har bir yozuv (uchta butun son) 64 baytdan oshmaydi
+_CURSOR_MAX_BYTES = 16 + SYNC_CURSOR_MAX_CONVERSATIONS * 64
+# Siqilmaydigan ma'lumot zlib'da biroz kattalashadi, base64 esa 4/3 baravar
+_CURSOR_MAX_LENGTH = (_CURSOR_MAX_BYTES + 64) * 4 // 3 + 4
+
+
+async def allocate_seqs(db: AsyncSession, conversation_ids: List[int]) -> List[int]:
+    """Yoziladigan xabarlar uchun suhbat ichidagi tartib raqamlarini ajratish.
+
+    Xabarlar yoziladigan tranzaksiya ichida chaqiriladi: suhbat qatoridagi
+    last_seq bitta UPDATE bilan oshiriladi, qator esa commit'gacha qulflanib
+    turadi. Tranzaksiya bekor qilinsa hisoblagich ham qaytadi, shuning
+    uchun raqamlar oraliqsiz bo'ladi.
+    """
+    counts = Counter(conversation_ids)
+    if not counts:
+        return []
+    result = await db.execute(
+        update(_conversations)
+        .where(_conversations.c.id.in_(counts))
+        .values(last_seq=_conversations.c.last_seq + case(counts, value=_conversations.c.id, else_=0))
+        .returning(_conversations.c.id, _conversations.c.last_seq)
+    )
+    next_seq = {conversation_id: last_seq - counts[conversation_id] for conversation_id, last_seq in result.all()}
+    missing = set(counts) - set(next_seq)
+    if missing:
+        raise ValueError(f"Suhbat topilmadi: {sorted(missing)}")
+
+    seqs = []
+    for conversation_id in conversation_ids:
+        next_seq[conversation_id] += 1
+        seqs.append(next_seq[conversation_id])
+    return seqs
+
+
+def encode_sync_cursor(state: SyncState) -> str:
+    """Mijoz holatini ixcham kursorga o'girish: suhbat id lari farq ko'rinishida, zlib bilan siqilgan"""
+    values = [_CURSOR_VERSION]
+    previous = 0
+    for conversation_id in sorted(state):
+        seq, last_read = state[conversation_id]
+        values.extend((conversation_id - previous, seq, last_read))
+        previous = conversation_id
+    raw = zlib.compress(json.dumps(values, separators=(",", ":")).encode(), 9)
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_cursor(cursor: Optional[str]) -> SyncState:
+    """Kursorni ochish; noto'g'ri yoki chegaradan katta kursor uchun 400"""
+    if not cursor:
+        return {}
+    try:
+        if len(cursor) > _CURSOR_MAX_LENGTH:
+            raise ValueError(cursor)
+        padded = cursor + "=" * (-len(cursor) % 4)
+        inflater = zlib.decompressobj()
+        # Chiqish hajmi cheklanadi: kichik kursor xotirada katta JSON'ga ochilib ketmasin
+        raw = inflater.decompress(base64.urlsafe_b64decode(padded.encode()), _CURSOR_MAX_BYTES)
+        if inflater.unconsumed_tail or not inflater.eof:
+            raise ValueError(cursor)
+        values = json.loads(raw)
+        if not isinstance(values, list) or values[:1] != [_CURSOR_VERSION] or len(values) % 3 != 1:
+            raise ValueError(cursor)
+        if len(values) > 1 + 3 * SYNC_CURSOR_MAX_CONVERSATIONS:
+            raise ValueError(cursor)
+        state: SyncState = {}
+        conversation_id = 0
+        for index in range(1, len(values), 3):
+            delta, seq, last_read = (int(value) for value in values[index:index + 3])
+            conversation_id += delta
+            state[conversation_id] = (seq, last_read)
+        return state
+    except (ValueError, TypeError, zlib.error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Noto'g'ri kursor"
+        )
+
+
+async def get_sync(
+    db: AsyncSession,
+    user_id: int,
+    since: SyncState,
+    limit: int = SYNC_MESSAGE_LIMIT
+) -> dict:
+    """`since` holatidan beri foydalanuvchi suhbatlarida nima o'zgarganini olish.
+
+    Har bir suhbatning last_seq va o'qilgan xabar ko'rsatkichi mijoz
+    bilgani bilan solishtiriladi, shuning uchun o'zgarmagan suhbatlar uchun
+    xabarlar jadvaliga murojaat qilinmaydi. Yangi xabarlar seq bo'yicha
+    olinadi; suhbatda juda ko'p bo'lsa faqat eng yangilari beriladi va
+    suhbat `truncated` ro'yxatiga tushadi. Javob chegarasiga sig'magan
+    suhbatlar kursorda eski holatida qoladi va `has_more` qaytadi.
+    Kursor faqat eng so'nggi faol SYNC_CURSOR_MAX_CONVERSATIONS ta suhbatni
+    kuzatadi.
+    """
+    result = await db.execute(
+        select(
+            Conversation.id,
+            Conversation.last_seq,
+            ConversationParticipant.last_read_message_id
+        )
+        .join(ConversationParticipant)
+        .where(ConversationParticipant.user_id == user_id)
+        .order_by(Conversation.last_activity_at.desc(), Conversation.id.desc())
+    )
+    current = result.all()
+
+    member_of = {row.id for row in current}
+    removed = sorted(conversation_id for conversation_id in since if conversation_id not in member_of)
+    # Kursor chegarasiga eng faol suhbatlar sig'adi; qolganlari yangi xabar kelib
+    # ro'yxatga qaytganda yangi suhbat kabi (oxirgi xabarlari bilan) yuboriladi
+    current = current[:SYNC_CURSOR_MAX_CONVERSATIONS]
+    tracked = {row.id for row in current}
+    cursor: SyncState = {
+        conversation_id: state for conversation_id, state in since.items() if conversation_id in tracked
+    }
+
+    changed = []
+    ranges: Dict[int, Tuple[int, int]] = {}
+    truncated = []
+    budget = limit
+    has_more = False
+    for row in current:
+        known_seq, known_read = since.get(row.id, (0, -1))
+        if row.id in since and known_seq == row.last_seq and known_read == row.last_read_message_id:
+            continue
+        fresh = max(row.last_seq - known_seq, 0)
+        count = min(fresh, SYNC_CONVERSATION_MESSAGES, limit)
+        if len(changed) >= SYNC_CONVERSATION_LIMIT or count > budget:
+            has_more = True
+            break
+        budget -= count
+        changed.append(row.id)
+        if count:
+            ranges[row.id] = (row.last_seq - count, row.last_seq)
+        if fresh > count:
+            truncated.append(row.id)
+        # Mijoz shu javobni olgach suhbatning aynan shu holatini biladi
+        cursor[row.id] = (row.last_seq, row.last_read_message_id)
+
+    conversations = []
+    if changed:
+        result = await db.execute(
+            select(
+                Conversation.id,
+                Conversation.name,
+                Conversation.is_group,
+                Conversation.created_by,
+                Conversation.created_at,
+                Conversation.last_activity_at,
+                ConversationParticipant.last_read_message_id,
+                ConversationParticipant.unread_count
+            )
+            .join(ConversationParticipant)
+            .where(ConversationParticipant.user_id == user_id, Conversation.id.in_(changed))
+        )
+        by_id = {row.id: row._asdict() for row in result.all()}
+        for conversation_id in changed:
+            if conversation_id in by_id:
+                # Javobdagi seq kursor bilan bir xil: shu seq gacha xabarlar yuborilgan
+                conversations.append({**by_id[conversation_id], "last_seq": cursor[conversation_id][0]})
+
+    messages = []
+    if ranges:
+        result = await db.execute(
+            select(Message)
+            .where(or_(*(
+                and_(Message.conversation_id == conversation_id, Message.seq > low, Message.seq <= high)
+                for conversation_id, (low, high) in ranges.items()
+            )))
+            .order_by(Message.conversation_id, Message.seq)
+        )
+        messages = result.scalars().all()
+
+    return {
+        "conversations": conversations,
+        "messages": messages,
+        "removed": removed,
+        "truncated": truncated,
+        "cursor": encode_sync_cursor(cursor),
+        "has_more": has_more,
+    }
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import uuid
+import shutil
+from typing import List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from services.storage import UPLOAD_DIR, UPLOAD_CHUNK_SIZE
+
+
+# Har bir sessiya: meta.json, oldindan ajratilgan data fayli va qabul qilingan
+# bo'laklar uchun "start-end" nomli bo'sh marker fayllar. Markerlar atomar
+# yaratiladi, shuning uchun bir nechta worker parallel yozsa ham holat buzilmaydi.
+SESSIONS_DIR = os.path.join(UPLOAD_DIR, ".sessions")
+
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", str(24 * 60 * 60)))
+UPLOAD_SESSION_CHUNK_MAX = int(os.getenv("UPLOAD_SESSION_CHUNK_MAX", str(16 * 1024 * 1024)))
+
+os.makedirs(SESSIONS_DIR, exist_ok=True)
+
+
+class UploadSessionError(Exception):
+    pass
+
+
+def _session_dir(upload_id: str) -> str:
+    return os.path.join(SESSIONS_DIR, upload_id)
+
+
+def data_path(upload_id: str) -> str:
+    return os.path.join(_session_dir(upload_id), "data")
+
+
+def _create(user_id: int, file_name: str, file_size: int, file_type: Optional[str]) -> dict:
+    upload_id = uuid.uuid4().hex
+    directory = _session_dir(upload_id)
+    os.makedirs(os.path.join(directory, "chunks"))
+    # Fayl to'liq hajmda (sparse) ochiladi, bo'laklar o'z joyiga yoziladi
+    with open(os.path.join(directory, "data"), "wb") as file:
+        file.truncate(file_size)
+    meta = {
+        "upload_id": upload_id,
+        "user_id": user_id,
+        "file_name": file_name,
+        "file_type": file_type,
+        "file_size": file_size,
+        "expires_at": time.time() + UPLOAD_SESSION_TTL,
+    }
+    tmp_meta = os.path.join(directory, "meta.json.tmp")
+    with open(tmp_meta, "w") as file:
+        json.dump(meta, file)
+    os.replace(tmp_meta, os.path.join(directory, "meta.json"))
+    return meta
+
+
+async def create_session(user_id: int, file_name: str, file_size: int, file_type: Optional[str]) -> dict:
+    await run_in_threadpool(cleanup_expired_sessions)
+    return await run_in_threadpool(_create, user_id, file_name, file_size, file_type)
+
+
+def _load(upload_id: str) -> Optional[dict]:
+    if not upload_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(_session_dir(upload_id), "meta.json")) as file:
+            meta = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta["expires_at"] < time.time():
+        return None
+    return meta
+
+
+async def get_session(upload_id: str, user_id: int) -> Optional[dict]:
+    meta = await run_in_threadpool(_load, upload_id)
+    if meta is None or meta["user_id"] != user_id:
+        return None
+    return meta
+
+
+def _merge(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _received(upload_id: str) -> List[Tuple[int, int]]:
+    ranges = []
+    for name in os.listdir(os.path.join(_session_dir(upload_id), "chunks")):
+        start, _, end = name.partition("-")
+        ranges.append((int(start), int(end)))
+    return _merge(ranges)
+
+
+async def received_ranges(upload_id: str) -> List[Tuple[int, int]]:
+    """Qabul qilingan [start, end) oraliqlari"""
+    return await run_in_threadpool(_received, upload_id)
+
+
+def is_complete(meta: dict, ranges: List[Tuple[int, int]]) -> bool:
+    if meta["file_size"] == 0:
+        return True
+    return ranges == [(0, meta["file_size"])]
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+async def write_chunk(meta: dict, offset: int, stream) -> int:
+    """So'rov tanasini oqim sifatida data faylining `offset` joyiga yozish"""
+    size = meta["file_size"]
+    if offset < 0 or offset > size:
+        raise UploadSessionError("Noto'g'ri offset")
+
+    fd = await run_in_threadpool(os.open, data_path(meta["upload_id"]), os.O_WRONLY)
+    written = 0
+    pending = bytearray()
+    try:
+        async for data in stream:
+            if written + len(pending) + len(data) > UPLOAD_SESSION_CHUNK_MAX or \
+                    offset + written + len(pending) + len(data) > size:
+                raise UploadSessionError("Bo'lak hajmi ruxsat etilganidan katta")
+            pending += data
+            if len(pending) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(_pwrite_all, fd, pending, offset + written)
+                written += len(pending)
+                pending = bytearray()
+        if pending:
+            await run_in_threadpool(_pwrite_all, fd, pending, offset + written)
+            written += len(pending)
+    finally:
+        await run_in_threadpool(os.close, fd)
+
+    if written:
+        marker = os.path.join(_session_dir(meta["upload_id"]), "chunks", f"{offset}-{offset + written}")
+        await run_in_threadpool(lambda: open(marker, "w").close())
+    return written
+
+
+async def delete_session(upload_id: str):
+    await run_in_threadpool(shutil.rmtree, _session_dir(upload_id), True)
+
+
+def cleanup_expired_sessions():
+    """Muddati o'tgan sessiyalarni o'chirish"""
+    now = time.time()
+    for upload_id in os.listdir(SESSIONS_DIR):
+        directory = _session_dir(upload_id)
+        try:
+            with open(os.path.join(directory, "meta.json")) as file:
+                expires_at = json.load(file)["expires_at"]
+        except (FileNotFoundError, ValueError, KeyError):
+            # meta.json yozilmay qolgan sessiya
+            try:
+                expires_at = os.path.getmtime(directory) + UPLOAD_SESSION_TTL
+            except FileNotFoundError:
+                continue
+        if expires_at < now:
+            shutil.rmtree(directory, ignore_errors=True)
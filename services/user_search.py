@@ -0,0 +1,202 @@
+import os
+import time
+import heapq
+import bisect
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import case, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from models import User
+from services.pagination import decode_cursor
+
+
+# SQLite zaxira indeksi boshqa workerlarda qo'shilgan foydalanuvchilarni shu oraliqda o'qib oladi
+USER_INDEX_REFRESH_SECONDS = float(os.getenv("USER_INDEX_REFRESH_SECONDS", "30"))
+# Postgres: bundan qisqa so'rovlar uchun trigram ishlamaydi, faqat boshidan (q%) qidiriladi
+USER_SEARCH_TRIGRAM_MIN_LENGTH = int(os.getenv("USER_SEARCH_TRIGRAM_MIN_LENGTH", "3"))
+
+# Natijalar tartibi va keyset kursor kaliti: (moslik darajasi, kichik harfli ism, id)
+SearchKey = Tuple[int, str, int]
+
+
+def _tokens(name: str, email: str) -> List[str]:
+    # Email domeni alohida token qilinmaydi: "gmail" deyarli hammaga mos kelib qolardi.
+    # To'liq email tokeni mahalliy qism bilan boshlanadi, shuning uchun uning prefikslarini qamraydi
+    name = (name or "").lower()
+    email = (email or "").lower()
+    tokens = {name, email}
+    tokens.update(name.split())
+    return [token for token in tokens if token]
+
+
+def sort_key(user: dict) -> SearchKey:
+    return user["rank"], user["sort_name"], user["id"]
+
+
+def decode_search_cursor(cursor: Optional[str]) -> Optional[SearchKey]:
+    """Foydalanuvchi qidiruvi kursorini o'qish: oxirgi natijaning (rank, ism, id) kaliti"""
+    if not cursor:
+        return None
+    values = decode_cursor(cursor)
+    if (
+        len(values) != 3
+        or not isinstance(values[0], int)
+        or not isinstance(values[1], str)
+        or not isinstance(values[2], int)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Noto'g'ri kursor"
+        )
+    return values[0], values[1], values[2]
+
+
+class UserPrefixIndex:
+    """Foydalanuvchi ism va emaillari bo'yicha xotiradagi prefiks indeks.
+
+    Tokenlar saralangan ro'yxatda saqlanadi, qidiruv bisect bilan
+    prefiks oralig'ini topadi. Postgres'dagi trigram indeks o'rnida
+    SQLite uchun ishlatiladi.
+    """
+
+    def __init__(self):
+        self.tokens: List[Tuple[str, int]] = []
+        self.users: Dict[int, Tuple[str, str]] = {}
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.max_user_id = 0
+        self.refreshed_at = 0.0
+
+    def add(self, user_id: int, name: str, email: str):
+        with self.lock:
+            self._remove(user_id)
+            self.users[user_id] = (name, email)
+            for token in _tokens(name, email):
+                bisect.insort(self.tokens, (token, user_id))
+            self.max_user_id = max(self.max_user_id, user_id)
+
+    def add_many(self, rows: Iterable[Tuple[int, str, str]]):
+        """Ko'p foydalanuvchini qo'shish: tokenlar oxiriga yozilib, ro'yxat bir marta saralanadi"""
+        with self.lock:
+            added = []
+            for user_id, name, email in rows:
+                self._remove(user_id)
+                self.users[user_id] = (name, email)
+                added.extend((token, user_id) for token in _tokens(name, email))
+                self.max_user_id = max(self.max_user_id, user_id)
+            if added:
+                self.tokens.extend(added)
+                self.tokens.sort()
+
+    def remove(self, user_id: int):
+        with self.lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id: int):
+        user = self.users.pop(user_id, None)
+        if user is None:
+            return
+        for token in _tokens(*user):
+            position = bisect.bisect_left(self.tokens, (token, user_id))
+            if position < len(self.tokens) and self.tokens[position] == (token, user_id):
+                del self.tokens[position]
+
+    def search(self, query: str, exclude_id: int, after: Optional[SearchKey], limit: int) -> List[dict]:
+        query = query.lower()
+        ranks: Dict[int, int] = {}
+        with self.lock:
+            position = bisect.bisect_left(self.tokens, (query, -1))
+            while position < len(self.tokens):
+                token, user_id = self.tokens[position]
+                if not token.startswith(query):
+                    break
+                position += 1
+                if user_id == exclude_id:
+                    continue
+                name, email = self.users[user_id]
+                # 0 - to'liq mos, 1 - ism yoki email boshi, 2 - boshqa so'z boshi
+                if query in (name.lower(), email.lower()):
+                    rank = 0
+                elif name.lower().startswith(query) or email.lower().startswith(query):
+                    rank = 1
+                else:
+                    rank = 2
+                ranks[user_id] = min(rank, ranks.get(user_id, rank))
+            keys = [(rank, self.users[user_id][0].lower(), user_id) for user_id, rank in ranks.items()]
+            if after is not None:
+                keys = [key for key in keys if key > after]
+            return [
+                {
+                    "id": user_id,
+                    "name": self.users[user_id][0],
+                    "email": self.users[user_id][1],
+                    "rank": rank,
+                    "sort_name": sort_name,
+                }
+                for rank, sort_name, user_id in heapq.nsmallest(limit, keys)
+            ]
+
+    async def ensure_loaded(self, db: AsyncSession):
+        """Indeksni birinchi marta to'liq, keyin esa faqat yangi qatorlar bilan to'ldirish"""
+        if self.loaded and time.monotonic() - self.refreshed_at < USER_INDEX_REFRESH_SECONDS:
+            return
+        since = self.max_user_id if self.loaded else 0
+        result = await db.execute(
+            select(User.id, User.name, User.email)
+            .where(User.id > since)
+            .order_by(User.id)
+        )
+        self.add_many(result.all())
+        self.loaded = True
+        self.refreshed_at = time.monotonic()
+
+
+user_index = UserPrefixIndex()
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_users(
+    db: AsyncSession,
+    query: str,
+    exclude_id: int,
+    after: Optional[SearchKey],
+    limit: int
+) -> List[dict]:
+    """Foydalanuvchilarni moslik darajasi bo'yicha saralab qidirish (keyset sahifalash bilan)"""
+    if db.get_bind().dialect.name != "postgresql":
+        await user_index.ensure_loaded(db)
+        return user_index.search(query, exclude_id, after, limit)
+
+    lowered = query.lower()
+    name = func.lower(User.name)
+    email = func.lower(User.email)
+    prefix = _escape_like(lowered) + "%"
+    if len(query) < USER_SEARCH_TRIGRAM_MIN_LENGTH:
+        # Qisqa prefiks: lower(...) text_pattern_ops indekslari bo'yicha diapazon qidiruvi
+        condition = or_(name.like(prefix, escape="\\"), email.like(prefix, escape="\\"))
+    else:
+        # pg_trgm GIN indekslari; email bo'yicha faqat mahalliy qism (domen emas) qidiriladi
+        pattern = "%" + _escape_like(query) + "%"
+        condition = or_(
+            User.name.ilike(pattern, escape="\\"),
+            func.split_part(User.email, "@", 1).ilike(pattern, escape="\\")
+        )
+    rank = case(
+        (or_(name == lowered, email == lowered), 0),
+        (or_(name.like(prefix, escape="\\"), email.like(prefix, escape="\\")), 1),
+        else_=2
+    )
+    statement = (
+        select(User.id, User.name, User.email, rank.label("rank"), name.label("sort_name"))
+        .where(User.id != exclude_id, condition)
+        .order_by(rank, name, User.id)
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(tuple_(rank, name, User.id) > tuple_(*after))
+    result = await db.execute(statement)
+    return [row._asdict() for row in result.all()]
@@ -0,0 +1,192 @@
+import os
+import json
+import zlib
+from typing import Any, Dict, Optional, Tuple, Union
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+# Shu hajmdan katta binar kadrlar siqiladi (siqish kelishilgan bo'lsa)
+WS_COMPRESS_THRESHOLD = int(os.getenv("WS_COMPRESS_THRESHOLD", "1024"))
+WS_COMPRESS_LEVEL = int(os.getenv("WS_COMPRESS_LEVEL", "6"))
+# Mijozdan kelgan siqilgan kadr ochilgandagi eng katta hajm (dekompressiya bombasidan himoya)
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(1024 * 1024)))
+
+# Binar kadrning birinchi bayti: tana siqilganmi yoki yo'q
+FLAG_RAW = 0
+FLAG_DEFLATE = 1
+
+# Sec-WebSocket-Protocol qiymatlari: "chat.msgpack", "chat.msgpack.deflate", "chat.json.deflate"
+SUBPROTOCOL_PREFIX = "chat."
+
+# Yopilish kodlari (RFC 6455): o'qib bo'lmaydigan kadr va hajm chegarasidan oshgan kadr
+CLOSE_INVALID_PAYLOAD = 1007
+CLOSE_TOO_BIG = 1009
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+# Buzilgan kadrni o'qishda chiqadigan xatolar (JSON/UTF-8 xatolari ValueError'ning vorislari)
+_DECODE_ERRORS: Tuple[type, ...] = (ValueError, TypeError, RecursionError)
+if msgpack is not None:
+    _DECODE_ERRORS += (msgpack.UnpackException,)
+
+
+class WireFormat:
+    """Ulanish uchun kelishilgan kodlash: JSON yoki MessagePack, siqish bilan yoki siz.
+
+    Siqilmagan JSON - eski mijozlar uchun oddiy matnli kadrlar. Qolgan
+    hollarda kadrlar binar bo'ladi va birinchi bayt tananing deflate bilan
+    siqilganini bildiradi; kichik kadrlar siqilmaydi.
+    """
+
+    __slots__ = ("codec", "compress", "subprotocol")
+
+    def __init__(self, codec: str = JSON, compress: bool = False, subprotocol: Optional[str] = None):
+        self.codec = codec
+        self.compress = compress
+        self.subprotocol = subprotocol
+
+    @property
+    def key(self) -> Tuple[str, bool]:
+        return self.codec, self.compress
+
+    @property
+    def binary(self) -> bool:
+        return self.codec != JSON or self.compress
+
+
+def _parse(value: str) -> Optional[Tuple[str, bool]]:
+    parts = value.strip().lower().split(".")
+    codec, compress = parts[0], parts[1:] == ["deflate"]
+    if codec not in (JSON, MSGPACK) or (len(parts) > 1 and not compress):
+        return None
+    if codec == MSGPACK and msgpack is None:
+        return None
+    return codec, compress
+
+
+def negotiate(websocket: WebSocket) -> WireFormat:
+    """Mijoz so'ragan formatni tanlash.
+
+    Avval Sec-WebSocket-Protocol ("chat.msgpack.deflate" kabi), so'ng
+    `?protocol=msgpack&compress=1` so'rov parametrlari ko'riladi;
+    qo'llab-quvvatlanmagan format so'ralsa JSON qoladi.
+    """
+    offered = websocket.headers.get("sec-websocket-protocol")
+    if offered:
+        for value in offered.split(","):
+            value = value.strip()
+            if value.lower().startswith(SUBPROTOCOL_PREFIX):
+                parsed = _parse(value[len(SUBPROTOCOL_PREFIX):])
+                if parsed is not None:
+                    return WireFormat(*parsed, subprotocol=value)
+
+    params = websocket.query_params
+    parsed = _parse(params.get("protocol", JSON))
+    codec = parsed[0] if parsed else JSON
+    return WireFormat(codec, params.get("compress") in ("1", "true"))
+
+
+def _dumps(message: Any, codec: str) -> bytes:
+    if codec == MSGPACK:
+        return msgpack.packb(message, default=str, use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+class Frame:
+    """Bir marta kodlanib, barcha qabul qiluvchilarga bir xil baytlar bilan yuboriladigan kadr.
+
+    Har bir format uchun kodlangan natija kadrning o'zida saqlanadi, shuning
+    uchun guruhga yuborishda xabar format sonidan ortiq kodlanmaydi.
+    """
+
+    __slots__ = ("message", "_encoded")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._encoded: Dict[Tuple[str, bool], Union[str, bytes]] = {}
+
+    def encode(self, wire: WireFormat) -> Union[str, bytes]:
+        encoded = self._encoded.get(wire.key)
+        if encoded is None:
+            encoded = self._encode(wire)
+            self._encoded[wire.key] = encoded
+        return encoded
+
+    def _encode(self, wire: WireFormat) -> Union[str, bytes]:
+        if not wire.binary:
+            return _dumps(self.message, JSON).decode()
+        body = _dumps(self.message, wire.codec)
+        if wire.compress and len(body) > WS_COMPRESS_THRESHOLD:
+            return bytes((FLAG_DEFLATE,)) + zlib.compress(body, WS_COMPRESS_LEVEL)
+        return bytes((FLAG_RAW,)) + body
+
+
+async def send_frame(websocket: WebSocket, frame: Frame, wire: WireFormat):
+    data = frame.encode(wire)
+    if isinstance(data, str):
+        await websocket.send({"type": "websocket.send", "text": data})
+    else:
+        await websocket.send({"type": "websocket.send", "bytes": data})
+
+
+def decode(data: Union[str, bytes], wire: WireFormat) -> dict:
+    """Kadrni lug'atga o'girish; obyekt bo'lmagan yoki buzilgan kadr uchun ValueError"""
+    message = _decode(data, wire)
+    if not isinstance(message, dict):
+        raise ValueError("Kadr obyekt bo'lishi kerak")
+    return message
+
+
+def _decode(data: Union[str, bytes], wire: WireFormat) -> Any:
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data:
+        raise ValueError("Bo'sh kadr")
+    body = data[1:]
+    if data[0] == FLAG_DEFLATE:
+        inflater = zlib.decompressobj()
+        # Chiqish hajmi cheklanadi: kichik kadr xotirada gigabaytlarga ochilib ketmasin
+        body = inflater.decompress(body, WS_MAX_FRAME_BYTES)
+        if inflater.unconsumed_tail or (not inflater.eof and len(body) >= WS_MAX_FRAME_BYTES):
+            raise FrameTooLarge("Kadr hajmi juda katta")
+        if not inflater.eof:
+            raise ValueError("Siqilgan kadr to'liq emas")
+    elif data[0] != FLAG_RAW:
+        raise ValueError("Noma'lum kadr bayrog'i")
+    if wire.codec == MSGPACK:
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+async def receive_frame(websocket: WebSocket, wire: WireFormat) -> dict:
+    """Mijozdan keyingi kadrni kelishilgan format bo'yicha o'qish.
+
+    Ochilganda WS_MAX_FRAME_BYTES dan oshadigan kadr kelsa ulanish 1009,
+    o'qib bo'lmaydigan yoki obyekt bo'lmagan kadr kelsa 1007 kodi bilan
+    yopiladi; ikkala holda ham WebSocketDisconnect ko'tariladi.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    try:
+        if message.get("text") is not None:
+            return decode(message["text"], wire)
+        return decode(message.get("bytes") or b"", wire)
+    except FrameTooLarge as error:
+        await websocket.close(code=CLOSE_TOO_BIG, reason=str(error))
+        raise WebSocketDisconnect(CLOSE_TOO_BIG, str(error))
+    except _DECODE_ERRORS:
+        reason = "Kadrni o'qib bo'lmadi"
+        await websocket.close(code=CLOSE_INVALID_PAYLOAD, reason=reason)
+        raise WebSocketDisconnect(CLOSE_INVALID_PAYLOAD, reason)
@@ -0,0 +1,77 @@
+import os
+import sys
+import uuid
+import tempfile
+import pytest
+
+
+# Ilova modullari import qilinishidan oldin: vaqtinchalik SQLite baza,
+# tez bcrypt va testlarga xalaqit bermaydigan cheklovlar
+_WORKDIR = tempfile.mkdtemp(prefix="chat-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_WORKDIR}/test.db")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_WORKDIR, "uploads"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+for _name in ("MESSAGES", "FRAMES", "UPLOADS"):
+    os.environ.setdefault(f"RATE_LIMIT_{_name}_PER_SECOND", "1000000")
+    os.environ.setdefault(f"RATE_LIMIT_{_name}_BURST", "1000000")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def tables():
+    import models  # noqa: F401
+    from db import create_tables
+    create_tables()
+
+
+@pytest.fixture(scope="session")
+def client(tables):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def register(client):
+    """Yangi foydalanuvchi yaratuvchi: register("alice") -> {"id", "token", "headers"}"""
+    return lambda name="user": _register(client, name)
+
+
+def _register(client, name: str) -> dict:
+    email = f"{name}-{uuid.uuid4().hex[:8]}@example.com"
+    response = client.post("/auth/register", json={"name": name, "email": email, "password": "secret123"})
+    assert response.status_code == 200, response.text
+    user_id = response.json()["id"]
+    response = client.post("/auth/login", data={"username": email, "password": "secret123"})
+    assert response.status_code == 200, response.text
+    token = response.json()["access_token"]
+    return {"id": user_id, "token": token, "headers": {"Authorization": f"Bearer {token}"}}
+
+
+@pytest.fixture
+def conversation(tables):
+    """Ikki ishtirokchili suhbat (to'g'ridan-to'g'ri bazada): (conversation_id, [user_id, ...])"""
+    from db import SessionLocal
+    from models import Conversation, ConversationParticipant, User
+
+    with SessionLocal() as db:
+        users = [
+            User(name=name, email=f"{name}-{uuid.uuid4().hex[:8]}@example.com", hashed_password="-")
+            for name in ("alice", "bob")
+        ]
+        db.add_all(users)
+        db.flush()
+        conversation = Conversation(name="test", is_group=True, created_by=users[0].id)
+        db.add(conversation)
+        db.flush()
+        db.add_all([ConversationParticipant(conversation_id=conversation.id, user_id=user.id) for user in users])
+        db.commit()
+        return conversation.id, [user.id for user in users]
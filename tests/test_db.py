@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from db import ASYNC_DATABASE_URL, SessionLocal, _async_url
+from models import User
+
+
+def test_async_url_swaps_sync_drivers():
+    assert _async_url("postgresql+psycopg2://user:pw@db:5432/chat") == "postgresql+asyncpg://user:pw@db:5432/chat"
+    assert _async_url("postgresql://db/chat") == "postgresql+asyncpg://db/chat"
+    assert _async_url("sqlite:///chat.db") == "sqlite+aiosqlite:///chat.db"
+    assert _async_url("mysql://db/chat") == "mysql://db/chat"
+
+
+@pytest.mark.anyio
+async def test_async_session_sees_sync_writes(tables):
+    with SessionLocal() as db:
+        db.add(User(name="async", email="async-engine@example.com", hashed_password="-"))
+        db.commit()
+
+    engine = create_async_engine(ASYNC_DATABASE_URL)
+    try:
+        async with async_sessionmaker(bind=engine, class_=AsyncSession)() as db:
+            count = await db.scalar(select(func.count()).select_from(User).where(User.email == "async-engine@example.com"))
+    finally:
+        await engine.dispose()
+    assert count == 1
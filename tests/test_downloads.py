@@ -0,0 +1,72 @@
+import os
+import pytest
+
+
+@pytest.fixture(scope="module")
+def user(register):
+    return register("downloader")
+
+
+def _upload(client, user, content: bytes, name: str = "data.bin") -> str:
+    response = client.post(
+        "/api/files/upload",
+        files={"file": (name, content, "application/octet-stream")},
+        headers=user["headers"]
+    )
+    assert response.status_code == 201, response.text
+    return response.json()["file_url"]
+
+
+def test_full_download_and_conditional_get(client, user):
+    content = os.urandom(10_000)
+    url = _upload(client, user, content)
+    response = client.get(url, headers=user["headers"])
+    assert response.status_code == 200
+    assert response.content == content
+    etag = response.headers["ETag"]
+    assert "immutable" in response.headers["Cache-Control"]
+
+    response = client.get(url, headers={**user["headers"], "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_single_and_multiple_ranges(client, user):
+    content = os.urandom(10_000)
+    url = _upload(client, user, content)
+
+    response = client.get(url, headers={**user["headers"], "Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 100-199/10000"
+    assert response.content == content[100:200]
+
+    response = client.get(url, headers={**user["headers"], "Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == content[-10:]
+
+    response = client.get(url, headers={**user["headers"], "Range": "bytes=0-9,20-29"})
+    assert response.status_code == 206
+    assert response.headers["Content-Type"].startswith("multipart/byteranges")
+    assert content[0:10] in response.content and content[20:30] in response.content
+
+
+def test_if_range_mismatch_returns_whole_file(client, user):
+    content = os.urandom(5_000)
+    url = _upload(client, user, content)
+    response = client.get(url, headers={**user["headers"], "Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == content
+
+
+@pytest.mark.parametrize("range_header", ["bytes=-5", "bytes=0-", "bytes=0-0"])
+def test_any_range_on_empty_file_is_not_satisfiable(client, user, range_header):
+    url = _upload(client, user, b"", "empty.txt")
+    response = client.get(url, headers={**user["headers"], "Range": range_header})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */0"
+
+
+def test_unsatisfiable_range(client, user):
+    url = _upload(client, user, os.urandom(100))
+    response = client.get(url, headers={**user["headers"], "Range": "bytes=500-600"})
+    assert response.status_code == 416
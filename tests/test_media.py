@@ -0,0 +1,66 @@
+import os
+import asyncio
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from db import ASYNC_DATABASE_URL
+from services import media
+from services.media import MediaPipeline
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+CRASH_SHA = "c" * 64
+
+
+def crash_or_describe(path: str, sha256: str, kind: str) -> dict:
+    """Ishchi jarayonni yiqitadigan fayl (spawn bilan import qilinadi)"""
+    if sha256 == CRASH_SHA:
+        os._exit(1)
+    return {"width": 1, "height": 1, "duration": None, "placeholder": None, "thumbnails": {}}
+
+
+@pytest.fixture
+async def session_factory(tables):
+    engine = create_async_engine(ASYNC_DATABASE_URL)
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _drain(pipeline: MediaPipeline):
+    while pipeline.in_flight:
+        await asyncio.gather(*pipeline.in_flight.values())
+
+
+@pytest.mark.anyio
+async def test_crashing_job_fails_alone(session_factory):
+    pipeline = MediaPipeline(workers=2, job=crash_or_describe, session_factory=session_factory)
+    try:
+        for name in ("a" * 64, CRASH_SHA, "b" * 64):
+            assert pipeline.enqueue(f"{name}.png", "image/png")
+        await _drain(pipeline)
+
+        # Pul qayta yaratilgan: keyingi ishlar odatdagidek bajariladi
+        assert pipeline.enqueue(f"{'d' * 64}.png", "image/png")
+        await _drain(pipeline)
+    finally:
+        pipeline.shutdown()
+
+    stats = pipeline.stats()
+    assert stats["completed"] == 3
+    assert stats["failed"] == stats["crashed"] == 1
+    assert stats["pool_restarts"] >= 1
+
+
+@pytest.mark.skipif(Image is None, reason="Pillow o'rnatilmagan")
+def test_oversized_image_is_not_decoded(tmp_path, monkeypatch):
+    path = str(tmp_path / "large.png")
+    Image.new("RGB", (40, 40)).save(path)
+    # 1600 piksel: chegaradan 2 baravardan kam oshgani ham rad etiladi
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+
+    with pytest.raises(Image.DecompressionBombWarning):
+        media.process_media(path, "e" * 64, "image")
+    assert not os.path.exists(os.path.join(media.MEDIA_DIR, f"{'e' * 64}.json"))
@@ -0,0 +1,19 @@
+def test_snippet_escapes_message_html(client, register):
+    alice = register("alice")
+    response = client.post(
+        "/api/chat/conversations",
+        json={"name": "search", "is_group": True, "participant_ids": []},
+        headers=alice["headers"]
+    )
+    conversation_id = response.json()["id"]
+    response = client.post(
+        "/api/chat/messages",
+        json={"conversation_id": conversation_id, "content": '<img src=x onerror="alert(1)"> xsstoken & more'},
+        headers=alice["headers"]
+    )
+    assert response.status_code in (200, 201), response.text
+
+    response = client.get("/api/chat/search", params={"q": "xsstoken"}, headers=alice["headers"])
+    assert response.status_code == 200, response.text
+    [result] = response.json()
+    assert result["snippet"] == '&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>xsstoken</mark> &amp; more'
@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from db import ASYNC_DATABASE_URL, SessionLocal
+from models import Conversation, Message
+from services.message_writer import MessageWriter
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def session_factory(tables):
+    # Har bir test o'z event loop'ida, shuning uchun alohida engine
+    engine = create_async_engine(ASYNC_DATABASE_URL)
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+class RecordingWriter(MessageWriter):
+    """Har bir tranzaksiyadagi xabarlar sonini yozib boradi"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    async def _insert(self, rows):
+        self.batches.append(len(rows))
+        return await super()._insert(rows)
+
+
+def _stored_seqs(conversation_id):
+    with SessionLocal() as db:
+        seqs = db.scalars(
+            select(Message.seq).where(Message.conversation_id == conversation_id).order_by(Message.id)
+        ).all()
+        last_seq = db.get(Conversation, conversation_id).last_seq
+    return seqs, last_seq
+
+
+async def test_batch_is_written_in_one_transaction(session_factory, conversation):
+    conversation_id, (sender_id, _) = conversation
+    writer = RecordingWriter(session_factory, max_batch=50, max_delay_ms=20)
+
+    results = await asyncio.gather(*(
+        writer.submit(conversation_id=conversation_id, sender_id=sender_id, content=f"m{index}")
+        for index in range(10)
+    ))
+    await writer.close()
+
+    assert writer.batches == [10]
+    assert [message["content"] for message in results] == [f"m{index}" for index in range(10)]
+    assert [message["seq"] for message in results] == list(range(1, 11))
+    assert len({message["id"] for message in results}) == 10
+
+
+async def test_failed_batch_falls_back_to_single_rows(session_factory, conversation):
+    conversation_id, (sender_id, _) = conversation
+    writer = RecordingWriter(session_factory, max_batch=50, max_delay_ms=20)
+
+    results = await asyncio.gather(
+        writer.submit(conversation_id=conversation_id, sender_id=sender_id, content="first"),
+        # Mavjud bo'lmagan suhbat: seq ajratishda xato, butun guruh bekor qilinadi
+        writer.submit(conversation_id=999999, sender_id=sender_id, content="broken"),
+        writer.submit(conversation_id=conversation_id, sender_id=sender_id, content="second"),
+        writer.submit(conversation_id=conversation_id, sender_id=sender_id, content="third"),
+        return_exceptions=True
+    )
+    await writer.close()
+
+    assert writer.batches == [4, 1, 1, 1, 1]
+    assert isinstance(results[1], ValueError)
+    written = [results[0], results[2], results[3]]
+    assert [message["content"] for message in written] == ["first", "second", "third"]
+    # Bekor qilingan guruh seq hisoblagichini ham qaytaradi: raqamlar oraliqsiz
+    assert [message["seq"] for message in written] == [1, 2, 3]
+    assert _stored_seqs(conversation_id) == ([1, 2, 3], 3)
+
+
+async def test_failed_single_message_does_not_stop_writer(session_factory, conversation):
+    conversation_id, (sender_id, _) = conversation
+    writer = MessageWriter(session_factory, max_batch=50, max_delay_ms=1)
+
+    with pytest.raises(ValueError):
+        await writer.submit(conversation_id=999999, sender_id=sender_id, content="broken")
+    message = await writer.submit(conversation_id=conversation_id, sender_id=sender_id, content="ok")
+    await writer.close()
+
+    assert message["seq"] == 1
+
+
+async def test_seq_is_gap_free_under_concurrent_writers(session_factory, conversation):
+    conversation_id, (alice, bob) = conversation
+    # Ikki writer - ikki worker jarayonini taqlid qiladi, har biri o'z ulanishlari bilan
+    writers = [
+        MessageWriter(session_factory, max_batch=4, max_delay_ms=1),
+        MessageWriter(session_factory, max_batch=7, max_delay_ms=2),
+    ]
+
+    async def send(writer, sender_id, count):
+        return await asyncio.gather(*(
+            writer.submit(conversation_id=conversation_id, sender_id=sender_id, content=f"{sender_id}:{index}")
+            for index in range(count)
+        ))
+
+    first, second = await asyncio.gather(send(writers[0], alice, 25), send(writers[1], bob, 25))
+    for writer in writers:
+        await writer.close()
+
+    seqs = [message["seq"] for message in first + second]
+    assert sorted(seqs) == list(range(1, 51))
+    # Bitta writer ichida yuborish tartibi saqlanadi
+    assert [message["seq"] for message in first] == sorted(message["seq"] for message in first)
+    assert [message["seq"] for message in second] == sorted(message["seq"] for message in second)
+
+    stored, last_seq = _stored_seqs(conversation_id)
+    assert sorted(stored) == list(range(1, 51))
+    assert last_seq == 50
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+import pytest
+from db import SessionLocal
+from models import Message
+from services.message_cache import RecentMessageCache
+
+
+HISTORY = "/api/chat/conversations/{}/messages"
+
+
+@pytest.fixture(scope="module")
+def history(client, register):
+    """Suhbat va 7 ta xabar, ulardan 5 tasining vaqti bir xil (kalitdagi tenglik)"""
+    alice, bob = register("alice"), register("bob")
+    response = client.post(
+        "/api/chat/conversations",
+        json={"name": "pages", "is_group": True, "participant_ids": [bob["id"]]},
+        headers=alice["headers"]
+    )
+    assert response.status_code == 201, response.text
+    conversation_id = response.json()["id"]
+
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    timestamps = [base] + [base + timedelta(seconds=1)] * 5 + [base + timedelta(seconds=2)]
+    with SessionLocal() as db:
+        messages = [
+            Message(conversation_id=conversation_id, sender_id=alice["id"], content=f"m{index}", timestamp=timestamp, seq=index + 1)
+            for index, timestamp in enumerate(timestamps)
+        ]
+        db.add_all(messages)
+        db.commit()
+        ids = [message.id for message in messages]
+    return conversation_id, bob["headers"], ids
+
+
+@pytest.fixture(params=["default", "small", "disabled"])
+def cache(request, monkeypatch):
+    """Oyna kesh ichida, kesh va baza chegarasida va umuman keshsiz"""
+    import routers.chat
+    capacity = {"default": 200, "small": 3, "disabled": 0}[request.param]
+    monkeypatch.setattr(routers.chat, "message_cache", RecentMessageCache(capacity=capacity))
+
+
+def _walk(client, conversation_id, headers, limit, backward):
+    ids, cursor = [], None
+    for _ in range(20):
+        params = {"limit": limit, "direction": "backward" if backward else "forward"}
+        if cursor:
+            params["before" if backward else "after"] = cursor
+        response = client.get(HISTORY.format(conversation_id), params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page = [message["id"] for message in response.json()]
+        assert page, "bo'sh sahifa"
+        assert len(page) <= limit
+        # Sahifa ichida doim eskidan yangiga
+        assert page == sorted(page)
+        ids = page + ids if backward else ids + page
+        if response.headers["X-Has-More"] == "false":
+            return ids
+        cursor = response.headers["X-Before-Cursor" if backward else "X-After-Cursor"]
+    pytest.fail("Sahifalash tugamadi")
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 6, 7, 8])
+@pytest.mark.parametrize("backward", [True, False])
+def test_pages_cover_history_exactly_once(client, history, cache, limit, backward):
+    conversation_id, headers, ids = history
+    assert _walk(client, conversation_id, headers, limit, backward) == ids
+
+
+def test_cursors_of_a_page_continue_in_both_directions(client, history, cache):
+    conversation_id, headers, ids = history
+    response = client.get(HISTORY.format(conversation_id), params={"limit": 2}, headers=headers)
+    assert [message["id"] for message in response.json()] == ids[-2:]
+    assert response.headers["X-Has-More"] == "true"
+
+    older = client.get(
+        HISTORY.format(conversation_id),
+        params={"limit": 3, "before": response.headers["X-Before-Cursor"]},
+        headers=headers
+    )
+    assert [message["id"] for message in older.json()] == ids[-5:-2]
+
+    newer = client.get(
+        HISTORY.format(conversation_id),
+        params={"limit": 3, "after": response.headers["X-After-Cursor"]},
+        headers=headers
+    )
+    assert newer.json() == []
+    assert newer.headers["X-Has-More"] == "false"
+
+
+def test_invalid_cursor_is_rejected(client, history):
+    conversation_id, headers, _ = history
+    response = client.get(HISTORY.format(conversation_id), params={"before": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+    response = client.get(HISTORY.format(conversation_id), params={"before": "WzFd", "after": "WzFd"}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,100 @@
+import json
+import asyncio
+import pytest
+from services.send_queue import (
+    COALESCE,
+    DISCONNECT,
+    DROP_OLDEST,
+    SLOW_CONSUMER_CLOSE_CODE,
+    QueuedConnection,
+    SendQueueStats,
+)
+
+
+pytestmark = pytest.mark.anyio
+
+
+class StalledWebSocket:
+    """`release` o'rnatilmaguncha birinchi kadrni yuborishda to'xtab turadigan soket"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.sent = []
+        self.close_code = None
+
+    async def send(self, message):
+        await self.release.wait()
+        self.sent.append(json.loads(message["text"]))
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+async def _stalled_connection(policy, maxsize=3):
+    websocket = StalledWebSocket()
+    connection = QueuedConnection(websocket, maxsize=maxsize, policy=policy, stats=SendQueueStats())
+    # Birinchi kadrni writer task olib, soketda to'xtab qoladi; qolganlari navbatda
+    connection.send({"n": 0})
+    await asyncio.sleep(0)
+    assert connection.depth == 0
+    return websocket, connection
+
+
+async def _drain(websocket, connection):
+    websocket.release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    await connection.close()
+    return [frame["n"] for frame in websocket.sent]
+
+
+async def test_drop_oldest_keeps_newest_frames():
+    websocket, connection = await _stalled_connection(DROP_OLDEST)
+    for n in range(1, 6):
+        assert connection.send({"n": n})
+
+    assert connection.depth == 3
+    assert connection.stats.dropped == 2
+    assert connection.stats.max_depth == 3
+    assert await _drain(websocket, connection) == [0, 3, 4, 5]
+
+
+async def test_coalesce_replaces_pending_frame_in_place():
+    websocket, connection = await _stalled_connection(COALESCE)
+    connection.send({"n": 1}, coalesce_key="typing:1")
+    connection.send({"n": 2}, coalesce_key="typing:2")
+    connection.send({"n": 3}, coalesce_key="typing:1")
+
+    assert connection.depth == 2
+    assert connection.stats.coalesced == 1
+    assert connection.stats.dropped == 0
+    assert await _drain(websocket, connection) == [0, 3, 2]
+
+
+async def test_coalesce_drops_oldest_when_keys_differ():
+    websocket, connection = await _stalled_connection(COALESCE)
+    for n in range(1, 5):
+        connection.send({"n": n}, coalesce_key=f"key:{n}")
+
+    assert connection.stats.coalesced == 0
+    assert connection.stats.dropped == 1
+    assert await _drain(websocket, connection) == [0, 2, 3, 4]
+
+
+async def test_disconnect_closes_slow_consumer():
+    websocket, connection = await _stalled_connection(DISCONNECT)
+    for n in range(1, 4):
+        assert connection.send({"n": n})
+
+    assert not connection.send({"n": 4})
+    assert connection.closed
+    assert connection.stats.overflow_disconnects == 1
+    await asyncio.sleep(0)
+    assert websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+    # Uzilgan ulanish boshqa kadr qabul qilmaydi
+    assert not connection.send({"n": 5})
+
+
+async def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        QueuedConnection(StalledWebSocket(), policy="block")
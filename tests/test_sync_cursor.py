@@ -0,0 +1,42 @@
+import json
+import zlib
+import base64
+import pytest
+from fastapi import HTTPException
+from services import sync
+from services.sync import decode_sync_cursor, encode_sync_cursor
+
+
+def _raw_cursor(data: bytes) -> str:
+    return base64.urlsafe_b64encode(zlib.compress(data, 9)).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    state = {3: (10, 7), 41: (0, -1), 1000: (5, 5)}
+
+    assert decode_sync_cursor(encode_sync_cursor(state)) == state
+
+
+def test_cursor_decompression_is_bounded():
+    # Bir necha KB kursor 50 MB ga ochiladi
+    cursor = _raw_cursor(b"[1" + b" " * (50 * 1024 * 1024) + b"]")
+    assert len(cursor) < 100 * 1024
+
+    with pytest.raises(HTTPException) as error:
+        decode_sync_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_cursor_entry_count_is_capped(monkeypatch):
+    monkeypatch.setattr(sync, "SYNC_CURSOR_MAX_CONVERSATIONS", 2)
+    cursor = _raw_cursor(json.dumps([1, 1, 0, 0, 1, 0, 0, 1, 0, 0]).encode())
+
+    with pytest.raises(HTTPException) as error:
+        decode_sync_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_oversized_cursor_string_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        decode_sync_cursor("A" * (sync._CURSOR_MAX_LENGTH + 1))
+    assert error.value.status_code == 400
@@ -0,0 +1,84 @@
+import os
+import pytest
+from starlette.requests import Request
+from services.storage import TMP_DIR, UploadError, UploadTooLarge, receive_multipart_upload
+
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = "testboundary"
+
+
+def _body(content: bytes, field: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\nhello\r\n'
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="photo.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _streaming_request(body: bytes, chunk_size: int = 1000):
+    """Content-Length'siz (chunked) so'rov; nechta bo'lak o'qilganini sanaydi"""
+    chunks = [body[offset:offset + chunk_size] for offset in range(0, len(body), chunk_size)]
+    state = {"read": 0}
+
+    async def receive():
+        index = state["read"]
+        state["read"] += 1
+        return {"type": "http.request", "body": chunks[index], "more_body": index + 1 < len(chunks)}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/files/upload",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }
+    return Request(scope, receive), state, len(chunks)
+
+
+async def test_file_field_is_streamed_to_disk():
+    content = os.urandom(50_000)
+    request, _, _ = _streaming_request(_body(content))
+    upload = await receive_multipart_upload(request, max_size=100_000)
+    try:
+        assert upload.filename == "photo.png"
+        assert upload.content_type == "image/png"
+        assert upload.size == len(content)
+        with open(upload.path, "rb") as file:
+            assert file.read() == content
+    finally:
+        os.unlink(upload.path)
+
+
+async def test_limit_is_enforced_mid_stream():
+    before = set(os.listdir(TMP_DIR))
+    request, state, total = _streaming_request(_body(os.urandom(200_000)))
+    with pytest.raises(UploadTooLarge):
+        await receive_multipart_upload(request, max_size=10_000)
+    # Tana oxirigacha o'qilmaydi va vaqtinchalik fayl qolmaydi
+    assert state["read"] < total // 2
+    assert set(os.listdir(TMP_DIR)) == before
+
+
+async def test_missing_file_field_is_rejected():
+    request, _, _ = _streaming_request(_body(b"data", field="other"))
+    with pytest.raises(UploadError):
+        await receive_multipart_upload(request, max_size=10_000)
+
+
+def test_upload_endpoint_deduplicates(client, register):
+    user = register("uploader")
+    content = os.urandom(2048)
+    first = client.post("/api/files/upload", files={"file": ("a.bin", content, "application/octet-stream")}, headers=user["headers"])
+    second = client.post("/api/files/upload", files={"file": ("b.bin", content, "application/octet-stream")}, headers=user["headers"])
+    assert first.status_code == second.status_code == 201, first.text
+    assert first.json()["file_url"] == second.json()["file_url"]
+    assert first.json()["file_size"] == 2048
+
+    download = client.get(first.json()["file_url"], headers=user["headers"])
+    assert download.content == content
+
+    response = client.post("/api/files/upload", content=b"not multipart", headers={**user["headers"], "Content-Type": "text/plain"})
+    assert response.status_code == 400
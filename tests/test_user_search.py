@@ -0,0 +1,68 @@
+from services.user_search import UserPrefixIndex, sort_key
+
+
+def _index():
+    index = UserPrefixIndex()
+    index.add_many([
+        (1, "Alice Smith", "alice@gmail.com"),
+        (2, "Al", "al@gmail.com"),
+        (3, "Bob Alison", "bob@gmail.com"),
+        (4, "alina", "zz@example.com"),
+        (5, "Carol", "carol@gmail.com"),
+    ])
+    return index
+
+
+def test_email_domain_is_not_indexed():
+    index = _index()
+    assert index.search("gmail", exclude_id=0, after=None, limit=10) == []
+    assert [user["id"] for user in index.search("carol@g", exclude_id=0, after=None, limit=10)] == [5]
+
+
+def test_results_are_ranked_and_keyset_paginated():
+    index = _index()
+    # To'liq mos, keyin ism/email boshi, keyin boshqa so'z boshi
+    everything = [user["id"] for user in index.search("al", exclude_id=0, after=None, limit=10)]
+    assert everything == [2, 1, 4, 3]
+
+    pages, after = [], None
+    while True:
+        page = index.search("al", exclude_id=0, after=after, limit=2)
+        if not page:
+            break
+        pages.extend(user["id"] for user in page)
+        after = sort_key(page[-1])
+    assert pages == everything
+
+
+def test_bulk_load_matches_incremental_adds():
+    bulk = _index()
+    incremental = UserPrefixIndex()
+    for user_id, (name, email) in sorted(bulk.users.items()):
+        incremental.add(user_id, name, email)
+    assert bulk.tokens == incremental.tokens
+
+    bulk.add_many([(1, "Zed", "zed@gmail.com")])
+    assert [user["id"] for user in bulk.search("ali", exclude_id=0, after=None, limit=10)] == [4, 3]
+    assert bulk.tokens == sorted(bulk.tokens)
+
+
+def test_search_endpoint_cursor(client, register):
+    searcher = register("searcher")
+    for _ in range(3):
+        register("zebulon")
+    seen, cursor = [], None
+    for _ in range(5):
+        params = {"query": "zebu", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/chat/users/search", params=params, headers=searcher["headers"])
+        assert response.status_code == 200, response.text
+        seen.extend(user["id"] for user in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 3
+    assert client.get(
+        "/api/chat/users/search", params={"query": "zebu", "cursor": "WzFd"}, headers=searcher["headers"]
+    ).status_code == 400
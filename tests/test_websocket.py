@@ -0,0 +1,124 @@
+import pytest
+
+
+@pytest.fixture
+def chat(client, register):
+    """Ikki foydalanuvchi va ular orasidagi suhbat (REST orqali): (alice, bob, conversation_id)"""
+    alice, bob = register("alice"), register("bob")
+    response = client.post(
+        "/api/chat/conversations",
+        json={"name": "ws", "is_group": True, "participant_ids": [bob["id"]]},
+        headers=alice["headers"]
+    )
+    assert response.status_code == 201, response.text
+    return alice, bob, response.json()["id"]
+
+
+def _connect(client, user, **params):
+    query = "&".join(f"{key}={value}" for key, value in {"token": user["token"], **params}.items())
+    return client.websocket_connect(f"/ws?{query}")
+
+
+def _receive(websocket, frame_type: str) -> dict:
+    """Kerakli turdagi kadrgacha o'qish; presence kadrlari o'tkazib yuboriladi"""
+    while True:
+        frame = websocket.receive_json()
+        if frame["type"] == frame_type:
+            return frame
+        assert frame["type"] == "presence", frame
+
+
+def _send_messages(client, user, conversation_id: int, count: int) -> list:
+    with _connect(client, user) as websocket:
+        sent = []
+        for index in range(count):
+            websocket.send_json({"type": "message", "conversation_id": conversation_id, "content": f"m{index}"})
+            sent.append(_receive(websocket, "message_sent"))
+    return sent
+
+
+def test_message_is_routed_by_conversation(client, chat):
+    alice, bob, conversation_id = chat
+    with _connect(client, alice) as alice_ws, _connect(client, bob) as bob_ws:
+        alice_ws.send_json({"type": "message", "conversation_id": conversation_id, "content": "salom"})
+
+        sent = _receive(alice_ws, "message_sent")
+        received = _receive(bob_ws, "message")
+
+    assert sent["conversation_id"] == received["conversation_id"] == conversation_id
+    assert received["id"] == sent["id"]
+    assert received["seq"] == sent["seq"] == 1
+    assert received["content"] == "salom"
+    assert received["sender_id"] == alice["id"]
+
+
+def test_read_without_message_id_marks_latest(client, chat):
+    alice, bob, conversation_id = chat
+    sent = _send_messages(client, bob, conversation_id, 2)
+
+    with _connect(client, alice) as websocket:
+        websocket.send_json({"type": "read", "conversation_id": conversation_id})
+        read = _receive(websocket, "read")
+
+    assert read["user_id"] == alice["id"]
+    assert read["last_read_message_id"] == sent[-1]["id"]
+    inbox = client.get("/api/chat/inbox", headers=alice["headers"]).json()
+    assert [item["unread_count"] for item in inbox if item["id"] == conversation_id] == [0]
+
+
+@pytest.mark.parametrize("message_id", ["abc", "5", 1.5, True, [1]])
+def test_read_with_invalid_message_id_keeps_connection(client, chat, message_id):
+    alice, _, conversation_id = chat
+    with _connect(client, alice) as websocket:
+        websocket.send_json({"type": "read", "conversation_id": conversation_id, "message_id": message_id})
+        error = _receive(websocket, "error")
+
+        websocket.send_json({"type": "ping"})
+        assert _receive(websocket, "pong") == {"type": "pong"}
+
+    assert error["conversation_id"] == conversation_id
+
+
+def test_frame_for_foreign_conversation_is_rejected(client, chat, register):
+    _, _, conversation_id = chat
+    stranger = register("stranger")
+    with _connect(client, stranger) as websocket:
+        websocket.send_json({"type": "message", "conversation_id": conversation_id, "content": "x"})
+        error = _receive(websocket, "error")
+
+    assert error["conversation_id"] == conversation_id
+
+
+def test_subscribe_replays_since_seq(client, chat):
+    alice, bob, conversation_id = chat
+    sent = _send_messages(client, bob, conversation_id, 3)
+
+    with _connect(client, alice) as websocket:
+        websocket.send_json({"type": "subscribe", "conversation_id": conversation_id, "since_seq": 1})
+        assert _receive(websocket, "subscribed")["conversation_id"] == conversation_id
+        replayed = [_receive(websocket, "message") for _ in range(2)]
+
+    assert [message["seq"] for message in replayed] == [2, 3]
+    assert [message["id"] for message in replayed] == [message["id"] for message in sent[1:]]
+
+
+def test_connect_with_sync_cursor_replays_missed_messages(client, chat):
+    alice, bob, conversation_id = chat
+    _send_messages(client, bob, conversation_id, 1)
+    cursor = client.get("/api/chat/sync", headers=alice["headers"]).json()["cursor"]
+    _send_messages(client, bob, conversation_id, 2)
+
+    with _connect(client, alice, since=cursor) as websocket:
+        replayed = [_receive(websocket, "message") for _ in range(2)]
+        websocket.send_json({"type": "ping"})
+        _receive(websocket, "pong")
+
+    assert [(message["conversation_id"], message["seq"]) for message in replayed] == [
+        (conversation_id, 2), (conversation_id, 3)
+    ]
+
+
+def test_invalid_sync_cursor_asks_for_resync(client, chat):
+    alice, _, _ = chat
+    with _connect(client, alice, since="not-a-cursor") as websocket:
+        assert _receive(websocket, "resync_required") == {"type": "resync_required"}
@@ -0,0 +1,69 @@
+import zlib
+import pytest
+from services import wire
+from services.wire import FLAG_DEFLATE, Frame, FrameTooLarge, WireFormat, decode
+
+
+def test_compressed_frame_round_trip():
+    compressed = WireFormat(compress=True)
+    message = {"type": "message", "conversation_id": 1, "content": "salom " * 1000}
+
+    data = Frame(message).encode(compressed)
+
+    assert data[0] == FLAG_DEFLATE
+    assert decode(data, compressed) == message
+
+
+def test_decompression_is_bounded(monkeypatch):
+    monkeypatch.setattr(wire, "WS_MAX_FRAME_BYTES", 64 * 1024)
+    # ~10 KB siqilgan tana 10 MB ga ochiladi
+    bomb = bytes((FLAG_DEFLATE,)) + zlib.compress(b" " * (10 * 1024 * 1024), 9)
+
+    with pytest.raises(FrameTooLarge):
+        decode(bomb, WireFormat(compress=True))
+
+
+def test_truncated_compressed_frame_is_rejected():
+    data = bytes((FLAG_DEFLATE,)) + zlib.compress(b'{"type":"ping"}')[:-4]
+
+    with pytest.raises(ValueError):
+        decode(data, WireFormat(compress=True))
+
+
+@pytest.mark.parametrize("data, codec", [
+    ("not json", wire.JSON),
+    ("[1,2]", wire.JSON),
+    ('"text"', wire.JSON),
+    (bytes((wire.FLAG_RAW,)) + b"\xc1", wire.MSGPACK),
+    (bytes((wire.FLAG_RAW,)) + b"\x92\x01", wire.MSGPACK),
+    (bytes((7,)) + b"{}", wire.MSGPACK),
+])
+def test_malformed_frame_is_rejected(data, codec):
+    if codec == wire.MSGPACK and wire.msgpack is None:
+        pytest.skip("msgpack o'rnatilmagan")
+
+    with pytest.raises(wire._DECODE_ERRORS):
+        decode(data, WireFormat(codec))
+
+
+def _receive_close(websocket) -> int:
+    while True:
+        message = websocket.receive()
+        if message["type"] == "websocket.close":
+            return message["code"]
+
+
+def test_oversized_frame_closes_with_1009(client, register):
+    user = register("wire")
+    bomb = bytes((FLAG_DEFLATE,)) + zlib.compress(b" " * (4 * wire.WS_MAX_FRAME_BYTES), 9)
+    with client.websocket_connect(f"/ws?token={user['token']}&compress=1") as websocket:
+        websocket.send_bytes(bomb)
+        assert _receive_close(websocket) == wire.CLOSE_TOO_BIG
+
+
+@pytest.mark.parametrize("text", ["not json", "[1,2]", "null"])
+def test_malformed_text_frame_closes_with_1007(client, register, text):
+    user = register("wire")
+    with client.websocket_connect(f"/ws?token={user['token']}") as websocket:
+        websocket.send_text(text)
+        assert _receive_close(websocket) == wire.CLOSE_INVALID_PAYLOAD